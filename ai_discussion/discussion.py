@@ -11,13 +11,17 @@ from langchain_anthropic import ChatAnthropic
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, AIMessage
 
-from PIL import Image
 import io
 import base64
+import sys
 
 # .envファイルを読み込む
 load_dotenv(dotenv_path=Path(__file__).with_name(".env"))
 
+# 画像の読み込み・縮小はリポジトリ共通の utils.image_ingest を使う（Pillow のみに依存）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils.image_ingest import load_image  # noqa: E402
+
 # ============================================================
 # 1. 定数・設定の一元管理 (プロンプトを構造化・短文化)
 # ============================================================
@@ -378,17 +382,13 @@ with st.sidebar:
     # 画像をリサイズしてBase64に変換
     encoded_image = ""
     if uploaded_file:
-        # 一旦、画像を開く
-        img = Image.open(uploaded_file)
-        
-        # --- リサイズロジック (最大1000px) ---
-        max_size = (1000, 1000)
-        img.thumbnail(max_size, Image.Resampling.LANCZOS)
+        # 画像を開いてリサイズ (最大1000px)。JPEGは縮小デコード、EXIF回転も補正
+        img, img_format = load_image(uploaded_file, max_size=(1000, 1000))
         
         # バイトデータに書き出し
         buffered = io.BytesIO()
         # 元の形式を維持。不明な場合はJPEG
-        img_format = img.format if img.format else "JPEG"
+        img_format = img_format or "JPEG"
         img.save(buffered, format=img_format)
         img_bytes = buffered.getvalue()
         
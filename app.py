@@ -69,6 +69,8 @@ flask_app.config["BLOG_CATEGORIES_TABLE"] = dynamodb.Table(os.getenv("BLOG_CATEG
 flask_app.config["STL_POSTS_TABLE"] = dynamodb.Table(os.getenv("STL_POSTS_TABLE_NAME", "hoero-stl-posts"))
 flask_app.config["STL_COMMENTS_TABLE"] = dynamodb.Table(os.getenv("STL_COMMENTS_TABLE_NAME", "hoero-stl-comments"))
 flask_app.config["STL_LIKES_TABLE"] = dynamodb.Table(os.getenv("STL_LIKES_TABLE_NAME", "hoero-stl-likes"))
+flask_app.config["STL_MESH_CACHE_TABLE"] = dynamodb.Table(os.getenv("STL_MESH_CACHE_TABLE_NAME", "hoero-stl-mesh-cache"))
+flask_app.config["VIDEO_JOBS_TABLE"] = dynamodb.Table(os.getenv("VIDEO_JOBS_TABLE_NAME", "hoero-video-jobs"))
 flask_app.config["PRESCRIPTIONS_TABLE"] = dynamodb.Table(os.getenv("PRESCRIPTIONS_TABLE_NAME", "hoero-prescriptions"))
 flask_app.config["LAB_PRESCRIPTIONS_TABLE"] = dynamodb.Table(os.getenv("LAB_PRESCRIPTIONS_TABLE_NAME", "hoero-lab-prescriptions"))
 
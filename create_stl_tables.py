@@ -15,28 +15,84 @@ tables = [
     {
         'TableName': 'hoero-stl-posts',
         'KeySchema': [{'AttributeName': 'post_id', 'KeyType': 'HASH'}],
-        'AttributeDefinitions': [{'AttributeName': 'post_id', 'AttributeType': 'S'}],
+        'AttributeDefinitions': [
+            {'AttributeName': 'post_id', 'AttributeType': 'S'},
+            {'AttributeName': 'feed_pk', 'AttributeType': 'S'},
+            {'AttributeName': 'created_at_ts', 'AttributeType': 'N'},
+        ],
+        # 新着順（トップページ・サイドバー・掲示板一覧）用
+        'GlobalSecondaryIndexes': [
+            {
+                'IndexName': 'feed_pk-created_at_ts-index',
+                'KeySchema': [
+                    {'AttributeName': 'feed_pk', 'KeyType': 'HASH'},
+                    {'AttributeName': 'created_at_ts', 'KeyType': 'RANGE'},
+                ],
+                'Projection': {'ProjectionType': 'ALL'},
+            },
+        ],
     },
     {
         'TableName': 'hoero-stl-comments',
         'KeySchema': [{'AttributeName': 'comment_id', 'KeyType': 'HASH'}],
-        'AttributeDefinitions': [{'AttributeName': 'comment_id', 'AttributeType': 'S'}],
+        'AttributeDefinitions': [
+            {'AttributeName': 'comment_id', 'AttributeType': 'S'},
+            {'AttributeName': 'post_id', 'AttributeType': 'S'},
+            {'AttributeName': 'created_at_ts', 'AttributeType': 'N'},
+        ],
+        # 投稿ごとのコメント一覧用
+        'GlobalSecondaryIndexes': [
+            {
+                'IndexName': 'post_id-created_at_ts-index',
+                'KeySchema': [
+                    {'AttributeName': 'post_id', 'KeyType': 'HASH'},
+                    {'AttributeName': 'created_at_ts', 'KeyType': 'RANGE'},
+                ],
+                'Projection': {'ProjectionType': 'ALL'},
+            },
+        ],
     },
     {
         'TableName': 'hoero-stl-likes',
         'KeySchema': [{'AttributeName': 'like_id', 'KeyType': 'HASH'}],
-        'AttributeDefinitions': [{'AttributeName': 'like_id', 'AttributeType': 'S'}],
+        'AttributeDefinitions': [
+            {'AttributeName': 'like_id', 'AttributeType': 'S'},
+            {'AttributeName': 'post_id', 'AttributeType': 'S'},
+            {'AttributeName': 'user_id', 'AttributeType': 'S'},
+        ],
+        # 投稿ごとのいいね一覧・ユーザーのいいね有無判定用
+        'GlobalSecondaryIndexes': [
+            {
+                'IndexName': 'post_id-user_id-index',
+                'KeySchema': [
+                    {'AttributeName': 'post_id', 'KeyType': 'HASH'},
+                    {'AttributeName': 'user_id', 'KeyType': 'RANGE'},
+                ],
+                'Projection': {'ProjectionType': 'ALL'},
+            },
+        ],
+    },
+    {
+        # STL → GLB 変換結果のキャッシュ（STL の内容ハッシュ → GLB キー・参照数）
+        'TableName': 'hoero-stl-mesh-cache',
+        'KeySchema': [{'AttributeName': 'content_hash', 'KeyType': 'HASH'}],
+        'AttributeDefinitions': [
+            {'AttributeName': 'content_hash', 'AttributeType': 'S'},
+        ],
     },
 ]
 
 for table in tables:
     try:
-        response = dynamodb.create_table(
+        create_args = dict(
             TableName=table['TableName'],
             KeySchema=table['KeySchema'],
             AttributeDefinitions=table['AttributeDefinitions'],
             BillingMode='PAY_PER_REQUEST'
         )
+        if table.get('GlobalSecondaryIndexes'):
+            create_args['GlobalSecondaryIndexes'] = table['GlobalSecondaryIndexes']
+        response = dynamodb.create_table(**create_args)
         print(f"テーブル作成成功: {table['TableName']}")
     except dynamodb.exceptions.ResourceInUseException:
         print(f"テーブル既存: {table['TableName']}")
@@ -1,4 +1,5 @@
 import os
+import time
 from dotenv import load_dotenv
 import boto3
 
@@ -145,24 +146,136 @@ def ensure_dental_news(dynamodb):
     }
     ensure_table(dynamodb, spec)
 
+PRESCRIPTION_ATTRIBUTES = [
+    {"AttributeName": "prescription_id",  "AttributeType": "S"},
+    {"AttributeName": "user_id",          "AttributeType": "S"},
+    {"AttributeName": "clinic_id",        "AttributeType": "S"},
+    {"AttributeName": "created_at",       "AttributeType": "S"},
+    {"AttributeName": "admin_bucket",     "AttributeType": "S"},
+    {"AttributeName": "admin_created_at", "AttributeType": "S"},
+]
+PRESCRIPTION_GSIS = [
+    {
+        "IndexName": "user_id-created_at-index",
+        "KeySchema": [
+            {"AttributeName": "user_id",    "KeyType": "HASH"},
+            {"AttributeName": "created_at", "KeyType": "RANGE"},
+        ],
+        "Projection": {"ProjectionType": "ALL"}
+    },
+    {
+        # 医院詳細（管理者）で医院の指示書を引く。clinic_id の無い指示書は載らない
+        "IndexName": "clinic_id-created_at-index",
+        "KeySchema": [
+            {"AttributeName": "clinic_id",  "KeyType": "HASH"},
+            {"AttributeName": "created_at", "KeyType": "RANGE"},
+        ],
+        "Projection": {"ProjectionType": "ALL"}
+    },
+    {
+        # 管理者一覧（utils/prescription_dynamo.py）。一覧に出す指示書だけが持つ属性なので疎な索引になる
+        "IndexName": "admin_bucket-admin_created_at-index",
+        "KeySchema": [
+            {"AttributeName": "admin_bucket",     "KeyType": "HASH"},
+            {"AttributeName": "admin_created_at", "KeyType": "RANGE"},
+        ],
+        "Projection": {"ProjectionType": "ALL"}
+    },
+]
+
 def ensure_prescriptions(dynamodb):
     spec = {
         "TableName": "hoero-prescriptions",
-        "AttributeDefinitions": [
-            {"AttributeName": "prescription_id", "AttributeType": "S"},
-            {"AttributeName": "user_id",          "AttributeType": "S"},
-            {"AttributeName": "created_at",        "AttributeType": "S"},
+        "AttributeDefinitions": PRESCRIPTION_ATTRIBUTES,
+        "KeySchema": [
+            {"AttributeName": "prescription_id", "KeyType": "HASH"}
         ],
+        "BillingMode": "PAY_PER_REQUEST",
+        "GlobalSecondaryIndexes": PRESCRIPTION_GSIS,
+    }
+    ensure_table(dynamodb, spec)
+
+def ensure_lab_prescriptions(dynamodb):
+    """ラボ（ReArch Design）用の指示書テーブル。GSI は通常テーブルと同じ"""
+    spec = {
+        "TableName": "hoero-lab-prescriptions",
+        "AttributeDefinitions": PRESCRIPTION_ATTRIBUTES,
         "KeySchema": [
             {"AttributeName": "prescription_id", "KeyType": "HASH"}
         ],
         "BillingMode": "PAY_PER_REQUEST",
+        "GlobalSecondaryIndexes": PRESCRIPTION_GSIS,
+    }
+    ensure_table(dynamodb, spec)
+
+def ensure_stl_posts(dynamodb):
+    spec = {
+        "TableName": "hoero-stl-posts",
+        "AttributeDefinitions": [
+            {"AttributeName": "post_id",       "AttributeType": "S"},
+            {"AttributeName": "feed_pk",       "AttributeType": "S"},
+            {"AttributeName": "created_at_ts", "AttributeType": "N"},
+        ],
+        "KeySchema": [
+            {"AttributeName": "post_id", "KeyType": "HASH"}
+        ],
+        "BillingMode": "PAY_PER_REQUEST",
+        "GlobalSecondaryIndexes": [
+            {
+                "IndexName": "feed_pk-created_at_ts-index",
+                "KeySchema": [
+                    {"AttributeName": "feed_pk",       "KeyType": "HASH"},
+                    {"AttributeName": "created_at_ts", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"}
+            }
+        ]
+    }
+    ensure_table(dynamodb, spec)
+
+def ensure_stl_comments(dynamodb):
+    spec = {
+        "TableName": "hoero-stl-comments",
+        "AttributeDefinitions": [
+            {"AttributeName": "comment_id",    "AttributeType": "S"},
+            {"AttributeName": "post_id",       "AttributeType": "S"},
+            {"AttributeName": "created_at_ts", "AttributeType": "N"},
+        ],
+        "KeySchema": [
+            {"AttributeName": "comment_id", "KeyType": "HASH"}
+        ],
+        "BillingMode": "PAY_PER_REQUEST",
+        "GlobalSecondaryIndexes": [
+            {
+                "IndexName": "post_id-created_at_ts-index",
+                "KeySchema": [
+                    {"AttributeName": "post_id",       "KeyType": "HASH"},
+                    {"AttributeName": "created_at_ts", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"}
+            }
+        ]
+    }
+    ensure_table(dynamodb, spec)
+
+def ensure_stl_likes(dynamodb):
+    spec = {
+        "TableName": "hoero-stl-likes",
+        "AttributeDefinitions": [
+            {"AttributeName": "like_id", "AttributeType": "S"},
+            {"AttributeName": "post_id", "AttributeType": "S"},
+            {"AttributeName": "user_id", "AttributeType": "S"},
+        ],
+        "KeySchema": [
+            {"AttributeName": "like_id", "KeyType": "HASH"}
+        ],
+        "BillingMode": "PAY_PER_REQUEST",
         "GlobalSecondaryIndexes": [
             {
-                "IndexName": "user_id-created_at-index",
+                "IndexName": "post_id-user_id-index",
                 "KeySchema": [
-                    {"AttributeName": "user_id",    "KeyType": "HASH"},
-                    {"AttributeName": "created_at", "KeyType": "RANGE"},
+                    {"AttributeName": "post_id", "KeyType": "HASH"},
+                    {"AttributeName": "user_id", "KeyType": "RANGE"},
                 ],
                 "Projection": {"ProjectionType": "ALL"}
             }
@@ -170,6 +283,28 @@ def ensure_prescriptions(dynamodb):
     }
     ensure_table(dynamodb, spec)
 
+def ensure_video_jobs(dynamodb):
+    """動画変換ジョブ（utils/video_jobs.py）。expires_at を TTL にして古いジョブを自動削除する"""
+    spec = {
+        "TableName": "hoero-video-jobs",
+        "AttributeDefinitions": [
+            {"AttributeName": "job_id", "AttributeType": "S"},
+        ],
+        "KeySchema": [
+            {"AttributeName": "job_id", "KeyType": "HASH"}
+        ],
+        "BillingMode": "PAY_PER_REQUEST",
+    }
+    ensure_table(dynamodb, spec)
+    client = dynamodb.meta.client
+    ttl = client.describe_time_to_live(TableName=spec["TableName"])["TimeToLiveDescription"]
+    if ttl.get("TimeToLiveStatus") not in ("ENABLED", "ENABLING"):
+        client.update_time_to_live(
+            TableName=spec["TableName"],
+            TimeToLiveSpecification={"Enabled": True, "AttributeName": "expires_at"},
+        )
+        print(f"[TTL] enabled expires_at on {spec['TableName']}")
+
 
 if __name__ == "__main__":
     dynamodb = boto3.resource("dynamodb", region_name=REGION)
@@ -177,3 +312,8 @@ if __name__ == "__main__":
     ensure_hoero_users(dynamodb)
     ensure_dental_news(dynamodb)
     ensure_prescriptions(dynamodb)
+    ensure_lab_prescriptions(dynamodb)
+    ensure_stl_posts(dynamodb)
+    ensure_stl_comments(dynamodb)
+    ensure_stl_likes(dynamodb)
+    ensure_video_jobs(dynamodb)
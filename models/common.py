@@ -1,3 +1,6 @@
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 from decimal import Decimal
 from zoneinfo import ZoneInfo
@@ -66,25 +69,22 @@ class AuthUser(UserMixin):
         return bool(self.administrator)
 
 
-@login_manager.user_loader
-def load_user(user_id: str):
-    """
-    セッションから user_id (= email) を受け取って、
-    DynamoDB hoero-users からユーザーを復元する。
-    """
-    users_table = current_app.config["HOERO_USERS_TABLE"]
+# load_user 用の短TTLキャッシュ（ワーカープロセス単位）
+AUTH_USER_TTL_SECONDS = 60
+AUTH_USER_CACHE_MAX = 1024
+
+_auth_user_lock = threading.Lock()
+_auth_user_cache = OrderedDict()  # user_id -> (expires_at, AuthUser の引数 dict)
+_auth_user_stats = {"cache_hits": 0, "dynamodb_loads": 0}
 
-    res = users_table.get_item(Key={"user_id": user_id})
-    item = res.get("Item")
-    if not item:
-        return None
 
+def _auth_user_kwargs(item):
     admin_raw = item.get("administrator", 0)
     if isinstance(admin_raw, Decimal):
         admin_raw = int(admin_raw)
     is_admin = bool(admin_raw)
 
-    return AuthUser(
+    return dict(
         user_id=item["user_id"],
         email=item.get("email"),
         display_name=item.get("display_name"),
@@ -103,6 +103,60 @@ def load_user(user_id: str):
     )
 
 
+def invalidate_user_cache(user_id):
+    """hoero-users を書き換えたら呼ぶ（ログインユーザー・表示用プロフィール両方を破棄）"""
+    from utils.user_cache import invalidate_user_profile
+
+    with _auth_user_lock:
+        _auth_user_cache.pop(str(user_id or ""), None)
+    invalidate_user_profile(user_id)
+
+
+def auth_user_loader_stats():
+    with _auth_user_lock:
+        stats = dict(_auth_user_stats)
+        stats["size"] = len(_auth_user_cache)
+    return stats
+
+
+@login_manager.user_loader
+def load_user(user_id: str):
+    """
+    セッションから user_id (= email) を受け取って、
+    DynamoDB hoero-users からユーザーを復元する。
+    AUTH_USER_TTL_SECONDS の間はプロセス内キャッシュから復元する。
+    """
+    now = time.time()
+    with _auth_user_lock:
+        entry = _auth_user_cache.get(user_id)
+        if entry and entry[0] >= now:
+            _auth_user_cache.move_to_end(user_id)
+            _auth_user_stats["cache_hits"] += 1
+            kwargs = entry[1]
+        else:
+            kwargs = None
+
+    if kwargs is None:
+        users_table = current_app.config["HOERO_USERS_TABLE"]
+
+        res = users_table.get_item(Key={"user_id": user_id})
+        with _auth_user_lock:
+            _auth_user_stats["dynamodb_loads"] += 1
+        item = res.get("Item")
+        if not item:
+            return None
+
+        kwargs = _auth_user_kwargs(item)
+        with _auth_user_lock:
+            _auth_user_cache[user_id] = (now + AUTH_USER_TTL_SECONDS, kwargs)
+            _auth_user_cache.move_to_end(user_id)
+            while len(_auth_user_cache) > AUTH_USER_CACHE_MAX:
+                _auth_user_cache.popitem(last=False)
+
+    # リクエスト側で current_user.dentists などを書き換えてもキャッシュが汚れないよう毎回作り直す
+    return AuthUser(**{**kwargs, "dentists": list(kwargs["dentists"])})
+
+
 # =======================
 # RDS (MySQL) 用のブログ関連モデル
 # =======================
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+hoero-prescriptions / hoero-lab-prescriptions の既存アイテムに admin_bucket / admin_created_at を付与し、
+Meziro-Counters の admin_prescriptions（件数・一番古い年月）を数え直すバックフィル。
+管理者用の指示書一覧の GSI (admin_bucket-admin_created_at-index) に古い指示書を載せるために使う。
+件数がずれたと思ったときに何度実行してもよい。
+created_at が無い・読めない指示書は ADMIN#000000（一覧の最後）に入れ、ID を [UNDATED] として表示する。
+
+    python scripts/backfill_prescription_admin_index.py            # 実行
+    python scripts/backfill_prescription_admin_index.py --dry-run  # 件数確認のみ
+"""
+import os
+import sys
+
+import boto3
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.prescription_dynamo import (  # noqa: E402
+    ADMIN_BUCKET_PREFIX,
+    ADMIN_COUNTER_NAME,
+    ADMIN_UNDATED_MONTH,
+    admin_index_attrs,
+)
+
+load_dotenv()
+
+AWS_REGION = os.getenv("AWS_REGION", "ap-northeast-1")
+TABLES = (
+    (os.getenv("PRESCRIPTIONS_TABLE_NAME", "hoero-prescriptions"), False),
+    (os.getenv("LAB_PRESCRIPTIONS_TABLE_NAME", "hoero-lab-prescriptions"), True),
+)
+COUNTER_TABLE_NAME = "Meziro-Counters"  # utils.common_utils.counter_table と同じ
+
+
+def backfill_table(table, lab_table, dry_run):
+    """(一覧に載る件数, 一番古い admin_bucket, 更新件数, 年月が読めない件数)"""
+    listed = updated = undated = 0
+    oldest = None
+    scan_kwargs = {
+        "ProjectionExpression": "prescription_id, #src, created_at, admin_bucket, admin_created_at",
+        "ExpressionAttributeNames": {"#src": "source"},
+    }
+    while True:
+        resp = table.scan(**scan_kwargs)
+        for item in resp.get("Items", []):
+            attrs = admin_index_attrs(item, lab_table)
+            if attrs:
+                listed += 1
+                if attrs["admin_bucket"] == ADMIN_BUCKET_PREFIX + ADMIN_UNDATED_MONTH:
+                    undated += 1
+                    print(f"[UNDATED] {table.name} {item['prescription_id']} created_at={item.get('created_at')!r}")
+                else:
+                    oldest = min(oldest or attrs["admin_bucket"], attrs["admin_bucket"])
+            current = {k: item[k] for k in ("admin_bucket", "admin_created_at") if k in item}
+            if current == attrs:
+                continue
+
+            print(f"[BACKFILL] {table.name} {item['prescription_id']} {attrs or '(一覧から外す)'}")
+            if not dry_run:
+                if attrs:
+                    table.update_item(
+                        Key={"prescription_id": item["prescription_id"]},
+                        UpdateExpression="SET admin_bucket = :b, admin_created_at = :c",
+                        ExpressionAttributeValues={":b": attrs["admin_bucket"], ":c": attrs["admin_created_at"]},
+                    )
+                else:
+                    table.update_item(
+                        Key={"prescription_id": item["prescription_id"]},
+                        UpdateExpression="REMOVE admin_bucket, admin_created_at",
+                    )
+            updated += 1
+
+        last = resp.get("LastEvaluatedKey")
+        if not last:
+            break
+        scan_kwargs["ExclusiveStartKey"] = last
+    return listed, oldest, updated, undated
+
+
+def main(dry_run=False):
+    dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
+
+    total = 0
+    oldest = None
+    for table_name, lab_table in TABLES:
+        listed, table_oldest, updated, undated = backfill_table(dynamodb.Table(table_name), lab_table, dry_run)
+        print(f"{table_name}: listed={listed} updated={updated} oldest={table_oldest} undated={undated}")
+        total += listed
+        if table_oldest:
+            oldest = min(oldest or table_oldest, table_oldest)
+
+    print(f"完了: total={total} oldest={oldest} dry_run={dry_run}")
+    if not dry_run:
+        item = {"counter_name": ADMIN_COUNTER_NAME, "counter_value": total}
+        if oldest:
+            item["oldest_bucket"] = oldest
+        dynamodb.Table(COUNTER_TABLE_NAME).put_item(Item=item)
+
+
+if __name__ == "__main__":
+    main(dry_run="--dry-run" in sys.argv)
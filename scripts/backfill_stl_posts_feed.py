@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+hoero-stl-posts の既存アイテムに feed_pk / created_at_ts を付与する一回きりのバックフィル。
+新着GSI (feed_pk-created_at_ts-index) に古い投稿を載せるために使う。
+
+    python scripts/backfill_stl_posts_feed.py            # 実行
+    python scripts/backfill_stl_posts_feed.py --dry-run  # 件数確認のみ
+"""
+import os
+import sys
+import datetime
+
+import boto3
+from dotenv import load_dotenv
+
+load_dotenv()
+
+AWS_REGION = os.getenv("AWS_REGION", "ap-northeast-1")
+TABLE_NAME = os.getenv("STL_POSTS_TABLE_NAME", "hoero-stl-posts")
+FEED_PK = "STL_POST"  # utils.stl_dynamo.RECENT_FEED_PK と同じ値
+
+
+def _created_at_ts(item):
+    ts = item.get("created_at_ts")
+    if ts is not None:
+        return int(ts)
+    ca = str(item.get("created_at") or "")
+    try:
+        dt = datetime.datetime.fromisoformat(ca.replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            # create_stl_post は utcnow().isoformat() で保存している
+            dt = dt.replace(tzinfo=datetime.timezone.utc)
+        return int(dt.timestamp())
+    except ValueError:
+        return 0
+
+
+def main(dry_run=False):
+    table = boto3.resource("dynamodb", region_name=AWS_REGION).Table(TABLE_NAME)
+
+    scanned = updated = 0
+    scan_kwargs = {"ProjectionExpression": "post_id, feed_pk, created_at, created_at_ts"}
+    while True:
+        resp = table.scan(**scan_kwargs)
+        for item in resp.get("Items", []):
+            scanned += 1
+            if item.get("feed_pk") == FEED_PK and item.get("created_at_ts") is not None:
+                continue
+
+            ts = _created_at_ts(item)
+            print(f"[BACKFILL] {item['post_id']} created_at_ts={ts}")
+            if not dry_run:
+                table.update_item(
+                    Key={"post_id": item["post_id"]},
+                    UpdateExpression="SET feed_pk = :pk, created_at_ts = if_not_exists(created_at_ts, :ts)",
+                    ExpressionAttributeValues={":pk": FEED_PK, ":ts": ts},
+                )
+            updated += 1
+
+        last = resp.get("LastEvaluatedKey")
+        if not last:
+            break
+        scan_kwargs["ExclusiveStartKey"] = last
+
+    print(f"完了: scanned={scanned} updated={updated} dry_run={dry_run}")
+
+
+if __name__ == "__main__":
+    main(dry_run="--dry-run" in sys.argv)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+主要色抽出（utils.common_utils.extract_main_colors）のベンチマーク。
+
+従来方式（全画素で KMeans）と高速方式（間引いた画素で KMeans → 全画素を割り当てて bincount）を比較する。
+品質は次の3つで見る。
+  - MSE       : 全画素を代表色に置き換えたときの二乗誤差の平均（小さいほど良い。クラスタリング本来の指標）
+  - max ΔRGB  : 対応する代表色どうしの距離の最大値
+  - max Δ%    : 対応する代表色の割合（%）の差の最大値
+KMeans は初期値によって局所解が変わるため、従来方式どうしでも seed を変えると ΔRGB は大きくなり得る。
+MSE が同程度であれば同じ品質とみなしてよい。
+
+    python scripts/bench_color_extraction.py                       # 合成画像 1.7 / 12 / 24 MP
+    python scripts/bench_color_extraction.py --images a.jpg b.png  # 手元の写真で比較
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.common_utils import _nearest_color_labels, extract_main_colors  # noqa: E402
+
+SYNTHETIC_SIZES = ((1125, 1500), (3000, 4000), (4000, 6000))  # /colors の保存幅 1500px、12MP、24MP
+
+
+def synthetic_photo(height, width, seed=0):
+    """なだらかなグラデーション + 色のかたまり + ノイズの擬似写真（RGB uint8）"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32) / max(height, width)
+    img = np.stack([
+        np.sin(xx * 6) * 80 + 120,
+        np.cos(yy * 5) * 70 + 110,
+        np.sin((xx + yy) * 4) * 60 + 100,
+    ], axis=-1)
+    for _ in range(6):
+        cx, cy, r = rng.random(), rng.random(), rng.random() * 0.3 + 0.05
+        img[((xx - cx) ** 2 + (yy - cy) ** 2) < r * r] = rng.integers(0, 255, 3)
+    img += rng.normal(0, 12, img.shape).astype(np.float32)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def load_image(path):
+    from PIL import Image
+
+    with Image.open(path) as im:
+        return np.asarray(im.convert("RGB"))
+
+
+def quality(pixels, result, reference):
+    centers = np.array([rgb for rgb, _, _ in result], dtype=np.float32)
+    labels = _nearest_color_labels(pixels, centers)
+    mse = float(((pixels.astype(np.float32) - centers[labels]) ** 2).sum(axis=1).mean())
+
+    ref_centers = np.array([rgb for rgb, _, _ in reference], dtype=np.float32)
+    dist = np.linalg.norm(centers[:, None] - ref_centers[None], axis=2)
+    rows, cols = linear_sum_assignment(dist)
+    pct = np.array([p for _, _, p in result])
+    ref_pct = np.array([p for _, _, p in reference])
+    return mse, float(dist[rows, cols].max()), float(np.abs(pct[rows] - ref_pct[cols]).max())
+
+
+def run(name, pixels):
+    print(f"{name}: {len(pixels) / 1e6:.1f} MP")
+    start = time.perf_counter()
+    legacy = extract_main_colors(pixels, sample_size=None)
+    legacy_s = time.perf_counter() - start
+    legacy_mse, _, _ = quality(pixels, legacy, legacy)
+    print(f"{'legacy':>10}: {legacy_s:7.2f}s  MSE {legacy_mse:8.1f}")
+
+    start = time.perf_counter()
+    fast = extract_main_colors(pixels)
+    fast_s = time.perf_counter() - start
+    mse, d_rgb, d_pct = quality(pixels, fast, legacy)
+    print(f"{'fast':>10}: {fast_s:7.2f}s  MSE {mse:8.1f}  max ΔRGB {d_rgb:6.1f}  max Δ% {d_pct:5.2f}"
+          f"  ({legacy_s / fast_s:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", nargs="*", default=None)
+    args = parser.parse_args()
+
+    if args.images:
+        for path in args.images:
+            run(os.path.basename(path), load_image(path).reshape(-1, 3))
+    else:
+        for seed, (height, width) in enumerate(SYNTHETIC_SIZES):
+            run(f"synthetic {width}x{height}", synthetic_photo(height, width, seed).reshape(-1, 3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+アップロード画像の読み込み・縮小のベンチマーク（合成 JPEG）。
+
+従来方式（Image.open → exif_transpose → フル解像度から LANCZOS で縮小）と
+utils.image_ingest.load_image（draft による縮小デコード → 回転 → LANCZOS）を
+それぞれ別プロセスで実行し、処理時間・ピークRSS・従来方式の出力との PSNR を比較する。
+入力は EXIF Orientation=6（縦持ちで撮ったスマホ写真と同じ）を付けた JPEG。
+
+    python scripts/bench_image_ingest.py                     # 12 / 24 / 48 MP、横幅 2000px
+    python scripts/bench_image_ingest.py --max-width 1500    # /colors と同じ幅
+    python scripts/bench_image_ingest.py --images a.jpg      # 手元の写真で比較
+"""
+import argparse
+import io
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing import get_context
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+SYNTHETIC_SIZES = ((4000, 3000), (6000, 4000), (8000, 6000))  # 12 / 24 / 48 MP（ファイル上の横x縦）
+REPEAT = 3
+
+
+def make_photo(path, width, height, seed=0):
+    """グラデーション + 細かい模様 + ノイズの擬似写真を、回転指定付きの JPEG（品質 92）で保存する"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    # 48MP を一度に float で作るとベンチ自体のメモリが大きいので、帯ごとに作る
+    for top in range(0, height, 500):
+        yy, xx = np.mgrid[top:min(top + 500, height), 0:width].astype(np.float32)
+        yy /= height
+        xx /= width
+        band = np.stack([
+            np.sin(xx * 9) * 70 + 120 + np.sin(xx * 900) * 20,
+            np.cos(yy * 7) * 60 + 110 + np.sin(yy * 700) * 20,
+            np.sin((xx + yy) * 5) * 50 + 100,
+        ], axis=-1)
+        band += rng.normal(0, 6, band.shape).astype(np.float32)
+        rows.append(np.clip(band, 0, 255).astype(np.uint8))
+    img = Image.fromarray(np.concatenate(rows))
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    img.save(path, "JPEG", quality=92, exif=exif)
+
+
+def legacy_load(path, max_width):
+    from PIL import ImageOps
+
+    raw = Image.open(path)
+    img = ImageOps.exif_transpose(raw) or raw
+    if img.width > max_width:
+        new_h = int(img.height * max_width / img.width)
+        img = img.resize((max_width, new_h), Image.Resampling.LANCZOS)
+    return img
+
+
+def peak_rss_mb():
+    """
+    このプロセスのピークRSS（MB）。ru_maxrss は fork → exec をまたいで親の値を引き継ぐので、
+    合成画像を作った親より小さい値が見えなくなる。exec でリセットされる VmHWM を優先する。
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux は KB 単位
+
+
+def _run(mode, path, max_width, queue):
+    from utils.image_ingest import load_image
+
+    with open(path, "rb") as f:
+        data = f.read()  # アップロードと同じくメモリ上のバイト列から読む
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        if mode == "legacy":
+            img = legacy_load(io.BytesIO(data), max_width)
+        else:
+            img, _ = load_image(data, max_width=max_width)
+        times.append(time.perf_counter() - start)
+    peak_mb = peak_rss_mb()
+    queue.put((mode, min(times), peak_mb, img.size, np.asarray(img.convert("RGB"))))
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+def run(name, path, max_width, ctx):
+    print(f"{name}: {os.path.getsize(path) / 1e6:.1f} MB")
+    results = {}
+    for mode in ("legacy", "draft"):
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run, args=(mode, path, max_width, queue))
+        proc.start()
+        results[mode] = queue.get()
+        proc.join()
+
+    legacy_s = results["legacy"][1]
+    for mode, elapsed, peak_mb, size, pixels in results.values():
+        line = f"{mode:>10}: {elapsed:7.3f}s  peak RSS {peak_mb:7.1f} MB  {size[0]}x{size[1]}"
+        if mode != "legacy":
+            line += f"  PSNR {psnr(pixels, results['legacy'][4]):5.1f} dB  ({legacy_s / elapsed:.1f}x)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-width", type=int, default=2000)
+    parser.add_argument("--images", nargs="*", default=None)
+    args = parser.parse_args()
+
+    ctx = get_context("spawn")
+    if args.images:
+        for path in args.images:
+            run(os.path.basename(path), path, args.max_width, ctx)
+        return
+
+    work = tempfile.mkdtemp(prefix="bench_image_")
+    try:
+        for seed, (width, height) in enumerate(SYNTHETIC_SIZES):
+            path = os.path.join(work, f"photo_{width}x{height}.jpg")
+            make_photo(path, width, height, seed)
+            run(f"synthetic {width}x{height} ({width * height / 1e6:.0f} MP, orientation 6)",
+                path, args.max_width, ctx)
+            os.remove(path)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+meziro_upload（ラボ注文）の S3 アップロードのベンチマーク。
+
+旧方式（head_object で空きキーを探す get_unique_filename + upload_fileobj を1ファイルずつ直列）と
+現行方式（受付番号 + 連番の確定キーで upload_files_concurrently）を比較する。
+S3 の代わりに moto のローカルサーバー、または --endpoint-url で MinIO などを使う。
+ローカルだと往復遅延がほぼ 0 なので、--latency-ms で1リクエストごとの遅延を足して実環境に近づける。
+
+    pip install "moto[server]"
+    python scripts/bench_s3_uploads.py                      # 300 スライス x 512KB, 遅延 20ms
+    python scripts/bench_s3_uploads.py --latency-ms 0
+    python scripts/bench_s3_uploads.py --endpoint-url http://localhost:9000   # MinIO
+"""
+import argparse
+import io
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.s3_upload import make_s3_client, upload_files_concurrently  # noqa: E402
+
+BUCKET = "bench-meziro"
+
+
+def _unique_key(s3, key):
+    """旧 views.main.get_unique_filename と同じ head_object プローブ"""
+    base, ext = os.path.splitext(key)
+    counter = 1
+    new_key = key
+    while True:
+        try:
+            s3.head_object(Bucket=BUCKET, Key=new_key)
+            new_key = f"{base}_{counter}{ext}"
+            counter += 1
+        except Exception:
+            return new_key
+
+
+def _series(n, slice_kb):
+    body = b"\0" * 128 + b"DICM" + os.urandom(slice_kb * 1024 - 132)
+    return [(f"IM-0001-{i + 1:04d}.dcm", body) for i in range(n)]
+
+
+def run_serial(s3, series, prefix):
+    start = time.perf_counter()
+    for index, (name, body) in enumerate(series, start=1):
+        key = _unique_key(s3, f"{prefix}{index:03d}_{name}")
+        s3.upload_fileobj(io.BytesIO(body), BUCKET, key,
+                          ExtraArgs={"ContentType": "application/octet-stream"})
+    return time.perf_counter() - start, 0
+
+
+def run_concurrent(s3, series, prefix, workers):
+    jobs = [
+        SimpleNamespace(
+            fileobj=io.BytesIO(body),
+            key=f"{prefix}{index:03d}_{name}",
+            extra_args={"ContentType": "application/octet-stream"},
+        )
+        for index, (name, body) in enumerate(series, start=1)
+    ]
+    start = time.perf_counter()
+    results = upload_files_concurrently(s3, BUCKET, jobs, max_workers=workers)
+    return time.perf_counter() - start, sum(1 for r in results if not r.ok)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=300)
+    parser.add_argument("--slice-kb", type=int, default=512)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--endpoint-url", default=None)
+    args = parser.parse_args()
+
+    server = None
+    endpoint = args.endpoint_url
+    if endpoint is None:
+        from moto.server import ThreadedMotoServer
+
+        server = ThreadedMotoServer(port=0)
+        server.start()
+        host, port = server.get_host_and_port()
+        endpoint = f"http://{host}:{port}"
+
+    try:
+        s3 = make_s3_client(
+            endpoint_url=endpoint,
+            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID", "testing"),
+            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY", "testing"),
+            region_name="ap-northeast-1",
+        )
+        if args.latency_ms:
+            delay = args.latency_ms / 1000.0
+            s3.meta.events.register("before-send.s3.*", lambda **kw: time.sleep(delay))
+        try:
+            s3.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": "ap-northeast-1"})
+        except s3.exceptions.BucketAlreadyOwnedByYou:
+            pass
+
+        series = _series(args.files, args.slice_kb)
+        total_mb = args.files * args.slice_kb / 1024
+        print(f"{args.files} files x {args.slice_kb} KB ({total_mb:.0f} MB), latency {args.latency_ms} ms/request")
+
+        elapsed, _ = run_serial(s3, series, "serial/")
+        print(f"{'serial':>12}: {elapsed:7.2f}s  {total_mb / elapsed:7.1f} MB/s")
+        elapsed, failed = run_concurrent(s3, series, "concurrent/", args.workers)
+        print(f"{'concurrent':>12}: {elapsed:7.2f}s  {total_mb / elapsed:7.1f} MB/s  workers={args.workers} failed={failed}")
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
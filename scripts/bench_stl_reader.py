@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+STL 読み込みのベンチマーク（合成スキャン）。
+
+trimesh.load（全体をパースしてコピー → merge_vertices）と
+utils.stl_io.load_stl_fast（memmap + ベクトル化した溶接）を
+それぞれ別プロセスで実行し、読み込み時間とピークRSSを比較する。
+
+    python scripts/bench_stl_reader.py                  # 50 / 150 / 500 MB
+    python scripts/bench_stl_reader.py --sizes-mb 20    # 小さめで試す
+"""
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing import get_context
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.stl_io import STL_RECORD_DTYPE, write_binary_stl  # noqa: E402
+
+
+def make_scan(path, size_mb):
+    """起伏のある格子メッシュ（口腔内スキャンのような連続した面）を size_mb 程度のバイナリSTLにする"""
+    faces_target = size_mb * 1024 * 1024 // STL_RECORD_DTYPE.itemsize
+    n = max(2, int(np.sqrt(faces_target / 2)) + 1)  # n x n 頂点 → 2(n-1)^2 面
+    u, v = np.meshgrid(np.linspace(0, 60, n), np.linspace(0, 40, n))
+    z = 3 * np.sin(u / 4) * np.cos(v / 5) + np.random.default_rng(0).normal(0, 0.02, u.shape)
+    vertices = np.column_stack([u.ravel(), v.ravel(), z.ravel()])
+
+    idx = np.arange(n * n).reshape(n, n)
+    a, b = idx[:-1, :-1].ravel(), idx[:-1, 1:].ravel()
+    c, d = idx[1:, :-1].ravel(), idx[1:, 1:].ravel()
+    faces = np.concatenate([np.column_stack([a, b, d]), np.column_stack([a, d, c])])
+    write_binary_stl(path, vertices, faces)
+    return len(faces)
+
+
+def _run(mode, path, queue):
+    start = time.perf_counter()
+    if mode == "trimesh":
+        import trimesh
+
+        mesh = trimesh.load(path, force="mesh")
+    else:
+        from utils.stl_io import load_stl_fast
+
+        mesh = load_stl_fast(path)
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux は KB 単位
+    queue.put((mode, elapsed, peak_mb, len(mesh.vertices), len(mesh.faces)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[50, 150, 500])
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_stl_")
+    try:
+        ctx = get_context("spawn")
+        for size_mb in args.sizes_mb:
+            path = os.path.join(work, f"scan_{size_mb}mb.stl")
+            faces = make_scan(path, size_mb)
+            print(f"synthetic scan: {os.path.getsize(path) / 1e6:.0f} MB, {faces} faces")
+
+            for mode in ("trimesh", "fast"):
+                queue = ctx.Queue()
+                proc = ctx.Process(target=_run, args=(mode, path, queue))
+                proc.start()
+                name, elapsed, peak_mb, n_vertices, n_faces = queue.get()
+                proc.join()
+                print(f"{name:>10}: {elapsed:7.2f}s  peak RSS {peak_mb:8.1f} MB  "
+                      f"vertices {n_vertices}  faces {n_faces}")
+            os.remove(path)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+ZipHandler.process_files のベンチマーク（合成 DICOM シリーズ）。
+
+旧方式（file.save → f.read() → writestr）とストリーミング方式を
+それぞれ別プロセスで実行し、処理時間とピークRSSを比較する。
+
+    python scripts/bench_zip_streaming.py                 # 1GB (512KB x 2048 スライス)
+    python scripts/bench_zip_streaming.py --total-mb 200  # 小さめで試す
+    python scripts/bench_zip_streaming.py --slice-kb 262144  # 256MB x 4 の大ファイル（口腔内スキャン相当）
+"""
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def make_series(dirpath, total_mb, slice_kb):
+    """DICM プリアンブル付きの擬似スライスを作る（圧縮が効きすぎないよう乱数混じり）"""
+    n = max(1, (total_mb * 1024) // slice_kb)
+    body = slice_kb * 1024 - 132
+    for i in range(n):
+        with open(os.path.join(dirpath, f"IM-0001-{i + 1:04d}.dcm"), "wb") as f:
+            f.write(b"\0" * 128 + b"DICM")
+            f.write(os.urandom(body // 4) + b"\0" * (body - body // 4))
+    return n
+
+
+def _file_storages(dirpath):
+    from werkzeug.datastructures import FileStorage
+
+    return [
+        FileStorage(stream=open(os.path.join(dirpath, name), "rb"), filename=name)
+        for name in sorted(os.listdir(dirpath))
+    ]
+
+
+def _legacy(files, out_dir):
+    """変更前の process_files 相当"""
+    tmp = tempfile.mkdtemp(dir=out_dir)
+    zip_path = os.path.join(out_dir, "legacy.zip")
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zipf:
+        for idx, file in enumerate(files):
+            temp_path = os.path.join(tmp, f"{idx:05d}_{file.filename}")
+            file.save(temp_path)
+            info = zipfile.ZipInfo(file.filename)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.flag_bits |= 0x800
+            with open(temp_path, "rb") as f:
+                zipf.writestr(info, f.read())
+    shutil.rmtree(tmp, ignore_errors=True)
+    return zip_path
+
+
+def _run(mode, series_dir, out_dir, queue):
+    files = _file_storages(series_dir)
+    start = time.perf_counter()
+    if mode == "legacy":
+        zip_path = _legacy(files, out_dir)
+    else:
+        from utils.common_utils import ZipHandler
+
+        zip_path, _ = ZipHandler(upload_folder=out_dir, temp_zip_folder=out_dir).process_files(files)
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux は KB 単位
+    queue.put((mode, elapsed, peak_mb, os.path.getsize(zip_path)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--total-mb", type=int, default=1024)
+    parser.add_argument("--slice-kb", type=int, default=512)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_zip_")
+    try:
+        series_dir = os.path.join(work, "series")
+        os.makedirs(series_dir)
+        n = make_series(series_dir, args.total_mb, args.slice_kb)
+        print(f"synthetic DICOM series: {n} slices, {args.total_mb} MB")
+
+        ctx = get_context("spawn")
+        for mode in ("legacy", "streaming"):
+            out_dir = os.path.join(work, mode)
+            os.makedirs(out_dir)
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_run, args=(mode, series_dir, out_dir, queue))
+            proc.start()
+            name, elapsed, peak_mb, zip_size = queue.get()
+            proc.join()
+            print(f"{name:>10}: {elapsed:7.2f}s  peak RSS {peak_mb:8.1f} MB  zip {zip_size / 1e6:8.1f} MB")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+直接アップロード（/meziro_upload/direct/*）の受付先プレフィックスに、完了しなかったマルチパートを
+DAYS 日後に S3 側で中止する AbortIncompleteMultipartUpload のライフサイクルルールを設定する。
+ブラウザが abort を呼ばずに閉じ、定期クリーンアップ（views.main.sweep_direct_uploads）も動かなかったときの最後の砦。
+完了したオブジェクトには影響しない。バケットの他のルールは残し、同じ ID のルールだけ置き換える。
+
+    python scripts/put_direct_upload_lifecycle.py            # 設定
+    python scripts/put_direct_upload_lifecycle.py --dry-run  # 設定内容の表示のみ
+"""
+import json
+import os
+import sys
+
+import boto3
+from botocore.exceptions import ClientError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+AWS_REGION = os.getenv("AWS_REGION", "ap-northeast-1")
+BUCKET_NAME = os.getenv("BUCKET_NAME")
+# views.main の meziro/{受付番号}/ と lab/{受付番号}/
+PREFIXES = ("meziro/", "lab/")
+DAYS = 2
+
+
+def direct_upload_rules():
+    return [
+        {
+            "ID": f"abort-incomplete-direct-upload-{prefix.rstrip('/')}",
+            "Filter": {"Prefix": prefix},
+            "Status": "Enabled",
+            "AbortIncompleteMultipartUpload": {"DaysAfterInitiation": DAYS},
+        }
+        for prefix in PREFIXES
+    ]
+
+
+def main(dry_run=False):
+    if not BUCKET_NAME:
+        sys.exit("BUCKET_NAME が未設定です")
+    s3 = boto3.client("s3", region_name=AWS_REGION)
+    try:
+        rules = s3.get_bucket_lifecycle_configuration(Bucket=BUCKET_NAME)["Rules"]
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "NoSuchLifecycleConfiguration":
+            raise
+        rules = []
+
+    new_rules = direct_upload_rules()
+    ids = {rule["ID"] for rule in new_rules}
+    rules = [rule for rule in rules if rule.get("ID") not in ids] + new_rules
+    print(json.dumps(rules, ensure_ascii=False, indent=2))
+    if not dry_run:
+        s3.put_bucket_lifecycle_configuration(Bucket=BUCKET_NAME, LifecycleConfiguration={"Rules": rules})
+        print(f"完了: {BUCKET_NAME} に {len(new_rules)} 件のルールを設定しました")
+
+
+if __name__ == "__main__":
+    main(dry_run="--dry-run" in sys.argv)
@@ -394,16 +394,10 @@ async function uploadFiles(files) {
 
     // ▼ ファイル処理
     let totalBytes = files.reduce((sum, file) => sum + file.size, 0);
-    let uploadedBytes = 0;
 
     const paths = {};
-
-    if (files.length > 0) {
-        for (const file of files) {
-            const path = getRelativePath(file);
-            formData.append("files[]", file);
-            paths[file.name] = path;
-        }
+    for (const file of files) {
+        paths[file.name] = getRelativePath(file);
     }
 
     // パス情報をJSONとして追加
@@ -419,6 +413,22 @@ async function uploadFiles(files) {
     uploadButton.disabled = true;
     clearButton.disabled = true;
 
+    // 大容量（CBCT の DICOM シリーズ等）はサーバーを経由せず S3 へ直接アップロード
+    if (totalBytes >= DIRECT_UPLOAD_THRESHOLD) {
+        try {
+            const result = await uploadFilesDirect(files, formData, hasFolder, totalBytes);
+            onUploadSuccess(result);
+        } catch (error) {
+            console.error("直接アップロードエラー:", error);
+            onUploadError("エラーが発生しました: " + error.message);
+        }
+        return;
+    }
+
+    for (const file of files) {
+        formData.append("files[]", file);
+    }
+
     try {
         const xhr = new XMLHttpRequest();
         xhr.open("POST", "/meziro_upload", true);
@@ -429,66 +439,218 @@ async function uploadFiles(files) {
         // プログレス処理
         xhr.upload.onprogress = function (event) {
             if (event.lengthComputable) {
-                const percentage = Math.min(100, Math.round((event.loaded / event.total) * 100));
-                progressBar.style.width = percentage + "%";
-                progressBar.textContent = percentage + "%";
+                setProgress(event.loaded / event.total);
             }
         };
 
         xhr.onload = function () {
             if (xhr.status === 200) {
-                const result = JSON.parse(xhr.responseText);
-                showStatus(result.message || "アップロード成功", "success");
-                // 担当名を自動保存
-                if (typeof addDentist === 'function') addDentist(true);
-                fileList.innerHTML = "";
-                selectedFiles = [];
-                selectedImages = [];
-                renderImageThumbnails();
-                updateButtonState();
-                progressContainer.style.display = "none";
-                // input-zone内の全フィールドをリセット（readonlyは除く）
-                document.querySelectorAll("#input-zone input:not([readonly]), #input-zone select, #input-zone textarea").forEach(el => {
-                    if (el.type === "checkbox") {
-                        el.checked = false;
-                    } else if (el.type === "radio") {
-                        el.checked = el.defaultChecked;
-                    } else if (el.tagName === "SELECT") {
-                        el.selectedIndex = 0;
-                    } else {
-                        el.value = "";
-                    }
-                });
-                // シェードシステムをリセット後、選択肢も更新
-                if (typeof updateShadeOptions === "function") updateShadeOptions();
+                onUploadSuccess(JSON.parse(xhr.responseText));
             } else {
                 // 修正：throw ではなく直接処理
                 console.error("HTTPエラー:", xhr.status, xhr.statusText);
-                showStatus(
+                onUploadError(
                     "エラーが発生しました (HTTP " + xhr.status + "): " +
-                        (xhr.statusText || "アップロードに失敗しました"),
-                    "error"
+                        (xhr.statusText || "アップロードに失敗しました")
                 );
-                progressContainer.style.display = "none";
-                updateButtonState();
             }
         };
 
         xhr.onerror = function () {
             // 修正：throw ではなく直接処理
             console.error("ネットワークエラーが発生しました");
-            showStatus("ネットワークエラーが発生しました", "error");
-            progressContainer.style.display = "none";
-            updateButtonState();
+            onUploadError("ネットワークエラーが発生しました");
         };
 
         xhr.send(formData);
     } catch (error) {
         console.error("アップロードエラー:", error);
-        showStatus("エラーが発生しました: " + error.message, "error");
-        progressContainer.style.display = "none";
-        updateButtonState();
+        onUploadError("エラーが発生しました: " + error.message);
+    }
+}
+
+function setProgress(ratio) {
+    const percentage = Math.min(100, Math.round(ratio * 100));
+    progressBar.style.width = percentage + "%";
+    progressBar.textContent = percentage + "%";
+}
+
+function onUploadSuccess(result) {
+    showStatus(result.message || "アップロード成功", "success");
+    // 担当名を自動保存
+    if (typeof addDentist === 'function') addDentist(true);
+    fileList.innerHTML = "";
+    selectedFiles = [];
+    selectedImages = [];
+    renderImageThumbnails();
+    updateButtonState();
+    progressContainer.style.display = "none";
+    // input-zone内の全フィールドをリセット（readonlyは除く）
+    document.querySelectorAll("#input-zone input:not([readonly]), #input-zone select, #input-zone textarea").forEach(el => {
+        if (el.type === "checkbox") {
+            el.checked = false;
+        } else if (el.type === "radio") {
+            el.checked = el.defaultChecked;
+        } else if (el.tagName === "SELECT") {
+            el.selectedIndex = 0;
+        } else {
+            el.value = "";
+        }
+    });
+    // シェードシステムをリセット後、選択肢も更新
+    if (typeof updateShadeOptions === "function") updateShadeOptions();
+}
+
+function onUploadError(message) {
+    showStatus(message, "error");
+    progressContainer.style.display = "none";
+    updateButtonState();
+}
+
+// ===== S3 直接アップロード =====
+// この合計サイズ以上なら署名付きURLでブラウザから S3 へ直接送る
+const DIRECT_UPLOAD_THRESHOLD = 50 * 1024 * 1024;
+// 同時に送るリクエスト数（単発PUT・マルチパートのパートを合わせて）
+const DIRECT_UPLOAD_CONCURRENCY = 4;
+const DIRECT_UPLOAD_RETRIES = 3;
+// 送信中の直接アップロードの upload_token（finalize を送るまで）。失敗・ページ離脱時はこれで中止する
+let pendingDirectUpload = null;
+
+// 開始したマルチパートを中止し、送信済みのファイルを消してもらう（finalize 済みならサーバー側で何もしない）
+function abortDirectUpload(useBeacon) {
+    if (!pendingDirectUpload) return;
+    const body = new FormData();
+    body.append("csrf_token", csrf_token);
+    body.append("upload_token", pendingDirectUpload);
+    pendingDirectUpload = null;
+    if (useBeacon && navigator.sendBeacon) {
+        navigator.sendBeacon("/meziro_upload/direct/abort", body);
+        return;
+    }
+    fetch("/meziro_upload/direct/abort", {
+        method: "POST",
+        headers: { "X-CSRFToken": csrf_token },
+        body,
+    }).catch((error) => console.error("直接アップロードの中止に失敗:", error));
+}
+
+window.addEventListener("pagehide", () => abortDirectUpload(true));
+
+async function postJson(url, body) {
+    const res = await fetch(url, {
+        method: "POST",
+        headers: { "Content-Type": "application/json", "X-CSRFToken": csrf_token },
+        body: JSON.stringify(body),
+    });
+    const data = await res.json().catch(() => ({}));
+    if (!res.ok) throw new Error(data.error || "HTTP " + res.status);
+    return data;
+}
+
+// 署名付きURLへ PUT する。onProgress には送信済みバイト数を渡す
+function putBlob(url, blob, onProgress, contentType) {
+    return new Promise((resolve, reject) => {
+        const xhr = new XMLHttpRequest();
+        xhr.open("PUT", url, true);
+        if (contentType) xhr.setRequestHeader("Content-Type", contentType);
+        xhr.upload.onprogress = (event) => onProgress(event.loaded);
+        xhr.onload = () => {
+            if (xhr.status >= 200 && xhr.status < 300) resolve();
+            else reject(new Error("S3 PUT 失敗 (HTTP " + xhr.status + ")"));
+        };
+        xhr.onerror = () => reject(new Error("ネットワークエラーが発生しました"));
+        xhr.send(blob);
+    });
+}
+
+async function putBlobWithRetry(url, blob, onProgress, contentType) {
+    for (let attempt = 1; ; attempt++) {
+        try {
+            return await putBlob(url, blob, onProgress, contentType);
+        } catch (error) {
+            onProgress(0);
+            if (attempt >= DIRECT_UPLOAD_RETRIES) throw error;
+            await new Promise((r) => setTimeout(r, 1000 * attempt));
+        }
+    }
+}
+
+async function uploadFilesDirect(files, formData, hasFolder, totalBytes) {
+    const init = await postJson("/meziro_upload/direct/init", {
+        files: files.map((file) => ({
+            name: file.name,
+            size: file.size,
+            path: getRelativePath(file),
+        })),
+        has_folder_structure: hasFolder,
+    });
+
+    const uploadToken = init.upload_token;
+    pendingDirectUpload = uploadToken;
+
+    // 単発PUTとマルチパートの各パートを一つのタスク列にまとめる
+    const tasks = [];
+    init.files.forEach((plan, i) => {
+        const file = files[i];
+        if (plan.mode === "put") {
+            tasks.push({ url: plan.url, blob: file, contentType: "application/octet-stream" });
+        } else {
+            plan.part_urls.forEach((url, n) => {
+                const start = n * plan.part_size;
+                tasks.push({ url, blob: file.slice(start, start + plan.part_size) });
+            });
+        }
+    });
+
+    const loaded = new Array(tasks.length).fill(0);
+    const report = () => setProgress(loaded.reduce((a, b) => a + b, 0) / totalBytes);
+
+    let next = 0;
+    const worker = async () => {
+        while (next < tasks.length) {
+            const i = next++;
+            const task = tasks[i];
+            await putBlobWithRetry(task.url, task.blob, (bytes) => {
+                loaded[i] = bytes;
+                report();
+            }, task.contentType);
+            loaded[i] = task.blob.size;
+            report();
+        }
+    };
+    try {
+        await Promise.all(
+            Array.from({ length: Math.min(DIRECT_UPLOAD_CONCURRENCY, tasks.length) }, worker)
+        );
+    } catch (error) {
+        abortDirectUpload(false);
+        throw error;
+    }
+
+    showStatus("アップロード内容を確認中...", "processing");
+    formData.append("upload_token", uploadToken);
+
+    // finalize の処理中にページを離れても中止しない（サーバー側で受付が進んでいる可能性がある）
+    pendingDirectUpload = null;
+    let res;
+    try {
+        res = await fetch("/meziro_upload/direct/finalize", {
+            method: "POST",
+            headers: { "X-CSRFToken": csrf_token },
+            body: formData,
+        });
+    } catch (error) {
+        pendingDirectUpload = uploadToken;
+        abortDirectUpload(false);
+        throw error;
+    }
+    const result = await res.json().catch(() => ({}));
+    if (!res.ok) {
+        pendingDirectUpload = uploadToken;
+        abortDirectUpload(false);
+        throw new Error(result.error || "HTTP " + res.status);
     }
+    return result;
 }
 
 // ドラッグ＆ドロップ処理
@@ -0,0 +1,26 @@
+// STL掲示板の 3D ビューアーを軽い LOD から読み込み、詳細な GLB に差し替える
+//   data-lod-src     : 差し替え先の GLB
+//   data-lod-upgrade : "load"（最初の表示が終わったらすぐ）/ "interact"（操作されたら）
+(function () {
+    function upgrade(viewer) {
+        const next = viewer.dataset.lodSrc;
+        if (!next || viewer.dataset.lodDone) return;
+        viewer.dataset.lodDone = "1";
+        if (viewer.getAttribute("src") !== next) {
+            viewer.setAttribute("src", next);
+        }
+    }
+
+    document.addEventListener("DOMContentLoaded", () => {
+        document.querySelectorAll("model-viewer[data-lod-src]").forEach((viewer) => {
+            if (!viewer.dataset.lodSrc || viewer.dataset.lodSrc === viewer.getAttribute("src")) return;
+
+            if (viewer.dataset.lodUpgrade === "interact") {
+                viewer.addEventListener("pointerdown", () => upgrade(viewer), { once: true });
+                viewer.addEventListener("touchstart", () => upgrade(viewer), { once: true, passive: true });
+            } else {
+                viewer.addEventListener("load", () => upgrade(viewer), { once: true });
+            }
+        });
+    });
+})();
@@ -0,0 +1,38 @@
+// STL → GLB 変換中の投稿をポーリングし、変換が終わったらページを再読み込みする
+(function () {
+    const POLL_INTERVAL_MS = 5000;
+    const MAX_POLLS = 120; // 10分で打ち切り
+
+    function watch(el) {
+        const url = el.dataset.stlStatusUrl;
+        let polls = 0;
+
+        const timer = setInterval(async () => {
+            polls += 1;
+            if (polls > MAX_POLLS) {
+                clearInterval(timer);
+                return;
+            }
+            try {
+                const res = await fetch(url, { headers: { Accept: "application/json" } });
+                if (!res.ok) return;
+                const data = await res.json();
+                if (data.status === "ready") {
+                    clearInterval(timer);
+                    window.location.reload();
+                } else if (data.status === "failed") {
+                    clearInterval(timer);
+                    el.classList.remove("alert-info");
+                    el.classList.add("alert-danger");
+                    el.textContent = "3Dモデルの変換に失敗しました";
+                }
+            } catch (e) {
+                console.error("STL変換状態の取得に失敗:", e);
+            }
+        }, POLL_INTERVAL_MS);
+    }
+
+    document.addEventListener("DOMContentLoaded", () => {
+        document.querySelectorAll("[data-stl-status-url]").forEach(watch);
+    });
+})();
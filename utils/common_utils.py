@@ -5,11 +5,11 @@ import zipfile
 import shutil
 import os
 import cv2
+import numpy as np
 from datetime import datetime
 import time
 from PIL import ImageDraw, ImageFont, Image
 from sklearn.cluster import KMeans
-from collections import Counter
 from apscheduler.schedulers.background import BackgroundScheduler
 import logging
 import tempfile
@@ -19,6 +19,8 @@ import unicodedata
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 
+from utils.image_ingest import fit_image, load_image
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -44,7 +46,9 @@ def get_next_sequence_number():
         )
         return int(response['Attributes']['counter_value']), None  # ← 2つ返す
     except ClientError as e:
-        fallback_id = int(time.time())
+        # 受付番号は S3 キーの一意性の根拠にもなるので、代替IDも衝突しないようにする
+        # （秒単位だと同時刻の別ワーカーと重なる → ミリ秒 + 乱数3桁）
+        fallback_id = int(time.time() * 1000) * 1000 + uuid.uuid4().int % 1000
         warning_msg = f"[WARNING] DynamoDB失敗。代替IDとして {fallback_id} を使用します: {e}"
         print(warning_msg)
         return fallback_id, warning_msg  # ← 2つ返す
@@ -63,10 +67,15 @@ def get_next_lab_sequence_number(counter_name, prefix, width=4):
         num = int(response['Attributes']['counter_value'])
         return f"{prefix}-{num:0{width}d}"
     except ClientError as e:
-        import time as _time
-        num = int(_time.time()) % 10000
-        return f"{prefix}-{num:0{width}d}"
-        
+        # 連番の代わりに衝突しない代替ID（S3 キーの一意性をこの番号に依存しているため）
+        logger.warning("lab counter update failed (%s): %s", counter_name, e)
+        return f"{prefix}-X{uuid.uuid4().hex[:10]}"
+
+
+# ZIPへストリーム書き込みする際のチャンクサイズ
+ZIP_STREAM_CHUNK_SIZE = 1024 * 1024
+
+
 class ZipHandler:
     def __init__(self, upload_folder='uploads', temp_zip_folder='temp_zips'):
         self.UPLOAD_FOLDER = upload_folder
@@ -88,65 +97,103 @@ class ZipHandler:
             return '_'.join(nums) + ext
         return f'dicom_{index:05d}{ext}'
 
+    def _arc_name(self, file, idx, has_folder_structure):
+        """ZIP内のエントリ名を決める（DICOMは数字連番でリネーム、フォルダ構造は保持）"""
+        original_name = file.filename or f'file_{idx:05d}'
+        ext = os.path.splitext(original_name)[1].lower()
+        is_dicom = ext in ('.dcm', '.ima', '') or original_name.upper().startswith('IM-')
+
+        if is_dicom:
+            # DICOMはsanitize不要・数字連番でリネーム
+            safe_name = self._safe_dicom_filename(original_name, idx)
+        else:
+            safe_name = sanitize_filename(original_name) or f'file_{idx:05d}{ext}'
+
+        # フォルダ構造がある場合はパスを保持
+        if has_folder_structure and hasattr(file, 'webkitRelativePath') and file.webkitRelativePath:
+            rel = file.webkitRelativePath
+        elif has_folder_structure and hasattr(file, 'relativePath') and file.relativePath:
+            rel = file.relativePath
+        else:
+            return safe_name
+
+        # パス内のフォルダ部分を保持し、ファイル名だけ安全化
+        parts = rel.replace('\\', '/').split('/')
+        parts[-1] = safe_name
+        return '/'.join(parts)
+
+    @staticmethod
+    def _stream_size(stream):
+        """シーク可能ならサイズを返す（ZIP64 判定用）。不明なら None"""
+        try:
+            pos = stream.tell()
+            stream.seek(0, os.SEEK_END)
+            size = stream.tell() - pos
+            stream.seek(pos)
+            return size
+        except (AttributeError, OSError, ValueError):
+            return None
+
+    def write_zip_entries(self, zipf, files, has_folder_structure=False):
+        """
+        アップロードされた FileStorage を1ファイルずつチャンク単位でZIPエントリへ流し込む。
+        一時ファイルには書き出さず、メモリ使用量は ZIP_STREAM_CHUNK_SIZE 程度で一定。
+        """
+        for idx, file in enumerate(files):
+            print(f"Processing file: {file.filename}")
+            arc_name = self._arc_name(file, idx, has_folder_structure)
+
+            # ZIPエントリにUTF-8フラグを立てる
+            info = zipfile.ZipInfo(arc_name, date_time=datetime.now().timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.flag_bits |= 0x800  # UTF-8フラグ
+
+            size = self._stream_size(file.stream)
+            force_zip64 = size is None or size >= zipfile.ZIP64_LIMIT
+            with zipf.open(info, 'w', force_zip64=force_zip64) as dest:
+                shutil.copyfileobj(file.stream, dest, ZIP_STREAM_CHUNK_SIZE)
+
     def process_files(self, files, has_folder_structure=False):
         """ファイルを処理（常にZIPファイルを作成）"""
         if not files:
             raise ValueError('ファイルが選択されていません')
 
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        temp_dir = os.path.join(self.TEMP_ZIP_FOLDER, timestamp)
-        os.makedirs(temp_dir, exist_ok=True)
+        print(f"Creating ZIP file {'(folder structure)' if has_folder_structure else '(all files)'}")
+        zip_path = os.path.join(self.TEMP_ZIP_FOLDER, f'compressed_{timestamp}.zip')
 
         try:
-            print(f"Creating ZIP file {'(folder structure)' if has_folder_structure else '(all files)'}")
-            zip_path = os.path.join(self.TEMP_ZIP_FOLDER, f'compressed_{timestamp}.zip')
-
             with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zipf:
-                for idx, file in enumerate(files):
-                    print(f"Processing file: {file.filename}")
-                    original_name = file.filename or f'file_{idx:05d}'
-                    ext = os.path.splitext(original_name)[1].lower()
-                    is_dicom = ext in ('.dcm', '.ima', '') or original_name.upper().startswith('IM-')
-
-                    if is_dicom:
-                        # DICOMはsanitize不要・数字連番でリネーム
-                        safe_name = self._safe_dicom_filename(original_name, idx)
-                    else:
-                        safe_name = sanitize_filename(original_name) or f'file_{idx:05d}{ext}'
-
-                    # フォルダ構造がある場合はパスを保持
-                    if has_folder_structure and hasattr(file, 'webkitRelativePath') and file.webkitRelativePath:
-                        rel = file.webkitRelativePath
-                        # パス内のフォルダ部分を保持し、ファイル名だけ安全化
-                        parts = rel.replace('\\', '/').split('/')
-                        parts[-1] = safe_name
-                        arc_name = '/'.join(parts)
-                    elif has_folder_structure and hasattr(file, 'relativePath') and file.relativePath:
-                        rel = file.relativePath
-                        parts = rel.replace('\\', '/').split('/')
-                        parts[-1] = safe_name
-                        arc_name = '/'.join(parts)
-                    else:
-                        arc_name = safe_name
-
-                    temp_path = os.path.join(temp_dir, f'{idx:05d}_{safe_name}')
-                    file.save(temp_path)
-                    # ZIPエントリにUTF-8フラグを立てる
-                    info = zipfile.ZipInfo(arc_name)
-                    info.compress_type = zipfile.ZIP_DEFLATED
-                    info.flag_bits |= 0x800  # UTF-8フラグ
-                    with open(temp_path, 'rb') as f:
-                        zipf.writestr(info, f.read())
+                self.write_zip_entries(zipf, files, has_folder_structure)
+            return zip_path, None
 
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir, ignore_errors=True)
+        except Exception:
+            if os.path.exists(zip_path):
+                os.remove(zip_path)
+            raise
 
-            return zip_path, None
+    def process_files_to_s3(self, files, s3_client, bucket, key, has_folder_structure=False, extra_entries=None):
+        """
+        ZIPを作りながらそのまま S3 マルチパートアップロードへ流す（ローカルディスク不使用）。
+        extra_entries: {arcname: text} をZIP末尾に追加する（受付内容テキストなど）。
+        戻り値: アップロードしたZIPのバイト数
+        """
+        from utils.s3_multipart import S3MultipartWriter
+
+        if not files:
+            raise ValueError('ファイルが選択されていません')
+
+        print(f"Streaming ZIP to s3://{bucket}/{key} {'(folder structure)' if has_folder_structure else '(all files)'}")
+        with S3MultipartWriter(s3_client, bucket, key, content_type='application/zip') as writer:
+            with zipfile.ZipFile(writer, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zipf:
+                self.write_zip_entries(zipf, files, has_folder_structure)
+                for arcname, text in (extra_entries or {}).items():
+                    info = zipfile.ZipInfo(arcname, date_time=datetime.now().timetuple()[:6])
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    info.flag_bits |= 0x800  # UTF-8フラグ
+                    zipf.writestr(info, text.encode('utf-8'))
+        return writer.bytes_written
 
-        except Exception as e:
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir, ignore_errors=True)
-            raise e
     def process_files_no_zip(self, files):
         if not files:
             raise ValueError('ファイルが選択されていません')
@@ -162,6 +209,50 @@ class ZipHandler:
 
         return file_paths, temp_dir
 
+# 主要色の数と、代表色を求めるクラスタリングに使う画素数の上限
+MAIN_COLOR_COUNT = 7
+COLOR_SAMPLE_SIZE = 100_000
+
+
+def _nearest_color_labels(pixels, centers, chunk_size=1 << 20):
+    """各画素を最も近い代表色に割り当てる（float32 で分割して計算し、全画素ぶんの距離行列は作らない）"""
+    centers = np.asarray(centers, dtype=np.float32)
+    center_norms = (centers * centers).sum(axis=1)
+    labels = np.empty(len(pixels), dtype=np.intp)
+    for start in range(0, len(pixels), chunk_size):
+        chunk = pixels[start:start + chunk_size].astype(np.float32)
+        # |p - c|^2 = |p|^2 - 2 p・c + |c|^2 のうち、画素ごとに一定の |p|^2 は省く
+        labels[start:start + chunk_size] = np.argmin(center_norms - 2.0 * chunk @ centers.T, axis=1)
+    return labels
+
+
+def extract_main_colors(pixels, n_colors=MAIN_COLOR_COUNT, sample_size=COLOR_SAMPLE_SIZE, random_state=42):
+    """
+    画素 (N, 3) の主要色を使用頻度順に返す: [(rgb, 画素数, 割合%), ...]
+
+    画素数が sample_size を超える場合は、ランダムに選んだ sample_size 画素で KMeans を行い、
+    全画素を最も近い代表色に割り当てて np.bincount で数える。
+    初期値を3回試して最も誤差の小さい結果を使うので、全画素での KMeans（初期値1回）と同等の精度になる
+    （比較は scripts/bench_color_extraction.py）。sample_size=None なら従来どおり全画素で KMeans を行う。
+    """
+    pixels = np.asarray(pixels).reshape(-1, 3)
+    total_pixels = len(pixels)
+
+    if sample_size is None or total_pixels <= sample_size:
+        cluster = KMeans(n_clusters=n_colors, random_state=random_state)
+        labels = cluster.fit_predict(X=pixels)
+    else:
+        rng = np.random.default_rng(random_state)
+        sample = pixels[rng.choice(total_pixels, size=sample_size, replace=False)].astype(np.float32)
+        cluster = KMeans(n_clusters=n_colors, random_state=random_state, n_init=3).fit(sample)
+        labels = _nearest_color_labels(pixels, cluster.cluster_centers_)
+
+    colors = np.clip(cluster.cluster_centers_, 0, 255).astype(int)
+    counts = np.bincount(labels, minlength=n_colors)
+    order = np.argsort(-counts, kind="stable")  # ピクセル数で降順
+    return [(colors[i], int(counts[i]), counts[i] / total_pixels * 100) for i in order]
+
+
 def get_main_color_list_img(img_path):
     """
     画像の主要7色を抽出し、使用頻度順にカラーブロック上部＋パーセンテージのみを表示する画像を生成。
@@ -172,37 +263,23 @@ def get_main_color_list_img(img_path):
     if cv2_img is None:
         raise ValueError(f"画像の読み込みに失敗しました: {img_path}")
     cv2_img = cv2.cvtColor(cv2_img, cv2.COLOR_BGR2RGB)
-    
-    # 元のピクセルデータを保存
-    pixels = cv2_img.reshape(-1, 3)
-    total_pixels = len(pixels)
-    
-    # クラスタリング
-    cluster = KMeans(n_clusters=7, random_state=42)
-    labels = cluster.fit_predict(X=pixels)
-    colors = cluster.cluster_centers_.astype(int, copy=False)
-    
-    # クラスターごとのピクセル数をカウント
-    label_counts = Counter(labels)
-    
-    # 使用頻度順の色情報を取得（明示的にソート）
-    color_info = []
-    for i in range(7):
-        idx = i
-        color = colors[idx]
-        count = label_counts[idx]
-        percentage = (count / total_pixels) * 100
-        color_info.append((idx, color, count, percentage))
-    
-    # ピクセル数で降順ソート
-    color_info.sort(key=lambda x: x[2], reverse=True)
+    return make_main_color_chart(cv2_img)
+
+
+def make_main_color_chart(rgb_array):
+    """
+    RGB 配列 (H, W, 3) から主要色のカラーチャート画像と色情報を作る。
+    デコード済みの配列を受け取るので、呼び出し側で読み込んだ画像をそのまま使い回せる。
+    """
+    # 使用頻度順の色情報
+    color_info = extract_main_colors(np.asarray(rgb_array).reshape(-1, 3))
     
     hex_rgb_list = []
 
     # 基本設定
     IMG_SIZE = 80
     MARGIN = 75
-    COLOR_BLOCK_WIDTH = IMG_SIZE * 7 + MARGIN * 2
+    COLOR_BLOCK_WIDTH = IMG_SIZE * MAIN_COLOR_COUNT + MARGIN * 2
     
     # 結果画像のサイズ（テキスト表示部分を除去）
     width = COLOR_BLOCK_WIDTH
@@ -218,7 +295,7 @@ def get_main_color_list_img(img_path):
     draw.text((MARGIN, 35), "主要色（使用頻度順）:", fill='white', font=font)
 
     # カラーブロックを描画（使用頻度順）
-    for i, (_, rgb, _, percentage) in enumerate(color_info):
+    for i, (rgb, _, percentage) in enumerate(color_info):
         hex_code = '#%02x%02x%02x' % tuple(rgb)
         x = MARGIN + IMG_SIZE * i
         y = MARGIN + 20
@@ -245,6 +322,15 @@ def get_main_color_list_img(img_path):
 
     return tiled_color_img, hex_rgb_list
 
+def decode_image_for_colors(data, max_width=1500):
+    """
+    アップロードされた画像のバイト列を1回だけデコードし、横幅 max_width 以下にした PIL 画像と形式を返す。
+    JPEG の縮小デコードと EXIF の回転補正は utils.image_ingest.load_image で行う。
+    """
+    img, fmt = load_image(data, max_width=max_width)
+    return img, fmt or "PNG"
+
+
 def get_original_small_img(img_path, max_width=500):
     """
     元画像の小さくリサイズしたPILの画像を取得する。
@@ -272,37 +358,41 @@ def get_original_small_img(img_path, max_width=500):
         img = Image.open(fp=img_path)
         
         # アスペクト比を保持しながらリサイズ
-        if img.width > max_width:
-            scale = max_width / img.width
-            new_width = max_width
-            new_height = int(img.height * scale)
-            img = img.resize((new_width, new_height), Image.LANCZOS)
-        
-        return img
+        return fit_image(img, max_width=max_width)
     except FileNotFoundError:
         raise FileNotFoundError(f"画像ファイルが見つかりません: {img_path}")
     except Exception as e:
         raise ValueError(f"画像処理中にエラーが発生しました: {str(e)}")
 
-def process_image(img_path):
+def process_image(img):
     """
     画像を処理して結果画像を生成する。
     
     Parameters
     ----------
-    img_path : str
-        対象の画像のパス。
+    img : Image or str
+        対象の画像（decode_image_for_colors でデコード済みの PIL 画像）、または画像のパス。
+        デコードは1回だけで、色の抽出と元画像の縮小版は同じ画素データから作る。
     
     Returns
     -------
     result_img : Image
         処理結果の画像。
     """
-    # 色の抽出
-    color_img, hex_rgb_list = get_main_color_list_img(img_path)
+    if isinstance(img, str):
+        try:
+            with Image.open(img) as opened:
+                img = opened.convert('RGB')
+        except FileNotFoundError:
+            raise FileNotFoundError(f"画像ファイルが見つかりません: {img}")
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    # 色の抽出（PIL 画像の画素をそのまま配列として使う）
+    color_img, hex_rgb_list = make_main_color_chart(np.asarray(img))
     
     # 元画像の縮小版
-    small_img = get_original_small_img(img_path)
+    small_img = fit_image(img, max_width=500)
     
     MARGIN = 10
     # 結果画像の作成（元画像の下にカラーチャート）
@@ -432,6 +522,13 @@ def setup_scheduled_cleanup(app):
             logger.info("定期的なクリーンアップタスクを開始します")
             deleted_count = cleanup_temp_files(app_root_path)
             logger.info(f"定期的なクリーンアップタスク完了: 合計 {deleted_count} ファイルを削除しました")
+            # ブラウザが abort を呼ばずに閉じた直接アップロードのファイルを S3 から消す
+            try:
+                from views.main import sweep_direct_uploads
+                swept = sweep_direct_uploads()
+                logger.info(f"放置された直接アップロードを {swept} 件片付けました")
+            except Exception as e:
+                logger.error(f"直接アップロードの片付けエラー: {e}")
     
     # before_first_requestの代わりに直接実行
     # アプリケーション初期化時に一度だけ実行
@@ -451,8 +548,8 @@ def setup_scheduled_cleanup(app):
 
 def setup_mail_import_scheduler(app):
     """
-    D-score・iTero メールの定期取込スケジューラを設定する。
-    1時間ごとに自動実行。
+    D-score・iTero・Shining3D・3ds メールの定期取込スケジューラを設定する。
+    1時間ごとに自動実行（utils/mail_import.py）。
     """
     import os
     # Flask debug モードのリローダープロセスでは二重起動しない
@@ -463,34 +560,13 @@ def setup_mail_import_scheduler(app):
 
     @mail_scheduler.scheduled_job("interval", hours=1, id="mail_import")
     def mail_import_job():
+        # 全業者のメールを1つの IMAP セッションで取得し、業者ごとの件数と所要時間はパイプライン側でログに出す
         logger.info("定期メール取込を開始")
         try:
-            from utils.dscore_import import import_dscore_emails
-            found, imported, skipped = import_dscore_emails(app)
-            logger.info("D-score: %d件取得 / %d件登録 / %d件スキップ", found, imported, skipped)
-        except Exception as e:
-            logger.error("D-score 定期取込エラー: %s", e)
-
-        try:
-            from utils.itero_import import import_itero_emails
-            found, imported, skipped = import_itero_emails(app)
-            logger.info("iTero: %d件取得 / %d件登録 / %d件スキップ", found, imported, skipped)
-        except Exception as e:
-            logger.error("iTero 定期取込エラー: %s", e)
-
-        try:
-            from utils.shining3d_import import import_shining3d_emails
-            found, imported, skipped = import_shining3d_emails(app)
-            logger.info("Shining3D: %d件取得 / %d件登録 / %d件スキップ", found, imported, skipped)
-        except Exception as e:
-            logger.error("Shining3D 定期取込エラー: %s", e)
-
-        try:
-            from utils.threedshape_import import import_threedshape_emails
-            found, imported, skipped = import_threedshape_emails(app)
-            logger.info("3ds: %d件取得 / %d件登録 / %d件スキップ", found, imported, skipped)
+            from utils.mail_import import run_mail_import
+            run_mail_import(app)
         except Exception as e:
-            logger.error("3ds 定期取込エラー: %s", e)
+            logger.error("メール定期取込エラー: %s", e)
 
     mail_scheduler.start()
     logger.info("メール定期取込スケジューラを開始しました（1時間ごと）")
@@ -0,0 +1,85 @@
+"""
+ブラウザ → S3 直接アップロード（views/main.py の /meziro_upload/direct/*）の受付状態。
+
+Meziro-Counters に次の2種類のアイテムを持つ。
+  direct_upload#<受付番号>                   : init してまだ finalize / abort されていない受付
+                                               （ファイルのキーとマルチパートの UploadId）
+  direct_upload_rate#<送信元>#<YYYYmmddHH>   : 1時間ごとの init 回数（送信元 "*" は全体の回数）
+ブラウザが abort を呼ばずに閉じた受付は、定期クリーンアップで stale_pending_uploads から拾って片付ける。
+回数のアイテムには expires_at を付けるので、テーブルの TTL を有効にすれば自動で消える。
+"""
+import time
+from datetime import datetime, timezone
+
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+PENDING_PREFIX = "direct_upload#"
+RATE_PREFIX = "direct_upload_rate#"
+RATE_ALL = "*"
+
+
+def _counter_table():
+    from utils.common_utils import counter_table
+
+    return counter_table
+
+
+def _count_up(key, limit, expires_at):
+    """key の回数を1増やす。limit に達していたら False"""
+    try:
+        _counter_table().update_item(
+            Key={"counter_name": key},
+            UpdateExpression="ADD counter_value :one SET expires_at = :exp",
+            ConditionExpression="attribute_not_exists(counter_value) OR counter_value < :limit",
+            ExpressionAttributeValues={":one": 1, ":limit": limit, ":exp": expires_at},
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+            return False
+        raise
+    return True
+
+
+def allow_direct_upload_init(client, limit, total_limit):
+    """
+    client（送信元）の init を1回数える。この1時間で client が limit 回、全体で total_limit 回を
+    超えるなら False（受付番号を採番する前に呼ぶ）。
+    """
+    hour = datetime.now(timezone.utc).strftime("%Y%m%d%H")
+    expires_at = int(time.time()) + 2 * 60 * 60
+    if not _count_up(f"{RATE_PREFIX}{client}#{hour}", limit, expires_at):
+        return False
+    return _count_up(f"{RATE_PREFIX}{RATE_ALL}#{hour}", total_limit, expires_at)
+
+
+def save_pending_upload(id_str, is_lab_order, files):
+    """init した受付を記録する。files は [{key, upload_id（マルチパートのみ）}, ...]"""
+    _counter_table().put_item(Item={
+        "counter_name": f"{PENDING_PREFIX}{id_str}",
+        "order_id": id_str,
+        "lab": bool(is_lab_order),
+        "files": [{k: f[k] for k in ("key", "upload_id") if f.get(k)} for f in files],
+        "created_at": int(time.time()),
+    })
+
+
+def clear_pending_upload(id_str):
+    """finalize / abort した受付の記録を消す"""
+    _counter_table().delete_item(Key={"counter_name": f"{PENDING_PREFIX}{id_str}"})
+
+
+def stale_pending_uploads(max_age):
+    """init から max_age 秒を過ぎても finalize / abort されていない受付（アイテムのリスト）"""
+    cutoff = int(time.time()) - max_age
+    scan_kwargs = {
+        "FilterExpression": Attr("counter_name").begins_with(PENDING_PREFIX) & Attr("created_at").lt(cutoff),
+    }
+    items = []
+    while True:
+        resp = _counter_table().scan(**scan_kwargs)
+        items.extend(resp.get("Items", []))
+        last = resp.get("LastEvaluatedKey")
+        if not last:
+            return items
+        scan_kwargs["ExclusiveStartKey"] = last
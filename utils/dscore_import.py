@@ -1,13 +1,10 @@
 """
-D-score (Dentsply Sirona) の通知メールを Gmail IMAP で取得し、
+D-score (Dentsply Sirona) の通知メール（utils/mail_import.py が Gmail から取得）をパースし、
 DynamoDB の prescriptions テーブルに指示書として登録する。
 """
-import imaplib
-import email
-import os
 import re
 import logging
-from datetime import datetime, timezone, timedelta, date as date_type
+from datetime import datetime, timezone
 from email.header import decode_header, make_header
 from email.utils import parsedate_to_datetime
 import pytz
@@ -161,65 +158,17 @@ def parse_dscore_email(msg):
     }
 
 
-# ── Gmail IMAP でメール取得 ──────────────────────────────────────────────────
-def fetch_dscore_emails():
-    """
-    未読の D-score 通知メールを取得して email.Message リストを返す。
-    取得後は既読にする。
-    """
-    gmail_user = os.getenv("GMAIL_USER", "")
-    gmail_pass = os.getenv("GMAIL_APP_PASSWORD", "").replace("-", "").replace(" ", "")
-    if not gmail_user or not gmail_pass or "xxxx" in gmail_pass:
-        log.warning("GMAIL_APP_PASSWORD が未設定のため D-score インポートをスキップ")
-        return []
-
-    messages = []
-    try:
-        imap = imaplib.IMAP4_SSL("imap.gmail.com")
-        imap.login(gmail_user, gmail_pass)
-        imap.select("INBOX")
-
-        # 過去 LOOKBACK_DAYS 日分のみ検索（IMAP SINCE で絞り込み）
-        since_date = (date_type.today() - timedelta(days=DSCORE_LOOKBACK_DAYS)).strftime("%d-%b-%Y")
-        log.info("D-score メール検索範囲: SINCE %s", since_date)
-        status, data = imap.search(None, f'FROM "order@dscore.com" SINCE {since_date}')
-        if status != "OK" or not data[0]:
-            status, data = imap.search(None, f'SUBJECT "DS Core" SINCE {since_date}')
-
-        if status == "OK" and data[0]:
-            nums = data[0].split()
-            log.info("D-score メール %d 件を検索結果として取得", len(nums))
-            for num in nums:
-                _, msg_data = imap.fetch(num, "(RFC822)")
-                raw = msg_data[0][1]
-                msg = email.message_from_bytes(raw)
-                # 日本語形式の新規注文メールのみ対象（英語・完了通知は除外）
-                subject = _decode_subject(msg.get("Subject", ""))
-                if "新しい注文" not in subject:
-                    log.debug("スキップ（対象外件名）: %s", subject)
-                    continue
-                messages.append(msg)
-
-        imap.logout()
-    except Exception as e:
-        log.error("Gmail IMAP 接続エラー: %s", e)
-
-    return messages
-
-
 # ── DynamoDB に保存 ────────────────────────────────────────────────────────
-def import_dscore_emails(app):
+def register_dscore_emails(app, messages):
     """
-    Flask app コンテキスト内で呼び出す。
-    新しい D-score メールを取得して指示書として登録する。
+    取込パイプライン（utils/mail_import.py）で取得した D-score の通知メールを指示書として登録する。
     戻り値: (取得件数, 登録件数, スキップ件数)
     """
     from utils.common_utils import get_next_sequence_number
+    from utils.prescription_dynamo import put_prescription
 
-    messages = fetch_dscore_emails()
     found = len(messages)
-    log.info("D-score: %d 件のメールを取得", found)
-    if not messages:
+    if not found:
         return 0, 0, 0
 
     with app.app_context():
@@ -293,8 +242,31 @@ def import_dscore_emails(app):
             if data["dscore_order_id"]:
                 item["dscore_order_id"] = data["dscore_order_id"]
 
-            prescriptions_table.put_item(Item=item)
+            put_prescription(prescriptions_table, item, lab_table=False)
             log.info("D-score 指示書を登録: No.%s 注文番号=%s", id_str, data["dscore_order_id"])
             imported += 1
 
     return found, imported, skipped
+
+
+def import_dscore_emails(app, resync=False):
+    """
+    Flask app コンテキスト内で呼び出す（管理画面の手動取込）。D-score のメールだけを取得して登録する。
+    resync=True なら前回までの同期位置を無視して遡り期間ぶんを取り直す（登録済みのものはスキップされる）。
+    戻り値: (取得件数, 登録件数, スキップ件数)
+    """
+    from utils.mail_import import run_mail_import
+
+    stats = run_mail_import(app, [MAIL_SOURCE], resync=resync)[MAIL_SOURCE["name"]]
+    return stats["found"], stats["imported"], stats["skipped"]
+
+
+# 取込パイプライン（utils/mail_import.py）に渡す設定
+MAIL_SOURCE = {
+    "name":            "D-score",
+    "from":            DSCORE_FROM,
+    "subject_search":  "DS Core",  # 差出人で見つからないときは件名で探す
+    "subject_keyword": "新しい注文",  # 日本語形式の新規注文メールのみ対象（英語・完了通知は除外）
+    "lookback_days":   DSCORE_LOOKBACK_DAYS,
+    "register":        register_dscore_emails,
+}
@@ -0,0 +1,82 @@
+"""
+アップロード画像の読み込み・縮小の共通処理。
+
+スマホ写真（12〜48MP）を Image.open → resize するとフル解像度で展開してから縮小するため、
+1枚ごとに数百MBのメモリと数百msの CPU を使う。ここでは
+  1. JPEG（スマホの MPO を含む）は draft で 1/2・1/4・1/8 の縮小デコードを使い、目標サイズ以上の最小の大きさで展開する
+  2. EXIF の回転を1回だけ適用する（縮小後の画像を回すので軽い）
+  3. 最後に LANCZOS で目標サイズに縮小する（reducing_gap で整数倍の reduce を先に行う）
+の順で処理する。Pillow 以外には依存しない（ai_discussion からも使う）。
+
+    img, fmt = load_image(file_storage, max_width=2000)
+"""
+import io
+import math
+
+from PIL import Image, ImageOps, JpegImagePlugin
+
+# EXIF Orientation のうち縦横が入れ替わるもの
+_EXIF_ORIENTATION = 0x0112
+_SWAPPED_ORIENTATIONS = (5, 6, 7, 8)
+# resize の前に reduce（整数倍の平均縮小）を使う割合。3.0 なら LANCZOS だけの場合と見分けがつかない
+REDUCING_GAP = 3.0
+
+
+def _open(source):
+    """bytes / パス / ファイルオブジェクト / werkzeug の FileStorage から開く"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(source))
+    stream = getattr(source, "stream", None)
+    return Image.open(stream if stream is not None else source)
+
+
+def _scale_for(width, height, max_width=None, max_size=None):
+    """表示向きの (width, height) を max_width / max_size（幅, 高さ）に収める倍率（拡大はしない）"""
+    scale = 1.0
+    if max_width:
+        scale = min(scale, max_width / width)
+    if max_size:
+        scale = min(scale, max_size[0] / width, max_size[1] / height)
+    return scale
+
+
+def load_image(source, max_width=None, max_size=None):
+    """
+    画像を開いて EXIF の回転を補正し、横幅 max_width 以下（max_size なら枠内）に縮小する。
+    戻り値は (PIL 画像, 元の形式)。元の形式は "JPEG" / "PNG" など（不明なら None）。
+    iPhone・Galaxy の JPEG は MPF を含むと Pillow では "MPO" になるが、保存・Content-Type 用に "JPEG" として返す。
+    縮小不要な大きさなら、回転補正だけした画像を返す。
+    """
+    try:
+        img = _open(source)
+        fmt = "JPEG" if img.format == "MPO" else img.format
+        orientation = img.getexif().get(_EXIF_ORIENTATION, 1)
+        width, height = img.size
+        if orientation in _SWAPPED_ORIENTATIONS:
+            width, height = height, width
+
+        scale = _scale_for(width, height, max_width, max_size)
+        if scale < 1.0 and isinstance(img, JpegImagePlugin.JpegImageFile):
+            # draft は「指定サイズ以上」を保つ最大の縮小率を選ぶ（ファイル上の向きで指定する）
+            img.draft(None, (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+        img.load()
+    except (OSError, SyntaxError, ValueError) as e:
+        raise ValueError(f"画像の読み込みに失敗しました: {e}")
+
+    img = ImageOps.exif_transpose(img) or img
+    return fit_image(img, max_width=max_width, max_size=max_size), fmt
+
+
+def fit_image(img, max_width=None, max_size=None):
+    """
+    デコード済みの画像を横幅 max_width 以下（max_size なら枠内）に LANCZOS で縮小する（拡大はしない）。
+    横幅基準のときは従来どおり幅をぴったり max_width にし、高さは比率から切り捨てで求める。
+    """
+    scale = _scale_for(img.width, img.height, max_width, max_size)
+    if scale >= 1.0:
+        return img
+    if max_width and not max_size:
+        size = (max_width, max(1, int(img.height * max_width / img.width)))
+    else:
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
@@ -0,0 +1,147 @@
+"""
+画像処理（RAW現像・主要色のクラスタリング・LANCZOS 縮小）を別プロセスで行うサービス。
+
+uwsgi ワーカーの中でこれらを行うと GIL を握ったまま数秒 CPU を使うため、
+NEF などをまとめてアップロードされると他のページの応答まで遅くなる。
+処理はプロセスプールに渡し、同時に受け付ける数（実行中 + 待ち）に上限を設ける。
+上限に達していたら ImagePoolBusy を送出するので、ルート側は 429 を返す。
+
+    try:
+        color_bytes, gray_bytes = run_image_task(shade_matching_images, data, filename)
+    except ImagePoolBusy:
+        return "混み合っています", 429, {"Retry-After": str(IMAGE_JOB_RETRY_AFTER)}
+
+受付数の上限は uwsgi ワーカー（プロセス）ごと。タイムアウトしたタスクも、
+実際に終わるまでは枠を使ったままにする（プールの中ではまだ CPU を使っているため）。
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from dotenv import load_dotenv
+from PIL import Image
+
+from utils.image_ingest import fit_image, load_image
+from utils.process_pool import SpawnPool
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# uwsgi ワーカー1つあたりの画像処理プロセス数と、同時に受け付けるタスク数（実行中 + 待ち）
+IMAGE_JOB_WORKERS = int(os.getenv("IMAGE_JOB_WORKERS", "2"))
+IMAGE_JOB_QUEUE_DEPTH = int(os.getenv("IMAGE_JOB_QUEUE_DEPTH", "4"))
+# 1タスクの待ち時間の上限（秒）と、429 のときに返す Retry-After（秒）
+IMAGE_JOB_TIMEOUT = float(os.getenv("IMAGE_JOB_TIMEOUT", "90"))
+IMAGE_JOB_RETRY_AFTER = int(os.getenv("IMAGE_JOB_RETRY_AFTER", "10"))
+
+RAW_EXTENSIONS = {'.nef', '.nrw', '.cr2', '.cr3', '.crw', '.arw', '.srf',
+                  '.sr2', '.dng', '.raf', '.rw2', '.orf', '.pef', '.raw',
+                  '.rwl', '.mrw', '.x3f', '.erf'}
+UPLOAD_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.gif': 'GIF', '.webp': 'WEBP'}
+
+_pool = SpawnPool(IMAGE_JOB_WORKERS)
+_slots = threading.BoundedSemaphore(IMAGE_JOB_QUEUE_DEPTH)
+
+
+class ImagePoolBusy(Exception):
+    """画像処理の受付数が上限に達している（429 を返す）"""
+
+
+class ImageJobTimeout(Exception):
+    """画像処理が IMAGE_JOB_TIMEOUT 秒以内に終わらなかった"""
+
+
+def run_image_task(fn, *args, timeout=IMAGE_JOB_TIMEOUT, wait=0):
+    """
+    fn(*args) をプロセスプールで実行して結果を返す（fn と引数・戻り値は pickle できること）。
+    wait 秒待っても受付枠が空かなければ ImagePoolBusy、timeout 秒で終わらなければ ImageJobTimeout。
+    fn の中で起きた例外はそのまま送出される。
+    """
+    acquired = _slots.acquire(timeout=wait) if wait else _slots.acquire(blocking=False)
+    if not acquired:
+        logger.warning("Image pool saturated: task=%s depth=%d", fn.__name__, IMAGE_JOB_QUEUE_DEPTH)
+        raise ImagePoolBusy(fn.__name__)
+    try:
+        future = _pool.submit(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _fut: _slots.release())
+
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        # 待ちのままなら取り消す（実行中なら終わるまで枠を使い続ける）
+        future.cancel()
+        logger.error("Image task timed out: task=%s timeout=%ss", fn.__name__, timeout)
+        raise ImageJobTimeout(f"画像処理が {timeout:g} 秒以内に終わりませんでした")
+
+
+# ==============================
+# 以下はワーカープロセス側
+# ==============================
+def shade_matching_images(data, filename, max_width=2500):
+    """
+    シェードマッチング用：RAW は rawpy で現像、それ以外は縮小デコードして横幅 max_width に縮小し、
+    カラーと彩度0の JPEG（品質85）のバイト列を返す。
+    """
+    ext = os.path.splitext((filename or "").lower())[1]
+    if ext in RAW_EXTENSIONS:
+        import rawpy
+
+        with rawpy.imread(io.BytesIO(data)) as raw:
+            rgb_array = raw.postprocess(use_camera_wb=True, output_bps=8)
+        img = fit_image(Image.fromarray(rgb_array), max_width=max_width)
+    else:
+        img, _ = load_image(data, max_width=max_width)
+
+    # RGBに変換（PNG等に対応）
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    buffered_color = io.BytesIO()
+    img.save(buffered_color, format='JPEG', quality=85)
+
+    # デサチュレーション（彩度を0にする）
+    from PIL import ImageEnhance
+
+    buffered_gray = io.BytesIO()
+    ImageEnhance.Color(img).enhance(0).save(buffered_gray, format='JPEG', quality=85)
+    return buffered_color.getvalue(), buffered_gray.getvalue()
+
+
+def color_analysis(data, max_width=1500):
+    """
+    /colors 用：縮小した元画像（保存用のバイト列と形式）、主要色チャート付きの結果画像（PNG）、
+    主要色の一覧を返す。
+    """
+    from utils.common_utils import decode_image_for_colors, process_image
+
+    img, fmt = decode_image_for_colors(data, max_width=max_width)
+    upload_buf = io.BytesIO()
+    img.save(upload_buf, format=fmt)
+
+    result_img, color_data = process_image(img)
+    result_buf = io.BytesIO()
+    result_img.save(result_buf, format="PNG")
+    return upload_buf.getvalue(), fmt, result_buf.getvalue(), color_data
+
+
+def resize_upload_image(data, filename, max_width=2000):
+    """
+    指示書・注文の添付画像：縮小デコード → EXIF回転補正 → 横幅 max_width に縮小し、
+    拡張子に合わせた形式（不明なら JPEG 品質90）のバイト列・形式・縮小後の横幅を返す。
+    """
+    img, _ = load_image(data, max_width=max_width)
+    fmt = UPLOAD_FORMATS.get(os.path.splitext((filename or "").lower())[1], 'JPEG')
+    if fmt == 'JPEG' and img.mode in ('RGBA', 'P', 'LA'):
+        img = img.convert('RGB')
+    buf = io.BytesIO()
+    if fmt == 'JPEG':
+        img.save(buf, format='JPEG', quality=90)
+    else:
+        img.save(buf, format=fmt)
+    return buf.getvalue(), fmt, img.width
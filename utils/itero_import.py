@@ -1,13 +1,10 @@
 """
-iTero (Align Technology) の通知メールを Gmail IMAP で取得し、
+iTero (Align Technology) の通知メール（utils/mail_import.py が Gmail から取得）をパースし、
 DynamoDB の prescriptions テーブルに指示書として登録する。
 """
-import imaplib
-import email
-import os
 import re
 import logging
-from datetime import datetime, timezone, timedelta, date as date_type
+from datetime import datetime, timezone
 from email.header import decode_header, make_header
 from email.utils import parsedate_to_datetime
 import pytz
@@ -94,54 +91,14 @@ def parse_itero_email(msg):
     }
 
 
-def fetch_itero_emails():
+def register_itero_emails(app, messages):
     """
-    過去 ITERO_LOOKBACK_DAYS 日分の iTero 通知メールを取得して返す。
-    """
-    gmail_user = os.getenv("GMAIL_USER", "")
-    gmail_pass = os.getenv("GMAIL_APP_PASSWORD", "").replace("-", "").replace(" ", "")
-    if not gmail_user or not gmail_pass or "xxxx" in gmail_pass:
-        log.warning("GMAIL_APP_PASSWORD が未設定のため iTero インポートをスキップ")
-        return []
-
-    messages = []
-    try:
-        imap = imaplib.IMAP4_SSL("imap.gmail.com")
-        imap.login(gmail_user, gmail_pass)
-        imap.select("INBOX")
-
-        since_date = (date_type.today() - timedelta(days=ITERO_LOOKBACK_DAYS)).strftime("%d-%b-%Y")
-        log.info("iTero メール検索範囲: SINCE %s", since_date)
-
-        status, data = imap.search(None, f'FROM "{ITERO_FROM}" SINCE {since_date}')
-        if status == "OK" and data[0]:
-            nums = data[0].split()
-            log.info("iTero メール %d 件を取得", len(nums))
-            for num in nums:
-                _, msg_data = imap.fetch(num, "(RFC822)")
-                msg = email.message_from_bytes(msg_data[0][1])
-                subject = _decode_subject(msg.get("Subject", ""))
-                # 新規症例通知のみ（他の通知は除外）
-                if "新しい症例" not in subject:
-                    log.debug("スキップ（対象外件名）: %s", subject)
-                    continue
-                messages.append(msg)
-
-        imap.logout()
-    except Exception as e:
-        log.error("Gmail IMAP 接続エラー (iTero): %s", e)
-
-    return messages
-
-
-def import_itero_emails(app):
-    """
-    Flask app コンテキスト内で呼び出す。
+    取込パイプライン（utils/mail_import.py）で取得した iTero の通知メールを指示書として登録する。
     戻り値: (取得件数, 登録件数, スキップ件数)
     """
     from utils.common_utils import get_next_sequence_number
+    from utils.prescription_dynamo import put_prescription
 
-    messages = fetch_itero_emails()
     found = len(messages)
     if not found:
         return 0, 0, 0
@@ -226,8 +183,30 @@ def import_itero_emails(app):
                 "updated_at":        now_str,
             }
 
-            prescriptions_table.put_item(Item=item)
+            put_prescription(prescriptions_table, item, lab_table=False)
             log.info("iTero 指示書を登録: No.%s オーダー=%s", id_str, data["itero_order_id"])
             imported += 1
 
     return found, imported, skipped
+
+
+def import_itero_emails(app, resync=False):
+    """
+    Flask app コンテキスト内で呼び出す（管理画面の手動取込）。iTero のメールだけを取得して登録する。
+    resync=True なら前回までの同期位置を無視して遡り期間ぶんを取り直す（登録済みのものはスキップされる）。
+    戻り値: (取得件数, 登録件数, スキップ件数)
+    """
+    from utils.mail_import import run_mail_import
+
+    stats = run_mail_import(app, [MAIL_SOURCE], resync=resync)[MAIL_SOURCE["name"]]
+    return stats["found"], stats["imported"], stats["skipped"]
+
+
+# 取込パイプライン（utils/mail_import.py）に渡す設定
+MAIL_SOURCE = {
+    "name":            "iTero",
+    "from":            ITERO_FROM,
+    "subject_keyword": "新しい症例",  # 新規症例通知のみ（他の通知は除外）
+    "lookback_days":   ITERO_LOOKBACK_DAYS,
+    "register":        register_itero_emails,
+}
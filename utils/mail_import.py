@@ -0,0 +1,285 @@
+"""
+通知メール（D-score・iTero・Shining3D・3ds）の取込パイプライン。
+
+以前は業者ごとに IMAP にログインし、SINCE 検索でヒットしたメールを1通ずつ fetch(RFC822) していた。
+ここでは1回のログインで
+  1. 業者ごとに UID SEARCH（サーバー側で絞り込むだけなので軽い）
+  2. ヒットした全 UID の件名だけを UID の範囲でまとめて取得し、対象の件名のものを選ぶ
+  3. 対象メールの本文を業者ごとに UID の範囲でまとめて取得
+を行ってからログアウトし、各業者の登録処理（パース → DynamoDB）に振り分ける。
+
+前回までに処理した UID はメールボックス × 業者ごとに記録しておき（utils/mail_sync_dynamo.py）、
+次の回はそれより大きい UID だけを検索する。新着が無ければ検索の応答だけで終わる。
+UIDVALIDITY が変わった（メールボックスが作り直された）ときや記録が無いときは、遡り期間ぶんを検索し直す。
+DynamoDB 側の重複チェックはそのまま残すので、取り直しても二重登録にはならない。
+
+業者側のモジュールは MAIL_SOURCE に次の dict を持つ。
+    name             : ログ・戻り値のキー（"D-score" など）
+    from             : 差出人アドレス（IMAP の FROM 検索）
+    subject_search   : FROM で1件も見つからなかったときに件名で検索する語（省略可）
+    subject_keyword  : 取込対象の件名に含まれる語（含まないメールは本文を取得しない）
+    lookback_days    : 何日前まで遡るか
+    register         : register(app, messages) → (取得件数, 登録件数, スキップ件数)
+
+    stats = run_mail_import(app)            # 全業者
+    stats = run_mail_import(app, [MAIL_SOURCE])
+    stats = run_mail_import(app, resync=True)  # 記録を無視して遡り期間ぶんを取り直す（管理画面の「遡って取り直す」）
+"""
+import email
+import importlib
+import imaplib
+import logging
+import os
+import re
+import time
+from datetime import date as date_type, timedelta
+from email.header import decode_header, make_header
+
+from botocore.exceptions import ClientError
+
+from utils.mail_sync_dynamo import load_sync_state, save_sync_state
+
+log = logging.getLogger(__name__)
+
+MAIL_MAILBOX = "INBOX"
+MAIL_IMPORT_MODULES = (
+    "utils.dscore_import",
+    "utils.itero_import",
+    "utils.shining3d_import",
+    "utils.threedshape_import",
+)
+# 1回の UID FETCH で取得するメール数
+MAIL_FETCH_BATCH = 50
+
+_UID_RE = re.compile(rb"\bUID (\d+)")
+
+
+def mail_sources():
+    """取込対象の全業者の MAIL_SOURCE"""
+    return [importlib.import_module(name).MAIL_SOURCE for name in MAIL_IMPORT_MODULES]
+
+
+def decode_subject(raw):
+    try:
+        return str(make_header(decode_header(raw)))
+    except Exception:
+        return raw or ""
+
+
+def _gmail_login():
+    """Gmail に IMAP でログインして (IMAP4_SSL, アカウント) を返す。認証情報が未設定なら (None, None)"""
+    gmail_user = os.getenv("GMAIL_USER", "")
+    gmail_pass = os.getenv("GMAIL_APP_PASSWORD", "").replace("-", "").replace(" ", "")
+    if not gmail_user or not gmail_pass or "xxxx" in gmail_pass:
+        log.warning("GMAIL_APP_PASSWORD が未設定のためメール取込をスキップ")
+        return None, None
+    imap = imaplib.IMAP4_SSL("imap.gmail.com")
+    imap.login(gmail_user, gmail_pass)
+    return imap, gmail_user
+
+
+def _select_mailbox(imap):
+    """MAIL_MAILBOX を選択して (UIDVALIDITY, UIDNEXT) を返す（サーバーが返さなければ None）"""
+    status, _ = imap.select(MAIL_MAILBOX)
+    if status != "OK":
+        raise imaplib.IMAP4.error(f"{MAIL_MAILBOX} を選択できません: {status}")
+    values = []
+    for name in ("UIDVALIDITY", "UIDNEXT"):
+        _, data = imap.response(name)
+        values.append(int(data[0]) if data and data[0] else None)
+    return tuple(values)
+
+
+def _uid_set(uids):
+    """[1, 2, 3, 7, 9, 10] → "1:3,7,9:10"（UID の範囲指定）"""
+    ranges = []
+    for uid in sorted(uids):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+
+def _uid_search(imap, criteria):
+    status, data = imap.uid("SEARCH", None, criteria)
+    if status != "OK" or not data or not data[0]:
+        return []
+    return [int(uid) for uid in data[0].split()]
+
+
+def _uid_fetch(imap, uids, query):
+    """UID を MAIL_FETCH_BATCH 件ずつ範囲指定でまとめて FETCH し、(uid, 取得したバイト列) を返す"""
+    uids = sorted(uids)
+    for i in range(0, len(uids), MAIL_FETCH_BATCH):
+        status, data = imap.uid("FETCH", _uid_set(uids[i:i + MAIL_FETCH_BATCH]), query)
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"UID FETCH に失敗: {status}")
+        for i, part in enumerate(data):
+            # 応答は (b'12 (UID 345 RFC822 {1234}', 本文) と b')' が交互に並ぶ。
+            # サーバーによっては UID が本文の後ろ（b' UID 345)'）に付く
+            if not isinstance(part, tuple):
+                continue
+            m = _UID_RE.search(part[0])
+            if not m and i + 1 < len(data) and isinstance(data[i + 1], bytes):
+                m = _UID_RE.search(data[i + 1])
+            if not m:
+                # 黙って捨てると同期位置がこのメールを越えてしまうので、今回の取込ごと失敗させる
+                raise imaplib.IMAP4.error(f"UID FETCH の応答に UID がありません: {part[0][:80]!r}")
+            yield int(m.group(1)), part[1]
+
+
+def _search_source(imap, source, after_uid=0):
+    """source のメールの UID を検索する。after_uid があればそれより大きい UID だけ"""
+    since_date = (date_type.today() - timedelta(days=source["lookback_days"])).strftime("%d-%b-%Y")
+    uid_range = f"UID {after_uid + 1}:* " if after_uid else ""
+    if after_uid:
+        log.info("%s メール検索範囲: UID %d より後（SINCE %s）", source["name"], after_uid, since_date)
+    else:
+        log.info("%s メール検索範囲: SINCE %s", source["name"], since_date)
+
+    def search(criteria):
+        # "n:*" は n が一番大きい UID より大きくても最後の1通を返すので、ここで除く
+        return [uid for uid in _uid_search(imap, f"{uid_range}{criteria} SINCE {since_date}") if uid > after_uid]
+
+    uids = search(f'FROM "{source["from"]}"')
+    if not uids and source.get("subject_search"):
+        uids = search(f'SUBJECT "{source["subject_search"]}"')
+    return uids
+
+
+def fetch_source_messages(imap, sources, stats, after_uids=None):
+    """
+    1つの IMAP セッションで各業者の対象メールを取得して {業者名: [email.Message, ...]} を返す。
+    after_uids は {業者名: 処理済みの UID}（その業者はそれより大きい UID だけを取得する）。
+    検索・取得にかかった時間、取得バイト数、検索にかかった一番大きい UID は stats に書き込む。
+    """
+    after_uids = after_uids or {}
+    owners = {}  # uid → 検索にかかった業者名のリスト（複数の業者の検索にかかることもある）
+    for source in sources:
+        start = time.perf_counter()
+        uids = _search_source(imap, source, after_uids.get(source["name"], 0))
+        stats[source["name"]]["search_sec"] = time.perf_counter() - start
+        stats[source["name"]]["last_uid"] = max(uids, default=0)
+        for uid in uids:
+            owners.setdefault(uid, []).append(source["name"])
+        log.info("%s メール %d 件が検索にヒット", source["name"], len(uids))
+    if not owners:
+        return {}
+
+    # 件名だけ先に取得して、対象外の通知（完了通知・英語版など）は本文を落とさない
+    keywords = {source["name"]: source["subject_keyword"] for source in sources}
+    wanted = {source["name"]: [] for source in sources}
+    for uid, header in _uid_fetch(imap, owners, "(BODY.PEEK[HEADER.FIELDS (SUBJECT)])"):
+        subject = decode_subject(email.message_from_bytes(header).get("Subject", ""))
+        matched = [name for name in owners[uid] if keywords[name] in subject]
+        if not matched:
+            log.debug("スキップ（対象外件名）: %s", subject)
+        for name in matched:
+            wanted[name].append(uid)
+
+    messages = {}
+    raw_by_uid = {}  # 2つの業者が同じメールを対象にしたときは本文を1回だけ取得する
+    for source in sources:
+        name = source["name"]
+        start = time.perf_counter()
+        # RFC822 の取得で既読になる（従来どおり）
+        for uid, raw in _uid_fetch(imap, [uid for uid in wanted[name] if uid not in raw_by_uid], "(RFC822)"):
+            raw_by_uid[uid] = raw
+        raws = [raw_by_uid[uid] for uid in wanted[name] if uid in raw_by_uid]
+        stats[name]["fetch_sec"] = time.perf_counter() - start
+        stats[name]["fetch_bytes"] = sum(len(raw) for raw in raws)
+        messages[name] = [email.message_from_bytes(raw) for raw in raws]
+    return messages
+
+
+def _sync_after_uids(mailbox, sources, uidvalidity, resync):
+    """業者ごとに、前回までに処理した UID（取り直すなら 0）"""
+    after_uids = {}
+    for source in sources:
+        name = source["name"]
+        after_uids[name] = 0
+        if uidvalidity is None or resync:
+            continue
+        saved_validity, last_uid = load_sync_state(mailbox, name)
+        if saved_validity == uidvalidity:
+            after_uids[name] = last_uid
+        elif saved_validity is not None:
+            log.info("%s: UIDVALIDITY が変わったため遡り期間ぶんを取り直します（%s → %s）",
+                     name, saved_validity, uidvalidity)
+    return after_uids
+
+
+def run_mail_import(app, sources=None, resync=False):
+    """
+    sources（省略時は全業者）のメールを1つの IMAP セッションで取得し、業者ごとに登録する。
+    前回までに処理したメールは取得しない（resync=True なら記録を無視して遡り期間ぶんを取り直す）。
+    戻り値は {業者名: {found, imported, skipped, search_sec, fetch_sec, fetch_bytes, register_sec, ...}}。
+    1つの業者の登録で例外が起きても、他の業者は続けて登録する（その業者の同期位置は進めない）。
+    """
+    sources = list(sources or mail_sources())
+    stats = {
+        source["name"]: {
+            "found": 0, "imported": 0, "skipped": 0,
+            "search_sec": 0.0, "fetch_sec": 0.0, "fetch_bytes": 0, "register_sec": 0.0,
+            "after_uid": 0, "last_uid": 0,
+        }
+        for source in sources
+    }
+
+    start = time.perf_counter()
+    messages = {}
+    fetched = False
+    mailbox = uidvalidity = uidnext = None
+    try:
+        imap, account = _gmail_login()
+        if imap is None:
+            return stats
+        mailbox = f"{account}/{MAIL_MAILBOX}"
+        try:
+            uidvalidity, uidnext = _select_mailbox(imap)
+            after_uids = _sync_after_uids(mailbox, sources, uidvalidity, resync)
+            for name, after_uid in after_uids.items():
+                stats[name]["after_uid"] = after_uid
+            messages = fetch_source_messages(imap, sources, stats, after_uids)
+            fetched = True
+        finally:
+            try:
+                imap.logout()
+            except Exception:
+                pass
+    except Exception as e:
+        log.error("Gmail IMAP 接続エラー: %s", e)
+    imap_sec = time.perf_counter() - start
+
+    for source in sources:
+        name = source["name"]
+        msgs = messages.get(name) or []
+        stats[name]["found"] = len(msgs)
+        if msgs:
+            start = time.perf_counter()
+            try:
+                found, imported, skipped = source["register"](app, msgs)
+                stats[name].update(found=found, imported=imported, skipped=skipped)
+            except Exception as e:
+                # 同期位置を進めないので、次の回にもう一度取得する
+                log.error("%s 取込エラー: %s", name, e)
+                stats[name]["register_sec"] = time.perf_counter() - start
+                continue
+            stats[name]["register_sec"] = time.perf_counter() - start
+        if fetched and uidvalidity is not None:
+            # 選択した時点の UIDNEXT より前のメールは検索済みなので、ヒットが無くてもそこまで進める
+            last_uid = max(stats[name]["last_uid"], stats[name]["after_uid"], (uidnext or 1) - 1)
+            try:
+                save_sync_state(mailbox, name, uidvalidity, last_uid)
+            except ClientError as e:
+                log.warning("%s の同期位置を記録できません（次の回は同じ範囲を取り直す）: %s", name, e)
+
+    for name, s in stats.items():
+        log.info(
+            "%s: %d件取得 / %d件登録 / %d件スキップ（UID %d より後 / 検索 %.2fs / 本文取得 %.2fs・%dKB / 登録 %.2fs）",
+            name, s["found"], s["imported"], s["skipped"], s["after_uid"],
+            s["search_sec"], s["fetch_sec"], s["fetch_bytes"] // 1024, s["register_sec"],
+        )
+    log.info("メール取込完了: IMAP %.2fs（%d 業者）", imap_sec, len(sources))
+    return stats
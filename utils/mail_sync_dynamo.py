@@ -0,0 +1,65 @@
+"""
+メール取込（utils/mail_import.py）の差分同期の状態。
+
+メールボックス × 業者ごとに、IMAP の UIDVALIDITY と処理済みの一番大きい UID を
+Meziro-Counters に1アイテムで持つ（counter_name = "mail_sync#<アカウント>/<メールボックス>#<業者名>"）。
+UIDVALIDITY が変わっていたら UID は使い回せないので、呼び出し側で遡り期間ぶんを取り直す。
+"""
+import logging
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+log = logging.getLogger(__name__)
+
+MAIL_SYNC_PREFIX = "mail_sync#"
+
+
+def _counter_table():
+    from utils.common_utils import counter_table
+
+    return counter_table
+
+
+def _sync_key(mailbox, vendor):
+    return f"{MAIL_SYNC_PREFIX}{mailbox}#{vendor}"
+
+
+def load_sync_state(mailbox, vendor):
+    """(uidvalidity, last_uid)。記録が無い・読めなければ (None, 0)"""
+    try:
+        item = _counter_table().get_item(Key={"counter_name": _sync_key(mailbox, vendor)}).get("Item") or {}
+    except ClientError as e:
+        log.warning("メール同期状態の読み込みに失敗（遡り期間ぶんを取り直す）: %s %s err=%s", mailbox, vendor, e)
+        return None, 0
+    if "uidvalidity" not in item:
+        return None, 0
+    return int(item["uidvalidity"]), int(item.get("last_uid") or 0)
+
+
+def save_sync_state(mailbox, vendor, uidvalidity, last_uid):
+    """処理済みの UID を記録する。UIDVALIDITY が同じなら小さい UID で巻き戻さない"""
+    table = _counter_table()
+    now = datetime.now(timezone.utc).isoformat()
+    key = {"counter_name": _sync_key(mailbox, vendor)}
+    try:
+        table.update_item(
+            Key=key,
+            UpdateExpression="SET uidvalidity = :v, last_uid = :u, synced_at = :now",
+            ConditionExpression="attribute_not_exists(uidvalidity) OR uidvalidity <> :v OR last_uid < :u",
+            ExpressionAttributeValues={":v": int(uidvalidity), ":u": int(last_uid), ":now": now},
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+            raise
+        # UID は進んでいない（同じ時刻に別のプロセスが先に記録した）ので同期時刻だけ更新する
+        table.update_item(
+            Key=key,
+            UpdateExpression="SET synced_at = :now",
+            ExpressionAttributeValues={":now": now},
+        )
+
+
+def clear_sync_state(mailbox, vendor):
+    """記録を消す（次の取込で遡り期間ぶんを取り直す）"""
+    _counter_table().delete_item(Key={"counter_name": _sync_key(mailbox, vendor)})
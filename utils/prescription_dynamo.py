@@ -0,0 +1,328 @@
+"""
+管理者用の指示書一覧（hoero-prescriptions + hoero-lab-prescriptions を新しい順に）の索引。
+
+以前は両テーブルを全件スキャンして Python で並べ替え、60件だけ表示していた。
+一覧に出す指示書にだけ次の2属性を付け、両テーブルの疎な GSI（admin_bucket + admin_created_at）で引く。
+  admin_bucket     : "ADMIN#YYYYMM"（created_at の年月でパーティションを分ける）
+  admin_created_at : "<created_at>#<prescription_id>"（同じ時刻でも順序が一意に決まる並び順のキー）
+created_at が無い・"YYYY-MM" で始まらない指示書は "ADMIN#000000" に入れ、一覧の最後（一番古い年月の後）に出す。
+通常テーブルの source が 3ds / lab のもの、ReArch- で始まる ID のものは従来どおり一覧に出さない
+（属性を付けないので GSI に載らない）。ラボテーブルの指示書はすべて出す。
+
+件数は Meziro-Counters の admin_prescriptions に持つ（put / delete のたびに増減する）。
+既存の指示書には scripts/backfill_prescription_admin_index.py で属性と件数を付ける。
+
+    put_prescription(table, item)                  # put_item の代わり
+    delete_prescription(table, prescription_id)    # delete_item の代わり
+    page = paginate_admin_prescriptions(tok=request.args.get("tok"))
+
+医院ごとの一覧（本人の一覧・管理者の医院詳細）は user_id-created_at-index と clinic_id-created_at-index を
+新しい順に少しずつ読み、2つの並びを重複を除いて合わせる（paginate_owner_prescriptions）。
+
+    page = paginate_owner_prescriptions(table, user_id=email, clinic_id=clinic_id, tok=request.args.get("tok"))
+"""
+import base64
+import heapq
+import json
+from datetime import datetime, timedelta, timezone
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from flask import current_app
+
+ADMIN_INDEX_NAME = "admin_bucket-admin_created_at-index"
+ADMIN_BUCKET_PREFIX = "ADMIN#"
+ADMIN_COUNTER_NAME = "admin_prescriptions"
+# 一覧から除外する source（通常テーブルのみ）
+ADMIN_EXCLUDED_SOURCES = ("3ds", "lab")
+LAB_ID_PREFIX = "ReArch-"
+# 件数カウンターに oldest_bucket が無いとき、どこまで遡るか
+ADMIN_INDEX_FLOOR = "202001"
+# created_at から年月が読めない指示書の入れ先（年月を遡り終えてから読む）
+ADMIN_UNDATED_MONTH = "000000"
+# 医院ごとの一覧で引く GSI（パーティションキーの属性, 索引名）
+OWNER_INDEXES = (
+    ("user_id", "user_id-created_at-index"),
+    ("clinic_id", "clinic_id-created_at-index"),
+)
+
+
+def _admin_tables():
+    """(テーブル, ラボテーブルか) の組"""
+    return (
+        (current_app.config["PRESCRIPTIONS_TABLE"], False),
+        (current_app.config["LAB_PRESCRIPTIONS_TABLE"], True),
+    )
+
+
+def _counter_table():
+    from utils.common_utils import counter_table
+
+    return counter_table
+
+
+def _month(created_at):
+    """"YYYY-MM-DD ..." → "YYYYMM"（読めなければ None）"""
+    s = str(created_at or "")
+    if len(s) >= 7 and s[:4].isdigit() and s[5:7].isdigit():
+        return s[:4] + s[5:7]
+    return None
+
+
+def admin_index_attrs(item, lab_table=False):
+    """管理者一覧に出す指示書なら GSI 用の属性（admin_bucket / admin_created_at）、出さないなら {}"""
+    pid = str(item.get("prescription_id") or "")
+    if not lab_table and (item.get("source") in ADMIN_EXCLUDED_SOURCES or pid.startswith(LAB_ID_PREFIX)):
+        return {}
+    if not pid:
+        return {}
+    created_at = str(item.get("created_at") or "")
+    return {
+        "admin_bucket": ADMIN_BUCKET_PREFIX + (_month(created_at) or ADMIN_UNDATED_MONTH),
+        "admin_created_at": f"{created_at}#{pid}",
+    }
+
+
+def _sort_key_month(sort_key):
+    """admin_created_at が入っている年月のパーティション"""
+    return _month(sort_key) or ADMIN_UNDATED_MONTH
+
+
+def _is_lab_table(table):
+    return table.name == current_app.config["LAB_PRESCRIPTIONS_TABLE"].name
+
+
+def put_prescription(table, item, lab_table=None, condition=None):
+    """
+    指示書を保存する（put_item の代わり）。管理者一覧の GSI 属性を付け直し、
+    一覧に載る・外れるが変わったときだけ件数を増減する。
+    condition は put_item の ConditionExpression（満たさなければ ClientError がそのまま送出される）。
+    """
+    if lab_table is None:
+        lab_table = _is_lab_table(table)
+    item.pop("admin_bucket", None)
+    item.pop("admin_created_at", None)
+    item.update(admin_index_attrs(item, lab_table))
+
+    put_kwargs = {"Item": item, "ReturnValues": "ALL_OLD"}
+    if condition:
+        put_kwargs["ConditionExpression"] = condition
+    old = table.put_item(**put_kwargs).get("Attributes") or {}
+    delta = int("admin_bucket" in item) - int("admin_bucket" in old)
+    if delta:
+        _adjust_admin_count(delta, item.get("admin_bucket"))
+    return item
+
+
+def delete_prescription(table, prescription_id):
+    """指示書を削除する（delete_item の代わり）。管理者一覧に載っていたら件数を減らす"""
+    old = table.delete_item(Key={"prescription_id": prescription_id}, ReturnValues="ALL_OLD").get("Attributes") or {}
+    if old.get("admin_bucket"):
+        _adjust_admin_count(-1)
+    return old
+
+
+def _adjust_admin_count(delta, bucket=None):
+    counter = _counter_table()
+    try:
+        counter.update_item(
+            Key={"counter_name": ADMIN_COUNTER_NAME},
+            UpdateExpression="ADD counter_value :d",
+            ExpressionAttributeValues={":d": delta},
+        )
+    except ClientError as e:
+        # 件数はバックフィルで数え直せるので、保存自体は失敗させない
+        current_app.logger.warning("指示書件数の更新に失敗: delta=%s err=%s", delta, e)
+        return
+    if delta > 0 and bucket and bucket != ADMIN_BUCKET_PREFIX + ADMIN_UNDATED_MONTH:
+        # 一番古い年月（一覧をどこまで遡るか）。過去日付のメール取り込みで古くなることがある
+        try:
+            counter.update_item(
+                Key={"counter_name": ADMIN_COUNTER_NAME},
+                UpdateExpression="SET oldest_bucket = :b",
+                ConditionExpression="attribute_not_exists(oldest_bucket) OR oldest_bucket > :b",
+                ExpressionAttributeValues={":b": bucket},
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                current_app.logger.warning("oldest_bucket の更新に失敗: %s", e)
+
+
+def admin_prescription_stats():
+    """(件数, 一番古い年月 "YYYYMM")"""
+    item = _counter_table().get_item(Key={"counter_name": ADMIN_COUNTER_NAME}).get("Item") or {}
+    oldest = str(item.get("oldest_bucket") or ADMIN_BUCKET_PREFIX + ADMIN_INDEX_FLOOR)
+    return max(0, int(item.get("counter_value") or 0)), oldest[len(ADMIN_BUCKET_PREFIX):]
+
+
+def _months_desc(newest, oldest):
+    """"YYYYMM" を newest から oldest まで1か月ずつ（新しい順）"""
+    y, m = int(newest[:4]), int(newest[4:])
+    while f"{y:04d}{m:02d}" >= oldest:
+        yield f"{y:04d}{m:02d}"
+        y, m = (y, m - 1) if m > 1 else (y - 1, 12)
+
+
+def _enc_tok(direction, sort_key):
+    if not sort_key:
+        return None
+    return base64.urlsafe_b64encode(json.dumps({"d": direction, "k": sort_key}).encode()).decode()
+
+
+def _dec_tok(tok):
+    if not tok:
+        return None, None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(tok.encode()).decode())
+        if payload["d"] not in ("next", "prev") or not isinstance(payload["k"], str) or not payload["k"]:
+            return None, None
+        return payload["d"], str(payload["k"])
+    except Exception:
+        return None, None
+
+
+def paginate_admin_prescriptions(tok=None, per_page=60):
+    """
+    管理者一覧をカーソル（keyset）方式でページ取得する。tok は前回結果の next_tok / prev_tok。
+    年月のパーティションを新しい方（prev なら古い方）から順に、両テーブルの GSI を1回ずつ query して
+    1ページ + 1件が集まったところで止める。年月が読めない指示書のパーティションは一番古い年月の後に読む。戻り値は items / total / has_prev / has_next / prev_tok / next_tok。
+    """
+    direction, cursor = _dec_tok(tok)
+    total, oldest = admin_prescription_stats()
+    # created_at は JST のものと UTC のものが混ざるので、1日先の年月から探す
+    newest = (datetime.now(timezone.utc) + timedelta(days=1)).strftime("%Y%m")
+    backward = direction == "prev"
+
+    cursor_month = _sort_key_month(cursor) if cursor else None
+    if backward:
+        if cursor_month == ADMIN_UNDATED_MONTH:
+            months = [ADMIN_UNDATED_MONTH, *reversed(list(_months_desc(newest, oldest)))]
+        else:
+            months = reversed(list(_months_desc(newest, cursor_month)))
+    elif cursor_month == ADMIN_UNDATED_MONTH:
+        months = [ADMIN_UNDATED_MONTH]
+    else:
+        months = [*_months_desc(cursor_month or newest, oldest), ADMIN_UNDATED_MONTH]
+
+    need = per_page + 1  # 1件多く読んで、その先があるかを判定する
+    items = []
+    for month in months:
+        key_cond = Key("admin_bucket").eq(ADMIN_BUCKET_PREFIX + month)
+        # 他の年月はまるごとカーソルより前（後）なので、カーソルの年月だけ絞る
+        if cursor and month == cursor_month:
+            key_cond &= Key("admin_created_at").gt(cursor) if backward else Key("admin_created_at").lt(cursor)
+        found = []
+        for table, _ in _admin_tables():
+            resp = table.query(
+                IndexName=ADMIN_INDEX_NAME,
+                KeyConditionExpression=key_cond,
+                ScanIndexForward=backward,
+                Limit=need - len(items),
+            )
+            found.extend(resp.get("Items", []))
+        found.sort(key=lambda x: x["admin_created_at"], reverse=not backward)
+        items.extend(found[:need - len(items)])
+        if len(items) >= need:
+            break
+
+    return _page_result(items, per_page, cursor, backward, lambda x: x["admin_created_at"], total=total)
+
+
+def _page_result(items, per_page, cursor, backward, sort_key, total=None):
+    """per_page + 1 件まで読んだ items からページの戻り値（items / total / has_prev / has_next / prev_tok / next_tok）を作る"""
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if backward:
+        # 昇順で読んだので新しい順に戻す
+        items.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = cursor is not None, has_more
+
+    return {
+        "items": items,
+        "total": total,
+        "has_prev": has_prev and bool(items),
+        "has_next": has_next and bool(items),
+        "prev_tok": _enc_tok("prev", sort_key(items[0])) if items else None,
+        "next_tok": _enc_tok("next", sort_key(items[-1])) if items else None,
+    }
+
+
+def _owner_sort_key(item):
+    """admin_created_at と同じ "<created_at>#<prescription_id>"（同じ時刻でも順序が一意に決まる）"""
+    return f"{item.get('created_at', '')}#{item.get('prescription_id', '')}"
+
+
+def _iter_owner_index(table, index_name, attr, value, cursor, backward, limit):
+    """
+    1つの GSI を cursor の先から _owner_sort_key 順に1件ずつ返す。
+    query は limit 件ずつで、LastEvaluatedKey は読み進める必要があるときだけ辿る。
+    GSI の並びは created_at だけなので、同じ created_at の指示書はまとめてから prescription_id 順に並べる。
+    """
+    key_cond = Key(attr).eq(value)
+    if cursor:
+        created_at = cursor.split("#", 1)[0]
+        key_cond &= Key("created_at").gte(created_at) if backward else Key("created_at").lte(created_at)
+    kwargs = {
+        "IndexName": index_name,
+        "KeyConditionExpression": key_cond,
+        "ScanIndexForward": backward,
+        "Limit": limit,
+    }
+
+    def flush(group):
+        group.sort(key=_owner_sort_key, reverse=not backward)
+        for item in group:
+            k = _owner_sort_key(item)
+            if not cursor or (k > cursor if backward else k < cursor):
+                yield item
+
+    group, group_at = [], None
+    while True:
+        try:
+            resp = table.query(**kwargs)
+        except ClientError as e:
+            # 索引が無いテーブル（古いラボテーブルの clinic_id 索引など）は、その並びだけ空として扱う
+            current_app.logger.warning("指示書一覧の query に失敗: table=%s index=%s err=%s", table.name, index_name, e)
+            break
+        for item in resp.get("Items", []):
+            if item.get("created_at") != group_at:
+                yield from flush(group)
+                group, group_at = [], item.get("created_at")
+            group.append(item)
+        last = resp.get("LastEvaluatedKey")
+        if not last:
+            break
+        kwargs["ExclusiveStartKey"] = last
+    yield from flush(group)
+
+
+def paginate_owner_prescriptions(table, user_id=None, clinic_id=None, tok=None, per_page=60):
+    """
+    医院の指示書（user_id が一致するもの + clinic_id が一致するもの）をカーソル（keyset）方式でページ取得する。
+    2つの GSI を新しい順に並行して読み、重複を除いて合わせ、1ページ + 1件が集まったところで止める
+    （全件を読んでから切り出すことはしない）。件数は数えないので total は None。
+    戻り値は paginate_admin_prescriptions と同じ形。
+    """
+    direction, cursor = _dec_tok(tok)
+    backward = direction == "prev"
+    need = per_page + 1  # 1件多く読んで、その先があるかを判定する
+
+    values = {"user_id": user_id, "clinic_id": clinic_id}
+    streams = [
+        _iter_owner_index(table, index_name, attr, values[attr], cursor, backward, need)
+        for attr, index_name in OWNER_INDEXES
+        if values[attr]
+    ]
+    items, seen = [], set()
+    # 同じ指示書は両方の並びで同じ位置に来るので、並べ終えたあとで ID を見て除く
+    for item in heapq.merge(*streams, key=_owner_sort_key, reverse=not backward):
+        if item["prescription_id"] in seen:
+            continue
+        seen.add(item["prescription_id"])
+        items.append(item)
+        if len(items) >= need:
+            break
+
+    return _page_result(items, per_page, cursor, backward, _owner_sort_key)
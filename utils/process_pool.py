@@ -0,0 +1,57 @@
+"""
+uwsgi ワーカーから重い処理を逃がすための ProcessPoolExecutor の共通部分。
+
+STL 変換（utils.stl_jobs）・画像処理（utils.image_jobs）・動画変換（utils.video_jobs）で使う。
+  - boto3 / スレッドを抱えたプロセスからの fork を避けて spawn で起動する
+  - uwsgi の fork 後は親のプールを引き継がず、ワーカーごとに作り直す
+  - 子プロセスが落ちて（OOM など）プールが壊れていたら作り直して1回だけ再投入する
+
+    _pool = SpawnPool(2)
+    future = _pool.submit(run_job, job)
+"""
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+def python_executable():
+    """
+    uwsgi 配下では sys.executable が uwsgi 本体になるので、python を明示する。
+    WORKER_PYTHON（以前の名前の STL_WORKER_PYTHON も読む）→ sys.exec_prefix/bin/python3 の順。
+    """
+    exe = sys.executable or ""
+    if os.path.basename(exe).startswith("python"):
+        return exe
+    return (os.getenv("WORKER_PYTHON") or os.getenv("STL_WORKER_PYTHON")
+            or os.path.join(sys.exec_prefix, "bin", "python3"))
+
+
+class SpawnPool:
+    """プロセス（pid）ごとに遅延作成する spawn の ProcessPoolExecutor"""
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self, reset=False):
+        with self._lock:
+            if reset and self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._executor is None or self._pid != os.getpid():
+                ctx = multiprocessing.get_context("spawn")
+                ctx.set_executable(python_executable())
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=ctx)
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        try:
+            return self.get().submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            return self.get(reset=True).submit(fn, *args, **kwargs)
@@ -0,0 +1,106 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# S3 マルチパートの最小パートサイズは 5MiB（最終パートを除く）
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
+
+class S3MultipartWriter:
+    """
+    書き込まれたバイト列を S3 マルチパートアップロードへ直接流す、書き込み専用のファイルライクオブジェクト。
+    zipfile.ZipFile(writer, 'w') のように非シーク出力先として使える。
+    メモリ上に持つのは part_size 分のバッファのみで、ローカルディスクには書かない。
+
+        with S3MultipartWriter(s3, bucket, key, content_type="application/zip") as w:
+            w.write(b"...")
+        # with を抜けた時点で complete 済み（例外時は abort）
+    """
+
+    def __init__(self, s3_client, bucket, key, content_type="application/octet-stream", part_size=DEFAULT_PART_SIZE):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._parts = []
+        self._closed = False
+        resp = self.s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)
+        self.upload_id = resp["UploadId"]
+
+    # --- file-like ---
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def write(self, data):
+        if self._closed:
+            raise ValueError("write to closed S3MultipartWriter")
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            chunk = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._upload_part(chunk)
+        return len(data)
+
+    def flush(self):
+        # パート境界は part_size で決まるので、ここでは何もしない
+        pass
+
+    def close(self):
+        """
+        残りのバッファを最終パートとして送り、complete する。
+        途中で失敗したらここで abort してから例外を送出する（未完了のアップロードを残さない）。
+        """
+        if self._closed:
+            return
+        try:
+            if self._buffer or not self._parts:
+                self._upload_part(bytes(self._buffer))
+                self._buffer = bytearray()
+            self.s3.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={"Parts": self._parts},
+            )
+        except Exception:
+            self.abort()
+            raise
+        self._closed = True
+        logger.info("S3 multipart complete: key=%s parts=%d size=%d", self.key, len(self._parts), self.bytes_written)
+
+    def abort(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._buffer = bytearray()
+        try:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        except Exception as e:
+            logger.error("S3 multipart abort failed: key=%s err=%s", self.key, e)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def _upload_part(self, body):
+        part_number = len(self._parts) + 1
+        resp = self.s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        self._parts.append({"PartNumber": part_number, "ETag": resp["ETag"]})
@@ -0,0 +1,69 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+
+# 1ファイルあたりの並列数 × 同時ファイル数 がコネクション数の上限になる
+UPLOAD_MAX_WORKERS = 8
+UPLOAD_PART_CONCURRENCY = 4
+UPLOAD_POOL_CONNECTIONS = UPLOAD_MAX_WORKERS * UPLOAD_PART_CONCURRENCY
+
+# DICOM スライス（数百KB）は単発PUT、口腔内スキャンなどの大きいファイルだけマルチパート
+UPLOAD_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=16 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=UPLOAD_PART_CONCURRENCY,
+    use_threads=True,
+)
+
+
+def make_s3_client(signature_version=None, **kwargs):
+    """
+    並列アップロードに足りるコネクションプールを持った S3 クライアント。
+    署名付きURLで Content-Length まで署名したいときは signature_version="s3v4" を渡す。
+    """
+    return boto3.client(
+        "s3",
+        config=Config(
+            max_pool_connections=UPLOAD_POOL_CONNECTIONS,
+            retries={"max_attempts": 5, "mode": "adaptive"},
+            signature_version=signature_version,
+        ),
+        **kwargs,
+    )
+
+
+def upload_files_concurrently(s3_client, bucket, jobs, max_workers=UPLOAD_MAX_WORKERS,
+                              transfer_config=UPLOAD_TRANSFER_CONFIG):
+    """
+    複数ファイルをスレッドプールで並列に S3 へアップロードする。
+
+    jobs: SimpleNamespace(fileobj, key, extra_args) のリスト。
+          key は str か、ワーカー内で呼ばれてキーを返す関数（キーの決定に S3 往復が要る場合）。
+    戻り値: jobs と同じ順序の SimpleNamespace(index, key, ok, error) のリスト。
+            1件失敗しても他のファイルは続行する。
+    """
+    def _upload(index, job):
+        key = None
+        try:
+            key = job.key() if callable(job.key) else job.key
+            s3_client.upload_fileobj(
+                job.fileobj, bucket, key,
+                ExtraArgs=job.extra_args or None,
+                Config=transfer_config,
+            )
+            return SimpleNamespace(index=index, key=key, ok=True, error=None)
+        except Exception as e:
+            logger.error("S3 upload failed: index=%d key=%s err=%s", index, key, e, exc_info=True)
+            return SimpleNamespace(index=index, key=key, ok=False, error=str(e))
+
+    if not jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs)), thread_name_prefix="s3-upload") as pool:
+        # map は投入順に結果を返すので、キー順序（連番）がそのまま保たれる
+        return list(pool.map(_upload, range(len(jobs)), jobs))
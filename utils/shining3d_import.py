@@ -1,13 +1,10 @@
 """
-Shining 3D の通知メールを Gmail IMAP で取得し、
+Shining 3D の通知メール（utils/mail_import.py が Gmail から取得）をパースし、
 DynamoDB の prescriptions テーブルに指示書として登録する。
 """
-import imaplib
-import email
-import os
 import re
 import logging
-from datetime import datetime, timezone, timedelta, date as date_type
+from datetime import datetime, timezone
 from email.header import decode_header, make_header
 from email.utils import parsedate_to_datetime
 import pytz
@@ -106,50 +103,14 @@ def parse_shining3d_email(msg):
     }
 
 
-def fetch_shining3d_emails():
-    gmail_user = os.getenv("GMAIL_USER", "")
-    gmail_pass = os.getenv("GMAIL_APP_PASSWORD", "").replace("-", "").replace(" ", "")
-    if not gmail_user or not gmail_pass or "xxxx" in gmail_pass:
-        log.warning("GMAIL_APP_PASSWORD が未設定のため Shining3D インポートをスキップ")
-        return []
-
-    messages = []
-    try:
-        imap = imaplib.IMAP4_SSL("imap.gmail.com")
-        imap.login(gmail_user, gmail_pass)
-        imap.select("INBOX")
-
-        since_date = (date_type.today() - timedelta(days=SHINING3D_LOOKBACK_DAYS)).strftime("%d-%b-%Y")
-        log.info("Shining3D メール検索範囲: SINCE %s", since_date)
-
-        status, data = imap.search(None, f'FROM "{SHINING3D_FROM}" SINCE {since_date}')
-        if status == "OK" and data[0]:
-            nums = data[0].split()
-            log.info("Shining3D メール %d 件を取得", len(nums))
-            for num in nums:
-                _, msg_data = imap.fetch(num, "(RFC822)")
-                msg = email.message_from_bytes(msg_data[0][1])
-                subject = _decode_subject(msg.get("Subject", ""))
-                if SHINING3D_SUBJECT_KEYWORD not in subject:
-                    log.debug("スキップ（対象外件名）: %s", subject)
-                    continue
-                messages.append(msg)
-
-        imap.logout()
-    except Exception as e:
-        log.error("Gmail IMAP 接続エラー (Shining3D): %s", e)
-
-    return messages
-
-
-def import_shining3d_emails(app):
+def register_shining3d_emails(app, messages):
     """
-    Flask app コンテキスト内で呼び出す。
+    取込パイプライン（utils/mail_import.py）で取得した Shining3D の通知メールを指示書として登録する。
     戻り値: (取得件数, 登録件数, スキップ件数)
     """
     from utils.common_utils import get_next_sequence_number
+    from utils.prescription_dynamo import put_prescription
 
-    messages = fetch_shining3d_emails()
     found = len(messages)
     if not found:
         return 0, 0, 0
@@ -226,8 +187,30 @@ def import_shining3d_emails(app):
             if data["shining3d_case_id"]:
                 item["shining3d_case_id"] = data["shining3d_case_id"]
 
-            prescriptions_table.put_item(Item=item)
+            put_prescription(prescriptions_table, item, lab_table=False)
             log.info("Shining3D 指示書を登録: No.%s chart=%s", id_str, data["chart_number"])
             imported += 1
 
     return found, imported, skipped
+
+
+def import_shining3d_emails(app, resync=False):
+    """
+    Flask app コンテキスト内で呼び出す（管理画面の手動取込）。Shining3D のメールだけを取得して登録する。
+    resync=True なら前回までの同期位置を無視して遡り期間ぶんを取り直す（登録済みのものはスキップされる）。
+    戻り値: (取得件数, 登録件数, スキップ件数)
+    """
+    from utils.mail_import import run_mail_import
+
+    stats = run_mail_import(app, [MAIL_SOURCE], resync=resync)[MAIL_SOURCE["name"]]
+    return stats["found"], stats["imported"], stats["skipped"]
+
+
+# 取込パイプライン（utils/mail_import.py）に渡す設定
+MAIL_SOURCE = {
+    "name":            "Shining3D",
+    "from":            SHINING3D_FROM,
+    "subject_keyword": SHINING3D_SUBJECT_KEYWORD,
+    "lookback_days":   SHINING3D_LOOKBACK_DAYS,
+    "register":        register_shining3d_emails,
+}
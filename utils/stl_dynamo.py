@@ -1,19 +1,63 @@
+import base64
+import json
+import threading
+import time
 import uuid
 from datetime import datetime
 from decimal import Decimal
 from flask import current_app
-from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
 
 
 # ========== Posts ==========
+# 新着順アクセス用GSI（固定パーティション + created_at_ts）
+RECENT_INDEX_NAME = "feed_pk-created_at_ts-index"
+RECENT_FEED_PK = "STL_POST"
+
+# STL → GLB 変換ジョブの状態（utils/stl_jobs.py）
+STL_STATUS_PROCESSING = "processing"
+STL_STATUS_READY = "ready"
+STL_STATUS_FAILED = "failed"
+
+# 新着GSIに載っていない投稿（バックフィル前・旧コードが書いた投稿）が残っている間は scan で一覧を作る。
+# 確認結果はプロセスごとに持ち、未完了なら STL_FEED_RECHECK_SECONDS ごとに確認し直す
+STL_FEED_RECHECK_SECONDS = 300
+_feed_state = {"ready": False, "checked_at": 0.0}
+_feed_state_lock = threading.Lock()
+
+
 def _posts_table():
     return current_app.config["STL_POSTS_TABLE"]
 
 
+def _has_media(it):
+    """STL or YouTube がある投稿か（どちらもない空投稿は False）。STL変換中の投稿も含める"""
+    return (
+        bool(it.get("stl_file_path")) or it.get("stl_status") == STL_STATUS_PROCESSING
+        or bool(it.get("youtube_id")) or bool(it.get("youtube_url")) or bool(it.get("youtube_embed_url"))
+    )
+
+
+def _media_filter():
+    return (
+        Attr("stl_file_path").exists() & Attr("stl_file_path").ne("")
+    ) | (
+        Attr("stl_status").eq(STL_STATUS_PROCESSING)
+    ) | (
+        Attr("youtube_id").exists() & Attr("youtube_id").ne("")
+    ) | (
+        Attr("youtube_url").exists() & Attr("youtube_url").ne("")
+    ) | (
+        Attr("youtube_embed_url").exists() & Attr("youtube_embed_url").ne("")
+    )
+
+
 def create_stl_post(title, content, user_id,
                     stl_filename=None, stl_file_path=None,
                     youtube_url=None, youtube_id=None, youtube_embed_url=None,
-                    image_file_path=None):  # ★追加
+                    image_file_path=None,  # ★追加
+                    stl_status=None, stl_job_id=None):
     """STL投稿を作成"""
     import uuid
     import datetime
@@ -31,6 +75,7 @@ def create_stl_post(title, content, user_id,
         "content": content,
         "created_at": created_at,
         "created_at_ts": created_at_ts,
+        "feed_pk": RECENT_FEED_PK,
     }
     
     if stl_filename:
@@ -50,6 +95,12 @@ def create_stl_post(title, content, user_id,
     # ★画像
     if image_file_path:
         item["image_file_path"] = image_file_path
+
+    # STL変換ジョブ
+    if stl_status:
+        item["stl_status"] = stl_status
+    if stl_job_id:
+        item["stl_job_id"] = stl_job_id
     
     table.put_item(Item=item)
     return post_id
@@ -61,75 +112,249 @@ def get_stl_post_by_id(post_id):
     return response.get("Item")
 
 
+def stl_feed_index_ready():
+    """
+    全投稿が feed_pk / created_at_ts を持ち、新着GSIだけで一覧を作れるか。
+    scripts/backfill_stl_posts_feed.py の実行前は False（一覧は scan にフォールバックする）。
+    一度 True になればプロセスが終わるまで確認しない。
+    """
+    if _feed_state["ready"]:
+        return True
+    with _feed_state_lock:
+        if _feed_state["ready"] or time.monotonic() - _feed_state["checked_at"] < STL_FEED_RECHECK_SECONDS:
+            return _feed_state["ready"]
+        _feed_state["checked_at"] = time.monotonic()
+        scan_kwargs = {
+            "FilterExpression": Attr("feed_pk").not_exists() | Attr("created_at_ts").not_exists(),
+            "ProjectionExpression": "post_id",
+        }
+        try:
+            missing = _scan_all(_posts_table(), **scan_kwargs)
+        except ClientError as e:
+            current_app.logger.warning("STL投稿の新着GSI確認に失敗: %s", e)
+            return False
+        if missing:
+            current_app.logger.warning(
+                "新着GSIに載っていないSTL投稿が %d 件あります。scripts/backfill_stl_posts_feed.py を実行してください"
+                "（それまで一覧は scan で作ります）", len(missing))
+            return False
+        _feed_state["ready"] = True
+        return True
+
+
 def list_stl_posts(limit=100):
+    """
+    新着順にメディア付き投稿を最大 limit 件返す。
+    GSI(feed_pk + created_at_ts) を Limit 付きで query するので、投稿総数に依存しない。
+    GSI が未作成・バックフィル前の環境では従来の scan にフォールバックする。
+    """
+    if not stl_feed_index_ready():
+        return _list_stl_posts_scan(limit)
     table = _posts_table()
-    response = table.scan()
-    items = response.get("Items", [])
-
-    # STL or YouTube がある投稿だけ残す（どちらもない空投稿は除外）
-    def has_media(it):
-        return bool(it.get("stl_file_path")) or bool(it.get("youtube_id")) or bool(it.get("youtube_url")) or bool(it.get("youtube_embed_url"))
-
-    items = [it for it in items if has_media(it)]
-
-    # created_at_ts が無い古いデータは created_at で補完（安全側）
-    def sort_key(x):
-        ts = x.get("created_at_ts")
-        if ts:
-            try:
-                return float(ts)
-            except:
-                pass
-        # created_at があればざっくり補完
-        ca = x.get("created_at", "")
-        try:
-            # isoformat の比較用に epoch に寄せる
-            import datetime
-            return datetime.datetime.fromisoformat(ca.replace("Z","+00:00")).timestamp()
-        except:
-            return 0.0
+    items = []
+    query_kwargs = {
+        "IndexName": RECENT_INDEX_NAME,
+        "KeyConditionExpression": Key("feed_pk").eq(RECENT_FEED_PK),
+        "FilterExpression": _media_filter(),
+        "ScanIndexForward": False,  # 新しい順
+        "Limit": limit,
+    }
+    try:
+        # FilterExpression は Limit の後に効くため、足りなければ次ページを読む
+        while len(items) < limit:
+            resp = table.query(**query_kwargs)
+            items.extend(resp.get("Items", []))
+            last = resp.get("LastEvaluatedKey")
+            if not last:
+                break
+            query_kwargs["ExclusiveStartKey"] = last
+    except ClientError as e:
+        current_app.logger.warning("recent index query failed, fallback to scan: %s", e)
+        return _list_stl_posts_scan(limit)
+
+    return items[:limit]
+
 
-    items.sort(key=sort_key, reverse=True)
+def _list_stl_posts_scan(limit=100):
+    """GSI 導入前の全件 scan 版（バックフィル完了までのフォールバック）"""
+    items = [it for it in _scan_all(_posts_table()) if _has_media(it)]
+    items.sort(key=_feed_sort_key, reverse=True)
     return items[:limit]
 
 
+def _feed_sort_key(item):
+    """scan で並べるときの新着順のキー（created_at_ts が無ければ created_at から求める）"""
+    return _created_at_ts(item), str(item.get("post_id", ""))
+
+
+def _created_at_ts(item):
+    """
+    created_at_ts が無い古い投稿の値を created_at から求める（scripts/backfill_stl_posts_feed.py と同じ規則）。
+    create_stl_post は utcnow().isoformat() で保存しているので、タイムゾーンの無い値は UTC とみなす。
+    """
+    ts = item.get("created_at_ts")
+    if ts is not None:
+        return int(ts)
+    ca = str(item.get("created_at") or "")
+    try:
+        import datetime
+        dt = datetime.datetime.fromisoformat(ca.replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=datetime.timezone.utc)
+        return int(dt.timestamp())
+    except ValueError:
+        return 0
+
+
 def delete_stl_post(post_id):
     table = _posts_table()
     table.delete_item(Key={"post_id": str(post_id)})
 
 
-def paginate_stl_posts(page=1, per_page=5):
-    """STL投稿をページネーション付きで取得"""
+def _feed_key(item):
+    """GSI(feed_pk + created_at_ts) 上の位置を表すキー（ExclusiveStartKey 用）"""
+    return {
+        "post_id": item["post_id"],
+        "feed_pk": RECENT_FEED_PK,
+        "created_at_ts": Decimal(str(_created_at_ts(item))),
+    }
+
+
+def _enc_tok(direction, key):
+    if not key:
+        return None
+    # Decimal は JSON にできないので文字列で持つ
+    payload = {"d": direction, "k": {**key, "created_at_ts": str(key["created_at_ts"])}}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def _dec_tok(tok):
+    if not tok:
+        return None, None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(tok.encode()).decode())
+        key = payload["k"]
+        if payload["d"] not in ("next", "prev") or set(key) != {"post_id", "feed_pk", "created_at_ts"}:
+            return None, None
+        key["created_at_ts"] = Decimal(key["created_at_ts"])
+        return payload["d"], key
+    except Exception:
+        return None, None
+
+
+def paginate_stl_posts(tok=None, per_page=5):
+    """
+    STL投稿をカーソル（keyset）方式でページ取得。
+    tok は前回結果の next_tok / prev_tok。1ページにつき GSI への query 1回のみ。
+    GSI が未作成・バックフィル前の環境では全件 scan から同じ形でページを切り出す。
+    """
     table = _posts_table()
-    resp = table.scan()
-    items = resp.get("Items", [])
-    
-    # created_at でソート（ISO形式は辞書順でソート可能）
-    items = sorted(
-        items, 
-        key=lambda x: x.get("created_at", ""),
-        reverse=True
-    )
-    
-    # ページネーション処理
-    total = len(items)
-    start = (page - 1) * per_page
-    end = start + per_page
-    page_items = items[start:end]
-    
-    pages = max(1, (total + per_page - 1) // per_page)
-    
+    direction, start_key = _dec_tok(tok)
+    if not stl_feed_index_ready():
+        return _paginate_stl_posts_scan(direction, start_key, per_page)
+
+    query_kwargs = {
+        "IndexName": RECENT_INDEX_NAME,
+        "KeyConditionExpression": Key("feed_pk").eq(RECENT_FEED_PK),
+        # 1件多く読んで、その先があるかを判定する
+        "Limit": per_page + 1,
+        "ScanIndexForward": direction == "prev",
+    }
+    if start_key:
+        query_kwargs["ExclusiveStartKey"] = start_key
+
+    try:
+        items = table.query(**query_kwargs).get("Items", [])
+    except ClientError as e:
+        current_app.logger.warning("recent index query failed, fallback to scan: %s", e)
+        return _paginate_stl_posts_scan(direction, start_key, per_page)
+    return _stl_page(items, direction, start_key, per_page)
+
+
+def _paginate_stl_posts_scan(direction, start_key, per_page):
+    """paginate_stl_posts の全件 scan 版（GSI 導入前・バックフィル完了までのフォールバック）"""
+    items = sorted(_scan_all(_posts_table()), key=_feed_sort_key, reverse=direction != "prev")
+    if start_key:
+        cursor = (int(start_key["created_at_ts"]), str(start_key["post_id"]))
+        if direction == "prev":
+            items = [it for it in items if _feed_sort_key(it) > cursor]
+        else:
+            items = [it for it in items if _feed_sort_key(it) < cursor]
+    return _stl_page(items[:per_page + 1], direction, start_key, per_page)
+
+
+def _stl_page(items, direction, start_key, per_page):
+    """per_page + 1 件まで読んだ items（prev なら古い順）からページの戻り値を作る"""
+    has_more = len(items) > per_page
+    items = items[:per_page]
+
+    if direction == "prev":
+        # 昇順で読んだので新しい順に戻す
+        items.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = start_key is not None, has_more
+
     return {
-        "items": page_items,
-        "page": page,
-        "pages": pages,
-        "has_prev": page > 1,
-        "has_next": page < pages,
-        "prev_num": page - 1 if page > 1 else None,
-        "next_num": page + 1 if page < pages else None,
+        "items": items,
+        "has_prev": has_prev and bool(items),
+        "has_next": has_next and bool(items),
+        "prev_tok": _enc_tok("prev", _feed_key(items[0])) if items else None,
+        "next_tok": _enc_tok("next", _feed_key(items[-1])) if items else None,
     }
 
 
+# ========== post_id 単位のアクセス ==========
+COMMENTS_BY_POST_INDEX = "post_id-created_at_ts-index"
+LIKES_BY_POST_INDEX = "post_id-user_id-index"
+
+
+def _query_all(table, **query_kwargs):
+    """LastEvaluatedKey を辿って query 結果を全部返す"""
+    items = []
+    while True:
+        resp = table.query(**query_kwargs)
+        items.extend(resp.get("Items", []))
+        last = resp.get("LastEvaluatedKey")
+        if not last:
+            return items
+        query_kwargs["ExclusiveStartKey"] = last
+
+
+def _scan_all(table, **scan_kwargs):
+    items = []
+    while True:
+        resp = table.scan(**scan_kwargs)
+        items.extend(resp.get("Items", []))
+        last = resp.get("LastEvaluatedKey")
+        if not last:
+            return items
+        scan_kwargs["ExclusiveStartKey"] = last
+
+
+def _query_by_post(table, index_name, key_condition, filter_expression):
+    """post_id GSI で query。GSI が未作成なら同条件の scan にフォールバック"""
+    try:
+        return _query_all(table, IndexName=index_name, KeyConditionExpression=key_condition)
+    except ClientError as e:
+        current_app.logger.warning("%s query failed, fallback to scan: %s", index_name, e)
+        return _scan_all(table, FilterExpression=filter_expression)
+
+
+def load_comments_and_likes(post_ids):
+    """
+    表示する投稿ぶんのコメント・いいねだけを読む。
+    戻り値: (comments_by_post, likes_by_post)  いずれも {post_id: [item, ...]}
+    読み込み回数は post_ids の件数に比例し、テーブル全体の件数には依存しない。
+    """
+    comments_by_post = {}
+    likes_by_post = {}
+    for post_id in dict.fromkeys(str(pid) for pid in post_ids if pid):
+        comments_by_post[post_id] = get_comments_by_post(post_id)
+        likes_by_post[post_id] = get_likes_by_post(post_id)
+    return comments_by_post, likes_by_post
+
+
 # ========== Comments ==========
 def _comments_table():
     return current_app.config["STL_COMMENTS_TABLE"]
@@ -156,10 +381,12 @@ def create_stl_comment(post_id, user_id, content, parent_comment_id=None):
 
 def get_comments_by_post(post_id):
     table = _comments_table()
-    response = table.scan(
-        FilterExpression=Attr("post_id").eq(str(post_id))
+    items = _query_by_post(
+        table,
+        COMMENTS_BY_POST_INDEX,
+        Key("post_id").eq(str(post_id)),
+        Attr("post_id").eq(str(post_id)),
     )
-    items = response.get("Items", [])
     items.sort(key=lambda x: float(x.get("created_at_ts", 0)))
     return items
 
@@ -200,10 +427,12 @@ def create_stl_like(post_id, user_id):
 
 def get_like_by_post_and_user(post_id, user_id):
     table = _likes_table()
-    response = table.scan(
-        FilterExpression=Attr("post_id").eq(str(post_id)) & Attr("user_id").eq(str(user_id))
+    items = _query_by_post(
+        table,
+        LIKES_BY_POST_INDEX,
+        Key("post_id").eq(str(post_id)) & Key("user_id").eq(str(user_id)),
+        Attr("post_id").eq(str(post_id)) & Attr("user_id").eq(str(user_id)),
     )
-    items = response.get("Items", [])
     return items[0] if items else None
 
 
@@ -214,10 +443,12 @@ def delete_stl_like(like_id):
 
 def get_likes_by_post(post_id):
     table = _likes_table()
-    response = table.scan(
-        FilterExpression=Attr("post_id").eq(str(post_id))
+    return _query_by_post(
+        table,
+        LIKES_BY_POST_INDEX,
+        Key("post_id").eq(str(post_id)),
+        Attr("post_id").eq(str(post_id)),
     )
-    return response.get("Items", [])
 
 
 def get_all_likes():
@@ -242,11 +473,22 @@ def update_stl_post(post_id, title, content,
 
     table = _posts_table()
 
-    update_expr = "SET title = :title, content = :content, updated_at = :updated_at"
+    # feed_pk / created_at_ts も書き込み、新着GSIに必ず載るようにする。
+    # created_at_ts の無い古い投稿は投稿日時（created_at）から求める（編集した時刻にすると一覧の先頭に来てしまう）
+    current = table.get_item(
+        Key={"post_id": post_id},
+        ProjectionExpression="created_at, created_at_ts",
+    ).get("Item") or {}
+    update_expr = (
+        "SET title = :title, content = :content, updated_at = :updated_at"
+        ", feed_pk = :feed_pk, created_at_ts = if_not_exists(created_at_ts, :created_ts)"
+    )
     expr_values = {
         ":title": title,
         ":content": content,
-        ":updated_at": datetime.datetime.utcnow().isoformat()
+        ":updated_at": datetime.datetime.utcnow().isoformat(),
+        ":feed_pk": RECENT_FEED_PK,
+        ":created_ts": _created_at_ts(current),
     }
 
     if stl_filename:
@@ -278,4 +520,225 @@ def update_stl_post(post_id, title, content,
         Key={"post_id": post_id},
         UpdateExpression=update_expr,
         ExpressionAttributeValues=expr_values
-    )
\ No newline at end of file
+    )
+
+
+# ========== STL変換ジョブ ==========
+def start_stl_mesh_job(post_id, job_id):
+    """既存投稿のSTL差し替え時: 変換中にして job_id を記録する（既存のGLBは完了まで表示を続ける）"""
+    _posts_table().update_item(
+        Key={"post_id": str(post_id)},
+        UpdateExpression="SET stl_status = :st, stl_job_id = :job REMOVE stl_error",
+        ExpressionAttributeValues={":st": STL_STATUS_PROCESSING, ":job": job_id},
+        ConditionExpression=Attr("post_id").exists(),
+    )
+
+
+def _update_if_current_job(table, post_id, job_id, update_expr, expr_values):
+    """投稿の stl_job_id が job_id のままなら更新する。再編集・削除済みなら False"""
+    try:
+        table.update_item(
+            Key={"post_id": str(post_id)},
+            UpdateExpression=update_expr,
+            ExpressionAttributeValues=expr_values,
+            ConditionExpression=Attr("stl_job_id").eq(job_id),
+        )
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+            return False
+        raise
+
+
+def _to_dynamo_value(value):
+    """float は DynamoDB に書けないので Decimal にする（入れ子の dict / list も）"""
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {k: _to_dynamo_value(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_to_dynamo_value(v) for v in value]
+    return value
+
+
+def finish_stl_mesh_job(post_id, job_id, stl_filename, stl_file_path, lod_keys=None,
+                        lod_stats=None, glb_mode=None, content_hash=None, thumbnail_key=None, table=None):
+    """
+    変換完了: GLB のパスを書き込んで ready にする（ワーカープロセスからは table を渡す）。
+    stl_file_path は従来どおりフル解像度の GLB、stl_lod に {"full", "preview", "thumb"} のキーを持つ。
+    stl_lod_stats にはレベルごとのサイズ・圧縮率・エンコード/デコード時間を残す。
+    stl_content_hash は変換結果キャッシュのキー（GLB は他の投稿と共有している場合がある）。
+    stl_thumbnail は一覧表示用のサムネイル画像（描画できなかった場合は持たない）。
+    """
+    update_expr = (
+        "SET stl_filename = :fn, stl_file_path = :path, gltf_file_path = :path, stl_lod = :lod,"
+        " stl_lod_stats = :stats, stl_glb_mode = :mode, stl_status = :st"
+    )
+    expr_values = {
+        ":fn": stl_filename, ":path": stl_file_path, ":lod": lod_keys or {"full": stl_file_path},
+        ":stats": _to_dynamo_value(lod_stats or {}), ":mode": glb_mode or "standard",
+        ":st": STL_STATUS_READY,
+    }
+    removes = ["stl_error"]
+    if content_hash:
+        update_expr += ", stl_content_hash = :hash"
+        expr_values[":hash"] = content_hash
+    else:
+        removes.append("stl_content_hash")
+    if thumbnail_key:
+        update_expr += ", stl_thumbnail = :thumb"
+        expr_values[":thumb"] = thumbnail_key
+    else:
+        removes.append("stl_thumbnail")
+    update_expr += " REMOVE " + ", ".join(removes)
+    return _update_if_current_job(table or _posts_table(), post_id, job_id, update_expr, expr_values)
+
+
+def stl_lod_keys(item):
+    """
+    投稿の LOD ごとの GLB キー。欠けているレベルは1つ上のレベルで代用する
+    （LOD 導入前の投稿は全レベルが stl_file_path になる）。
+    """
+    lod = dict(item.get("stl_lod") or {})
+    full = lod.get("full") or item.get("stl_file_path") or ""
+    preview = lod.get("preview") or full
+    thumb = lod.get("thumb") or preview
+    return {"full": full, "preview": preview, "thumb": thumb}
+
+
+def all_stl_glb_keys(item):
+    """投稿が参照している GLB・サムネイル画像のキーすべて（削除・差し替え用）"""
+    keys = set((item.get("stl_lod") or {}).values())
+    for attr in ("stl_file_path", "stl_thumbnail"):
+        if item.get(attr):
+            keys.add(item[attr])
+    return sorted(k for k in keys if k)
+
+
+def fail_stl_mesh_job(post_id, job_id, error, table=None):
+    """変換失敗: failed にしてエラー内容を残す"""
+    return _update_if_current_job(
+        table or _posts_table(), post_id, job_id,
+        "SET stl_status = :st, stl_error = :err",
+        {":st": STL_STATUS_FAILED, ":err": str(error)[:500]},
+    )
+
+
+# ========== STL変換結果のキャッシュ ==========
+# STL の内容ハッシュ（utils.stl_mesh.stl_content_hash）ごとに、変換済み GLB（LOD 含む）のキーと
+# それを参照している投稿の数を持つ。同じスキャンの再アップロードは変換せずに GLB を使い回し、
+# 参照数が 0 になったときだけ GLB を削除する。
+# GLB のキーには変換ごとの generation を含めるので、参照数が 0 になった世代の GLB を消している間に
+# 同じ内容が変換し直されても、新しい世代の GLB は別のキーになり消されない。
+def _mesh_cache_table():
+    return current_app.config["STL_MESH_CACHE_TABLE"]
+
+
+def _is_condition_failed(e):
+    return e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException"
+
+
+def acquire_stl_mesh_cache(content_hash, table=None):
+    """変換済みなら参照数を1増やしてエントリ（lod / lod_stats / glb_mode / thumbnail）を返す。無ければ None"""
+    try:
+        resp = (table or _mesh_cache_table()).update_item(
+            Key={"content_hash": content_hash},
+            UpdateExpression="ADD ref_count :one",
+            ConditionExpression=Attr("content_hash").exists() & Attr("ref_count").gt(0),
+            ExpressionAttributeValues={":one": 1},
+            ReturnValues="ALL_NEW",
+        )
+    except ClientError as e:
+        if _is_condition_failed(e):
+            return None
+        raise
+    return resp["Attributes"]
+
+
+def register_stl_mesh_cache(content_hash, generation, lod_keys, lod_stats=None, glb_mode=None,
+                            thumbnail_key=None, table=None, attempts=3):
+    """
+    変換した GLB（とサムネイル画像）を generation の世代として登録し、参照数 1 で使い始める。
+    同じ内容を同時に変換した別のジョブが先に登録していたら、そちらの参照数を1増やす。
+    戻り値は (使うエントリ, 登録したか)。登録しなかった場合、呼び出し側は自分がアップロードした
+    GLB を削除してエントリの lod / thumbnail を使う。
+    """
+    table = table or _mesh_cache_table()
+    entry = {
+        "lod": lod_keys, "lod_stats": _to_dynamo_value(lod_stats or {}), "glb_mode": glb_mode or "standard",
+        "thumbnail": thumbnail_key or "", "generation": generation,
+    }
+    for _ in range(attempts):
+        try:
+            # 参照数が 0 の行は削除待ちの古い世代なので上書きしてよい（古い世代の GLB は別のキー）
+            table.update_item(
+                Key={"content_hash": content_hash},
+                UpdateExpression="SET lod = :lod, lod_stats = :stats, glb_mode = :mode, thumbnail = :thumb,"
+                                 " generation = :gen, ref_count = :one, created_at = :now",
+                ConditionExpression=Attr("content_hash").not_exists() | Attr("ref_count").lte(0),
+                ExpressionAttributeValues={
+                    ":lod": entry["lod"], ":stats": entry["lod_stats"], ":mode": entry["glb_mode"],
+                    ":thumb": entry["thumbnail"], ":gen": generation, ":one": 1,
+                    ":now": datetime.utcnow().isoformat(),
+                },
+            )
+            return entry, True
+        except ClientError as e:
+            if not _is_condition_failed(e):
+                raise
+        cached = acquire_stl_mesh_cache(content_hash, table=table)
+        if cached:
+            return cached, False
+        # 先に登録された世代が直後に参照数 0 になった → もう一度登録を試みる
+    raise RuntimeError(f"STL変換結果キャッシュを登録できません: {content_hash}")
+
+
+def release_stl_mesh_cache(content_hash, table=None):
+    """
+    参照数を1減らす。最後の参照だったらその世代の GLB キーを返す（S3 から削除してよい）。
+    まだ他の投稿が参照していれば空リスト。
+    参照数が 0 になった世代は acquire できないので、エントリの行を消す前に同じ内容が
+    登録し直されていても、返すキー（古い世代のもの）は新しい世代と重ならない。
+    """
+    table = table or _mesh_cache_table()
+    try:
+        resp = table.update_item(
+            Key={"content_hash": content_hash},
+            UpdateExpression="ADD ref_count :minus",
+            ConditionExpression=Attr("content_hash").exists() & Attr("ref_count").gt(0),
+            ExpressionAttributeValues={":minus": -1},
+            ReturnValues="ALL_NEW",
+        )
+    except ClientError as e:
+        if _is_condition_failed(e):
+            return []
+        raise
+
+    attrs = resp["Attributes"]
+    if attrs.get("ref_count", 0) > 0:
+        return []
+    # 同じ世代のまま参照数 0 のときだけ行を消す（登録し直されていたら新しい世代の行を残す）
+    if attrs.get("generation"):
+        same_generation = Attr("generation").eq(attrs["generation"])
+    else:
+        same_generation = Attr("generation").not_exists()
+    try:
+        table.delete_item(Key={"content_hash": content_hash},
+                          ConditionExpression=Attr("ref_count").lte(0) & same_generation)
+    except ClientError as e:
+        if not _is_condition_failed(e):
+            raise
+    keys = set((attrs.get("lod") or {}).values())
+    keys.add(attrs.get("thumbnail"))
+    return sorted(k for k in keys if k)
+
+
+def release_post_glb_keys(item, cache_table=None):
+    """
+    投稿が参照している GLB のうち、S3 から削除してよいキー（投稿の削除・STL差し替え用）。
+    キャッシュ経由の投稿は参照数を減らし、他の投稿が使っていなければそのキーを返す。
+    キャッシュ導入前の投稿は GLB を共有していないので、すべてのキーを返す。
+    """
+    if item.get("stl_content_hash"):
+        return release_stl_mesh_cache(item["stl_content_hash"], table=cache_table)
+    return all_stl_glb_keys(item)
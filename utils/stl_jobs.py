@@ -0,0 +1,248 @@
+"""
+STL → GLB 変換のローカルジョブキュー。
+
+リクエスト処理中に trimesh で変換すると、大きなフルアーチスキャンで uwsgi ワーカーが
+数十秒ふさがるため、変換・S3アップロード・投稿の更新は別プロセスで行う。
+
+    job_id = new_stl_job_id()
+    post_id = create_stl_post(..., stl_status="processing", stl_job_id=job_id)
+    submit_stl_conversion(post_id, job_id, stl_file, glb_filename)
+
+投稿の stl_status は processing → ready / failed と遷移する。
+ワーカーは自分の job_id が投稿に残っている場合だけ結果を書き込むので、
+変換中に再編集されても古いジョブの結果で上書きされない。
+
+GLB は STL の内容ハッシュと変換ごとの generation をキーにして保存し、同じ内容・同じ形式の
+変換結果があれば変換せずに使い回す（参照数は utils.stl_dynamo の変換結果キャッシュで管理する）。
+"""
+import logging
+import os
+import tempfile
+import uuid
+
+import boto3
+from dotenv import load_dotenv
+
+from utils.stl_dynamo import (
+    acquire_stl_mesh_cache,
+    fail_stl_mesh_job,
+    finish_stl_mesh_job,
+    register_stl_mesh_cache,
+    release_post_glb_keys,
+    release_stl_mesh_cache,
+)
+from utils.stl_mesh import DEFAULT_GLB_MODE, GLB_MODES, build_stl_assets, stl_content_hash
+from utils.process_pool import SpawnPool
+from utils.stl_render import THUMBNAIL_CONTENT_TYPE, THUMBNAIL_EXT
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# uwsgi ワーカー1つあたりの変換プロセス数
+STL_JOB_WORKERS = int(os.getenv("STL_JOB_WORKERS", "1"))
+# アップロードされた STL をワーカーに渡すまで置いておく場所
+STL_JOB_SPOOL_DIR = os.getenv("STL_JOB_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "stl_jobs"))
+GLB_CONTENT_TYPE = "model/gltf-binary"
+# 変換済み GLB・サムネイル画像の置き場所（ファイル名は STL の内容ハッシュ + generation）
+STL_GLB_PREFIX = "STL-board/mesh/"
+
+_pool = SpawnPool(STL_JOB_WORKERS)
+
+
+def new_stl_job_id():
+    return uuid.uuid4().hex
+
+
+def cached_glb_key(content_hash, generation):
+    """内容ハッシュと変換の世代からフル解像度の GLB キーを作る（LOD は lod_glb_key で派生させる）"""
+    return f"{STL_GLB_PREFIX}{content_hash}_{generation}.glb"
+
+
+def thumbnail_key_for(glb_key):
+    """GLB と同じ場所に置くサムネイル画像のキー"""
+    return os.path.splitext(glb_key)[0] + THUMBNAIL_EXT
+
+
+def lod_glb_key(glb_key, level):
+    """フル解像度の GLB キーから LOD ごとのキーを作る（full はそのまま）"""
+    if level == "full":
+        return glb_key
+    base, ext = os.path.splitext(glb_key)
+    return f"{base}_{level}{ext}"
+
+
+def submit_stl_conversion(post_id, job_id, stl_file, glb_filename, old_item=None,
+                          glb_mode=DEFAULT_GLB_MODE):
+    """
+    アップロードされた STL（FileStorage）をスプールに保存し、変換ジョブを投入する。
+    投稿はあらかじめ stl_status="processing" / stl_job_id=job_id にしておくこと。
+    glb_filename はダウンロード時のファイル名（S3 のキーは内容ハッシュで決まる）。
+    old_item は差し替え前の投稿。新しい GLB ができた後に、他の投稿が使っていなければ古い GLB を削除する。
+    glb_mode は utils.stl_mesh.GLB_MODES のいずれか（量子化するか等）。
+    """
+    from flask import current_app
+
+    os.makedirs(STL_JOB_SPOOL_DIR, exist_ok=True)
+    stl_path = os.path.join(STL_JOB_SPOOL_DIR, f"{job_id}.stl")
+    stl_file.save(stl_path)
+
+    job = {
+        "post_id": post_id,
+        "job_id": job_id,
+        "stl_path": stl_path,
+        "glb_filename": glb_filename,
+        # 古い GLB の解放に必要な属性だけ渡す
+        "old_item": {k: v for k, v in (old_item or {}).items()
+                     if k in ("stl_file_path", "stl_lod", "stl_thumbnail", "stl_content_hash")},
+        "glb_mode": glb_mode if glb_mode in GLB_MODES else DEFAULT_GLB_MODE,
+        "bucket": os.getenv("BUCKET_NAME"),
+    }
+    table = current_app.config["STL_POSTS_TABLE"]
+
+    # 変換プロセスが落ちていた（OOM など）ときはプールを作り直して1回だけ再投入する
+    future = _pool.submit(run_stl_job, job)
+
+    def _on_done(fut):
+        # ワーカー側で例外を握っているので、ここに来るのはプロセスごと落ちた場合
+        exc = fut.exception()
+        if exc is None:
+            return
+        logger.error("STL job crashed: post_id=%s job_id=%s err=%s", post_id, job_id, exc)
+        try:
+            fail_stl_mesh_job(post_id, job_id, f"{type(exc).__name__}: {exc}", table=table)
+        except Exception:
+            logger.exception("STL job failure could not be recorded: post_id=%s", post_id)
+        _remove(stl_path)
+
+    future.add_done_callback(_on_done)
+    logger.info("STL job submitted: post_id=%s job_id=%s file=%s", post_id, job_id, glb_filename)
+    return future
+
+
+# ==============================
+# 以下はワーカープロセス側
+# ==============================
+_worker_s3 = None
+_worker_table = None
+_worker_cache_table = None
+
+
+def _worker_clients():
+    global _worker_s3, _worker_table, _worker_cache_table
+    if _worker_s3 is None:
+        region = os.getenv("AWS_REGION", "ap-northeast-1")
+        _worker_s3 = boto3.client(
+            "s3",
+            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+            region_name=region,
+        )
+        dynamodb = boto3.resource("dynamodb", region_name=region)
+        _worker_table = dynamodb.Table(os.getenv("STL_POSTS_TABLE_NAME", "hoero-stl-posts"))
+        _worker_cache_table = dynamodb.Table(os.getenv("STL_MESH_CACHE_TABLE_NAME", "hoero-stl-mesh-cache"))
+    return _worker_s3, _worker_table, _worker_cache_table
+
+
+def _remove(path):
+    try:
+        if path and os.path.exists(path):
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def run_stl_job(job):
+    """
+    STL → LOD ごとの GLB とサムネイル画像の作成（キャッシュがあれば再利用）、S3 アップロード、
+    投稿の更新（ワーカープロセスで実行）
+    """
+    s3, table, cache_table = _worker_clients()
+    post_id, job_id = job["post_id"], job["job_id"]
+    bucket, glb_mode = job["bucket"], job["glb_mode"]
+    uploaded = []
+    acquired = None  # 参照数を1増やした変換結果キャッシュ
+
+    try:
+        content_hash = stl_content_hash(job["stl_path"], glb_mode)
+        cached = acquire_stl_mesh_cache(content_hash, table=cache_table)
+        if cached:
+            acquired = content_hash
+            lod_keys = dict(cached["lod"])
+            lod_stats = cached.get("lod_stats") or {}
+            thumbnail_key = cached.get("thumbnail") or None
+            logger.info("STL job cache hit: post_id=%s hash=%s", post_id, content_hash)
+        else:
+            lod_keys = {}
+            lod_stats = {}
+            thumbnail_key = None
+            generation = uuid.uuid4().hex[:12]
+            assets = build_stl_assets(job["stl_path"], mode=glb_mode)
+            for level, glb_data, faces, stats in assets.lods:
+                key = lod_glb_key(cached_glb_key(content_hash, generation), level)
+                s3.put_object(Bucket=bucket, Key=key, Body=glb_data, ContentType=GLB_CONTENT_TYPE)
+                uploaded.append(key)
+                lod_keys[level] = key
+                lod_stats[level] = dict(stats, faces=faces)
+                logger.info("STL job LOD uploaded: post_id=%s level=%s faces=%d stats=%s", post_id, level, faces, stats)
+            if assets.thumbnail:
+                thumbnail_key = thumbnail_key_for(cached_glb_key(content_hash, generation))
+                s3.put_object(Bucket=bucket, Key=thumbnail_key, Body=assets.thumbnail,
+                              ContentType=THUMBNAIL_CONTENT_TYPE)
+                uploaded.append(thumbnail_key)
+            entry, registered = register_stl_mesh_cache(content_hash, generation, lod_keys, lod_stats, glb_mode,
+                                                        thumbnail_key, table=cache_table)
+            acquired = content_hash
+            if not registered:
+                # 同じ内容を同時に変換した別のジョブが先に登録していた → そちらを使う
+                logger.info("STL job lost cache race: post_id=%s hash=%s", post_id, content_hash)
+                _delete_keys(s3, bucket, uploaded)
+                lod_keys = dict(entry["lod"])
+                lod_stats = entry.get("lod_stats") or {}
+                thumbnail_key = entry.get("thumbnail") or None
+            uploaded = []  # 以降の削除は参照数に任せる
+
+        if not finish_stl_mesh_job(post_id, job_id, job["glb_filename"], lod_keys["full"],
+                                   lod_keys=lod_keys, lod_stats=lod_stats, glb_mode=glb_mode,
+                                   content_hash=content_hash, thumbnail_key=thumbnail_key, table=table):
+            # 変換中に再編集・削除された → このジョブの参照は不要
+            logger.info("STL job superseded: post_id=%s job_id=%s", post_id, job_id)
+            released, acquired = acquired, None
+            _delete_keys(s3, bucket, release_stl_mesh_cache(released, table=cache_table))
+            return {"post_id": post_id, "job_id": job_id, "status": "superseded"}
+
+        # ここから先で失敗しても投稿は ready のまま（参照も投稿のもの）なので、ログだけ残す
+        acquired = None
+        _release_replaced_glb(s3, bucket, post_id, job.get("old_item") or {},
+                              set(lod_keys.values()) | {thumbnail_key}, cache_table)
+
+        logger.info("STL job done: post_id=%s lod=%s cached=%s", post_id, lod_keys, bool(cached))
+        return {"post_id": post_id, "job_id": job_id, "status": "ready"}
+
+    except Exception as e:
+        logger.error("STL job failed: post_id=%s job_id=%s err=%s", post_id, job_id, e, exc_info=True)
+        _delete_keys(s3, bucket, uploaded)
+        if acquired:
+            _delete_keys(s3, bucket, release_stl_mesh_cache(acquired, table=cache_table))
+        fail_stl_mesh_job(post_id, job_id, str(e), table=table)
+        return {"post_id": post_id, "job_id": job_id, "status": "failed"}
+
+    finally:
+        _remove(job["stl_path"])
+
+
+def _release_replaced_glb(s3, bucket, post_id, old_item, keep, cache_table):
+    """差し替え前の GLB の参照を外して消す（同じ内容の再アップロードなら参照数が戻るだけで消えない）"""
+    try:
+        old_keys = release_post_glb_keys(old_item, cache_table=cache_table)
+        _delete_keys(s3, bucket, [k for k in old_keys if k not in keep])
+    except Exception as e:
+        logger.warning("差し替え前の GLB の後片付けエラー: post_id=%s err=%s", post_id, e)
+
+
+def _delete_keys(s3, bucket, keys):
+    for key in keys:
+        try:
+            s3.delete_object(Bucket=bucket, Key=key)
+        except Exception as e:
+            logger.warning("古いファイル削除エラー: key=%s err=%s", key, e)
@@ -0,0 +1,297 @@
+import hashlib
+import io
+import json
+import struct
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import trimesh
+from trimesh.visual.material import PBRMaterial
+
+from utils.stl_io import load_stl_fast, write_binary_stl
+from utils.stl_render import render_mesh_thumbnail
+
+# LOD（詳細度）ピラミッド: (レベル名, 目標三角形数)。None は元メッシュのまま
+# 掲示板の一覧・トップページは thumb → preview、詳細ページは preview → full の順に読み込む
+STL_LOD_LEVELS = (
+    ("full", None),
+    ("preview", 70000),
+    ("thumb", 5000),
+)
+# 一覧表示用のサムネイル画像を描画するメッシュの最大三角形数（preview レベルから描画する）
+STL_THUMBNAIL_MAX_FACES = 70000
+
+
+def reduce_stl_size(input_file_path, output_file_path, target_faces=70000):
+    """Trimeshを使った軽量化"""
+
+    mesh = load_stl_fast(input_file_path)
+    current_faces = len(mesh.faces)
+
+    if current_faces > target_faces:
+        print(f"[軽量化開始] 入力三角形面数: {current_faces} → 目標: {target_faces}")
+
+        # Trimeshの簡略化機能を使用
+        # 第1引数は削減率（percent）なので、目標面数はキーワードで渡す
+        mesh = mesh.simplify_quadric_decimation(face_count=target_faces)
+
+        new_faces = len(mesh.faces)
+        print(f"[軽量化完了] 変換後の三角形面数: {new_faces}")
+    else:
+        print(f"[軽量化不要] 三角形面数: {current_faces} ({target_faces} 以下)")
+
+    if output_file_path.lower().endswith(".stl"):
+        write_binary_stl(output_file_path, mesh.vertices, mesh.faces)
+    else:
+        mesh.export(output_file_path)
+
+    return {
+        'original_faces': current_faces,
+        'new_faces': len(mesh.faces)
+    }
+
+
+def load_stl_mesh(input_stl_path):
+    """STLを1つの Trimesh として読み込む（Scene の場合は結合）。バイナリSTLは memmap で高速に読む"""
+    loaded = load_stl_fast(input_stl_path)
+    if isinstance(loaded, trimesh.Scene):
+        geoms = [g for g in loaded.geometry.values() if isinstance(g, trimesh.Trimesh)]
+        if not geoms:
+            raise ValueError("Scene内にTrimeshジオメトリがありません")
+        mesh = trimesh.util.concatenate(geoms)
+    else:
+        mesh = loaded
+
+    if not isinstance(mesh, trimesh.Trimesh) or mesh.faces is None or len(mesh.faces) == 0:
+        raise ValueError("faces を持たないメッシュのため material を設定できません")
+    return mesh
+
+
+# GLB の出力形式（投稿ごとに選択）
+#   standard       : trimesh の標準出力（float32 の位置・法線、uint32 インデックス）
+#   quantized      : 頂点を溶接し、位置を16bit・法線を8bitに量子化（KHR_mesh_quantization）
+#   quantized_flat : quantized から法線も省く（ビューアー側でフラット法線を計算する。最小だが面が角ばって見える）
+GLB_MODE_STANDARD = "standard"
+GLB_MODE_QUANTIZED = "quantized"
+GLB_MODE_QUANTIZED_FLAT = "quantized_flat"
+GLB_MODES = (GLB_MODE_QUANTIZED, GLB_MODE_QUANTIZED_FLAT, GLB_MODE_STANDARD)
+DEFAULT_GLB_MODE = GLB_MODE_QUANTIZED
+
+# 変換結果キャッシュのキーに含める変換処理のバージョン。
+# 同じ STL・同じ形式でも出力される GLB やサムネイルが変わる修正（マテリアル・量子化など）をしたら上げる
+STL_CONVERTER_VERSION = 2
+
+# 掲示板表示用のマテリアル（グレー・ややツヤあり）
+BOARD_BASE_COLOR = [50/255, 50/255, 50/255, 1.0]
+BOARD_METALLIC = 0.0
+BOARD_ROUGHNESS = 0.25
+
+
+def mesh_to_glb(mesh):
+    """掲示板表示用のマテリアルを付けて GLB バイト列にする"""
+    # ★ここが光沢調整（PBR）
+    mat = PBRMaterial(
+        baseColorFactor=BOARD_BASE_COLOR,  # グレー（0〜1）
+        metallicFactor=BOARD_METALLIC,     # 金属っぽさ（0=非金属）
+        roughnessFactor=BOARD_ROUGHNESS    # ★ツヤ：低いほどテカる（0.05〜0.3がツヤ強め）
+    )
+
+    # face_colors を使わず material で色+光沢を指定
+    mesh.visual.material = mat
+
+    scene = trimesh.Scene(mesh)
+    return scene.export(file_type='glb')
+
+
+def _pad4(data, fill=b"\x00"):
+    return data + fill * (-len(data) % 4)
+
+
+def mesh_to_quantized_glb(mesh, with_normals=True):
+    """
+    KHR_mesh_quantization を使った軽量 GLB を作る。
+    - 頂点を溶接（STL は三角形ごとに頂点を持つため、共有頂点にまとめるだけで大きく減る）
+    - 位置は int16 に量子化し、逆変換（平行移動 + 一様スケール）はノードの transform に持たせる
+      （デコードは GPU の頂点変換に含まれるので、ブラウザ側の追加コストはほぼない）
+    - 法線は int8 正規化、インデックスは頂点数に応じて uint16 / uint32
+    一様スケールにしているので、法線を量子化空間で変換し直す必要はない。
+    """
+    mesh = mesh.copy()
+    mesh.merge_vertices()
+
+    vertices = np.asarray(mesh.vertices, dtype=np.float64)
+    faces = np.asarray(mesh.faces)
+    vmin, vmax = vertices.min(axis=0), vertices.max(axis=0)
+    center = (vmin + vmax) / 2.0
+    half = float((vmax - vmin).max()) / 2.0 or 1.0
+    scale = half / 32767.0
+
+    q_pos = np.zeros((len(vertices), 4), dtype=np.int16)  # 頂点ストライドは4バイト境界 → 8バイト
+    q_pos[:, :3] = np.clip(np.round((vertices - center) / scale), -32767, 32767)
+
+    chunks = []
+    buffer_views = []
+    accessors = []
+    offset = 0
+
+    def add_view(data, target, stride=None):
+        nonlocal offset
+        view = {"buffer": 0, "byteOffset": offset, "byteLength": len(data), "target": target}
+        if stride:
+            view["byteStride"] = stride
+        buffer_views.append(view)
+        padded = _pad4(data)
+        chunks.append(padded)
+        offset += len(padded)
+        return len(buffer_views) - 1
+
+    attributes = {}
+    view = add_view(q_pos.tobytes(), 34962, stride=8)
+    accessors.append({
+        "bufferView": view, "componentType": 5122, "type": "VEC3", "count": len(q_pos),
+        "min": q_pos[:, :3].min(axis=0).tolist(), "max": q_pos[:, :3].max(axis=0).tolist(),
+    })
+    attributes["POSITION"] = len(accessors) - 1
+
+    if with_normals:
+        q_nrm = np.zeros((len(vertices), 4), dtype=np.int8)
+        q_nrm[:, :3] = np.clip(np.round(np.asarray(mesh.vertex_normals) * 127.0), -127, 127)
+        view = add_view(q_nrm.tobytes(), 34962, stride=4)
+        accessors.append({
+            "bufferView": view, "componentType": 5120, "normalized": True, "type": "VEC3", "count": len(q_nrm),
+        })
+        attributes["NORMAL"] = len(accessors) - 1
+
+    if len(vertices) <= 65535:
+        indices, index_type = faces.astype(np.uint16), 5123
+    else:
+        indices, index_type = faces.astype(np.uint32), 5125
+    view = add_view(indices.tobytes(), 34963)
+    accessors.append({"bufferView": view, "componentType": index_type, "type": "SCALAR", "count": int(indices.size)})
+
+    gltf = {
+        "asset": {"version": "2.0", "generator": "hoero stl_mesh"},
+        "extensionsUsed": ["KHR_mesh_quantization"],
+        "extensionsRequired": ["KHR_mesh_quantization"],
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"mesh": 0, "translation": center.tolist(), "scale": [scale, scale, scale]}],
+        "meshes": [{"primitives": [{"attributes": attributes, "indices": len(accessors) - 1, "material": 0}]}],
+        "materials": [{"pbrMetallicRoughness": {
+            "baseColorFactor": BOARD_BASE_COLOR,
+            "metallicFactor": BOARD_METALLIC,
+            "roughnessFactor": BOARD_ROUGHNESS,
+        }}],
+        "buffers": [{"byteLength": offset}],
+        "bufferViews": buffer_views,
+        "accessors": accessors,
+    }
+
+    json_chunk = _pad4(json.dumps(gltf, separators=(",", ":")).encode("utf-8"), b" ")
+    bin_chunk = b"".join(chunks)
+    total = 12 + 8 + len(json_chunk) + 8 + len(bin_chunk)
+    return b"".join([
+        struct.pack("<4sII", b"glTF", 2, total),
+        struct.pack("<I4s", len(json_chunk), b"JSON"), json_chunk,
+        struct.pack("<I4s", len(bin_chunk), b"BIN\x00"), bin_chunk,
+    ])
+
+
+def encode_glb(mesh, mode=DEFAULT_GLB_MODE):
+    """
+    指定形式で GLB にし、(GLBバイト列, 統計) を返す。
+    統計: 出力サイズ、同じ三角形数のバイナリ STL のサイズとの比、エンコード時間、
+          サーバー側で読み戻したデコード時間（ブラウザの読み込みコストの目安）
+    """
+    start = time.perf_counter()
+    if mode == GLB_MODE_STANDARD:
+        glb_data = mesh_to_glb(mesh.copy())
+    else:
+        glb_data = mesh_to_quantized_glb(mesh, with_normals=(mode != GLB_MODE_QUANTIZED_FLAT))
+    encode_ms = (time.perf_counter() - start) * 1000
+
+    decode_ms = None
+    try:
+        start = time.perf_counter()
+        trimesh.load(io.BytesIO(glb_data), file_type="glb")
+        decode_ms = (time.perf_counter() - start) * 1000
+    except Exception as e:
+        print(f"GLB読み戻しエラー: {e} ({type(e).__name__})")
+
+    # 比較の基準はバイナリ STL（ヘッダ 84 バイト + 三角形ごとに 50 バイト）。
+    # load_stl_fast が読み込み時に頂点を溶接しているので、mesh の頂点数から出すと
+    # インデックス化済み（STL の約半分）との比になり、削減率を小さく見積もってしまう
+    raw_bytes = 84 + 50 * len(mesh.faces)
+    stats = {
+        "mode": mode,
+        "bytes": len(glb_data),
+        "raw_bytes": raw_bytes,
+        "indexed_bytes": len(mesh.vertices) * 24 + len(mesh.faces) * 12,
+        "ratio": round(raw_bytes / max(len(glb_data), 1), 2),
+        "encode_ms": round(encode_ms, 1),
+        "decode_ms": round(decode_ms, 1) if decode_ms is not None else None,
+    }
+    return glb_data, stats
+
+
+def build_stl_assets(input_stl_path, levels=STL_LOD_LEVELS, mode=DEFAULT_GLB_MODE,
+                     thumbnail_max_faces=STL_THUMBNAIL_MAX_FACES):
+    """
+    STL から LOD ごとの GLB と一覧表示用のサムネイル画像を作る。
+    1つ上のレベルから順に quadric decimation するので、元メッシュの簡略化は1回で済む。
+    目標三角形数が現在の面数以上のレベルは作らない（呼び出し側は上のレベルで代用する）。
+    サムネイルは thumbnail_max_faces 以下になった最初のレベル（通常は preview）から描画する。
+    描画に失敗しても GLB は返す（thumbnail は None）。
+
+    戻り値: SimpleNamespace(
+        lods=[(レベル名, GLBバイト列, 三角形数, 統計), ...]（levels の順）,
+        thumbnail=WebP のバイト列 or None)
+    """
+    mesh = load_stl_mesh(input_stl_path)
+    lods = []
+    thumbnail_mesh = None
+    for name, target_faces in levels:
+        if target_faces is not None:
+            if len(mesh.faces) <= target_faces:
+                continue
+            mesh = mesh.simplify_quadric_decimation(face_count=target_faces)
+        glb_data, stats = encode_glb(mesh, mode)
+        lods.append((name, glb_data, len(mesh.faces), stats))
+        if thumbnail_mesh is None and len(mesh.faces) <= thumbnail_max_faces:
+            thumbnail_mesh = mesh
+
+    thumbnail = None
+    try:
+        thumbnail = render_mesh_thumbnail(thumbnail_mesh if thumbnail_mesh is not None else mesh)
+    except Exception as e:
+        print(f"サムネイル描画エラー: {e} ({type(e).__name__})")
+    return SimpleNamespace(lods=lods, thumbnail=thumbnail)
+
+
+def stl_content_hash(input_stl_path, mode=DEFAULT_GLB_MODE, levels=STL_LOD_LEVELS, chunk_size=8 * 1024 * 1024):
+    """
+    STL の内容と変換パラメータ（形式・LOD・変換処理のバージョン）の BLAKE2b ハッシュ。
+    同じスキャンの再アップロードを見つけて、変換済みの GLB を使い回すためのキー。
+    """
+    h = hashlib.blake2b(digest_size=20)
+    params = {"v": STL_CONVERTER_VERSION, "mode": mode, "lod": [list(level) for level in levels]}
+    h.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    with open(input_stl_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def convert_stl_to_gltf(input_stl_path, output_gltf_path):
+    try:
+        mesh = load_stl_mesh(input_stl_path)
+        glb_data = mesh_to_glb(mesh)
+
+        with open(output_gltf_path, 'wb') as f:
+            f.write(glb_data)
+        return True
+
+    except Exception as e:
+        print(f"変換エラー: {e} ({type(e).__name__})")
+        return False
@@ -1,6 +1,7 @@
 import os
 import numpy as np
-import trimesh
+
+from utils.stl_io import load_stl_fast, write_binary_stl
 
 # STLファイルを縮小する関数
 def reduce_stl_size(input_file, output_file, target_reduction=0.5, binary_output=True):
@@ -16,8 +17,8 @@ def reduce_stl_size(input_file, output_file, target_reduction=0.5, binary_output
     Returns:
     tuple: (元のファイルサイズ, 新しいファイルサイズ, 削減率)
     """
-    # STLファイルを読み込む
-    mesh = trimesh.load_mesh(input_file)
+    # STLファイルを読み込む（バイナリは memmap、ASCII は trimesh）
+    mesh = load_stl_fast(input_file)
     
     # 元のファイルサイズを取得
     original_size = os.path.getsize(input_file)
@@ -28,14 +29,14 @@ def reduce_stl_size(input_file, output_file, target_reduction=0.5, binary_output
     # 目標とする面の数を計算
     target_faces = int(original_faces * (1 - target_reduction))
     
-    # メッシュを簡略化
-    mesh_simplified = mesh.simplify_quadratic_decimation(target_faces)
-    
-    # 出力フォーマットを設定（バイナリまたはアスキー）
-    export_type = 'binary' if binary_output else 'ascii'
+    # メッシュを簡略化（trimesh 4.x は第1引数が削減率なので目標面数はキーワードで渡す）
+    mesh_simplified = mesh.simplify_quadric_decimation(face_count=target_faces)
     
-    # 簡略化したメッシュを保存
-    mesh_simplified.export(output_file, file_type='stl', file_format=export_type)
+    # 簡略化したメッシュを保存（バイナリはまとめて書き出し、アスキーは trimesh）
+    if binary_output:
+        write_binary_stl(output_file, mesh_simplified.vertices, mesh_simplified.faces)
+    else:
+        mesh_simplified.export(output_file, file_type='stl_ascii')
     
     # 新しいファイルサイズを取得
     new_size = os.path.getsize(output_file)
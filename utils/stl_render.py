@@ -0,0 +1,178 @@
+"""
+STL 投稿のサムネイル画像をサーバー側（CPU のみ）で描画する。
+
+一覧ページやトップページで投稿ごとに WebGL ビューアーを起動すると、
+ブラウザの CPU・GPU と GLB の転送量が投稿数ぶん増える。
+変換ジョブで軽量化済みのメッシュを NumPy の z バッファで描画して静止画にし、
+3D ビューアーは詳細ページだけで読み込むようにする。
+
+    png_or_webp = render_mesh_thumbnail(mesh)
+
+三角形をバウンディングボックスの大きさ（8/16/32/64 ピクセル）で分けて、
+同じ大きさの三角形はまとめてベクトル演算で塗る。それより大きい三角形だけ1つずつ塗る。
+"""
+import io
+
+import numpy as np
+from PIL import Image
+
+# 出力サイズ（一覧・トップページの 16:9 枠に合わせる）と、アンチエイリアス用の拡大率
+THUMBNAIL_SIZE = (640, 360)
+THUMBNAIL_SUPERSAMPLE = 2
+THUMBNAIL_FORMAT = "WEBP"
+THUMBNAIL_CONTENT_TYPE = "image/webp"
+THUMBNAIL_EXT = ".webp"
+
+# 表示色（model-viewer の表示に近い明るめのグレー）と陰影
+THUMBNAIL_COLOR = np.array([205, 205, 200], dtype=np.float64)
+AMBIENT = 0.3
+DIFFUSE = 0.7
+
+# まとめて塗る三角形のバウンディングボックスの幅（ピクセル）と、1回に並べる候補ピクセル数
+_TILES = (8, 16, 32, 64)
+_CHUNK_PIXELS = 1 << 20
+
+
+def _vertex_normals(vertices, faces):
+    """面積で重み付けした頂点法線（scipy なしで計算する）"""
+    tri = vertices[faces]
+    face_normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    normals = np.zeros_like(vertices)
+    flat_faces = faces.ravel()
+    for axis in range(3):
+        normals[:, axis] = np.bincount(flat_faces, weights=np.repeat(face_normals[:, axis], 3),
+                                       minlength=len(vertices))
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0), face_normals
+
+
+def _view_basis(vertices, face_normals):
+    """
+    カメラの向き（right, up, forward）を決める。
+    歯列スキャンは咬合面の法線方向のばらつきが最も小さいので、主成分の最小軸から見下ろし、
+    少し傾けて立体感を出す。向きの符号は面が多く向いている側から見るように選ぶ。
+    """
+    centered = vertices - vertices.mean(axis=0)
+    _, _, axes = np.linalg.svd(centered[:: max(1, len(centered) // 20000)], full_matrices=False)
+    right, up, forward = axes[0], axes[1], axes[2]
+    if face_normals.sum(axis=0) @ forward > 0:
+        forward, up = -forward, -up
+
+    tilt = np.radians(25.0)
+    forward, up = forward * np.cos(tilt) + up * np.sin(tilt), up * np.cos(tilt) - forward * np.sin(tilt)
+    right = np.cross(up, forward)
+    return right, up, forward
+
+
+def _rasterize(xy, depth, shade, faces, width, height):
+    """
+    頂点のスクリーン座標・深度・明るさから、z バッファで (明るさ, 塗ったか) の画像を作る。
+    各三角形が覆うピクセル候補を並べ、重なったピクセルは深度の最も小さいものを残す。
+    """
+    tri = xy[faces]
+    lo = np.floor(tri.min(axis=1)).astype(np.int64)
+    hi = np.ceil(tri.max(axis=1)).astype(np.int64)
+    lo = np.maximum(lo, 0)
+    hi = np.minimum(hi, [width - 1, height - 1])
+    visible = (hi >= lo).all(axis=1)
+    extent = (hi - lo).max(axis=1) + 1
+
+    pixels, depths, values = [], [], []
+
+    def cover(idx, px, py):
+        # idx: (n,) 三角形, px/py: (n, m) 候補ピクセル
+        a, b, c = xy[faces[idx, 0]], xy[faces[idx, 1]], xy[faces[idx, 2]]
+        sx, sy = px + 0.5, py + 0.5
+        area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+        nz = area != 0
+        if not nz.any():
+            return
+        idx, a, b, c, sx, sy, px, py, area = idx[nz], a[nz], b[nz], c[nz], sx[nz], sy[nz], px[nz], py[nz], area[nz]
+        inv = 1.0 / area[:, None]
+        w0 = ((b[:, 0, None] - sx) * (c[:, 1, None] - sy) - (b[:, 1, None] - sy) * (c[:, 0, None] - sx)) * inv
+        w1 = ((c[:, 0, None] - sx) * (a[:, 1, None] - sy) - (c[:, 1, None] - sy) * (a[:, 0, None] - sx)) * inv
+        w2 = 1.0 - w0 - w1
+        inside = (w0 >= 0) & (w1 >= 0) & (w2 >= 0) & (px < width) & (py < height)
+        if not inside.any():
+            return
+        f = faces[idx]
+        z = w0 * depth[f[:, 0], None] + w1 * depth[f[:, 1], None] + w2 * depth[f[:, 2], None]
+        s = w0 * shade[f[:, 0], None] + w1 * shade[f[:, 1], None] + w2 * shade[f[:, 2], None]
+        pixels.append((py * width + px)[inside])
+        depths.append(z[inside])
+        values.append(s[inside])
+
+    smaller = 0
+    for tile in _TILES:
+        group = np.flatnonzero(visible & (extent > smaller) & (extent <= tile))
+        smaller = tile
+        grid_x, grid_y = np.meshgrid(np.arange(tile), np.arange(tile))
+        grid_x, grid_y = grid_x.ravel(), grid_y.ravel()
+        chunk = max(1, _CHUNK_PIXELS // (tile * tile))
+        for start in range(0, len(group), chunk):
+            idx = group[start:start + chunk]
+            cover(idx, lo[idx, 0, None] + grid_x, lo[idx, 1, None] + grid_y)
+
+    for i in np.flatnonzero(visible & (extent > smaller)):
+        gx, gy = np.meshgrid(np.arange(lo[i, 0], hi[i, 0] + 1), np.arange(lo[i, 1], hi[i, 1] + 1))
+        cover(np.array([i]), gx.reshape(1, -1), gy.reshape(1, -1))
+
+    image = np.zeros(width * height)
+    mask = np.zeros(width * height, dtype=bool)
+    if pixels:
+        pixels = np.concatenate(pixels)
+        depths = np.concatenate(depths)
+        values = np.concatenate(values)
+        order = np.lexsort((depths, pixels))
+        sorted_pixels = pixels[order]
+        nearest = np.empty(len(order), dtype=bool)
+        nearest[:1] = True
+        np.not_equal(sorted_pixels[1:], sorted_pixels[:-1], out=nearest[1:])
+        chosen = order[nearest]
+        image[pixels[chosen]] = values[chosen]
+        mask[pixels[chosen]] = True
+    return image.reshape(height, width), mask.reshape(height, width)
+
+
+def render_mesh_image(mesh, size=THUMBNAIL_SIZE, supersample=THUMBNAIL_SUPERSAMPLE, margin=0.06):
+    """メッシュを正射影で描画した RGBA の PIL 画像（背景は透明）"""
+    vertices = np.asarray(mesh.vertices, dtype=np.float64)
+    faces = np.asarray(mesh.faces, dtype=np.int64)
+    if not len(faces):
+        raise ValueError("faces を持たないメッシュは描画できません")
+
+    width, height = size[0] * supersample, size[1] * supersample
+    normals, face_normals = _vertex_normals(vertices, faces)
+    right, up, forward = _view_basis(vertices, face_normals)
+
+    cam = np.column_stack([vertices @ right, vertices @ up, vertices @ forward])
+    cmin, cmax = cam[:, :2].min(axis=0), cam[:, :2].max(axis=0)
+    span = np.maximum(cmax - cmin, 1e-9)
+    scale = min(width * (1 - 2 * margin) / span[0], height * (1 - 2 * margin) / span[1])
+    center = (cmin + cmax) / 2.0
+    xy = np.empty((len(vertices), 2))
+    xy[:, 0] = (cam[:, 0] - center[0]) * scale + width / 2.0
+    xy[:, 1] = height / 2.0 - (cam[:, 1] - center[1]) * scale  # 画像は下向きが +y
+
+    # カメラ側から少し左上を照らすライト（両面表示なので法線の向きは絶対値で扱う）
+    light = -forward + 0.4 * up - 0.3 * right
+    light /= np.linalg.norm(light)
+    shade = AMBIENT + DIFFUSE * np.abs(normals @ light)
+
+    lum, mask = _rasterize(xy, cam[:, 2], shade, faces, width, height)
+    rgba = np.zeros((height, width, 4), dtype=np.uint8)
+    rgba[..., :3] = np.clip(lum[..., None] * THUMBNAIL_COLOR, 0, 255).astype(np.uint8)
+    rgba[..., 3] = mask * 255
+
+    image = Image.fromarray(rgba, "RGBA")
+    if supersample > 1:
+        image = image.resize(size, Image.LANCZOS)
+    return image
+
+
+def render_mesh_thumbnail(mesh, size=THUMBNAIL_SIZE, fmt=THUMBNAIL_FORMAT, quality=85):
+    """一覧表示用のサムネイル画像のバイト列（既定は WebP）"""
+    image = render_mesh_image(mesh, size=size)
+    buf = io.BytesIO()
+    image.save(buf, format=fmt, quality=quality, method=4)
+    return buf.getvalue()
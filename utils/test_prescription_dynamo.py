@@ -0,0 +1,198 @@
+"""
+utils/prescription_dynamo.py のページ送り（管理者一覧・医院ごとの一覧）のテスト。
+
+DynamoDB は moto で立て、テーブルと GSI は dynamodb_make_table.py と同じ定義で作る。
+どちらの一覧も、全ページを前へ・後ろへたどった結果が従来の全件スキャン + 並べ替えと同じ順序になることを確かめる。
+
+    pip install "moto[dynamodb]" pytest
+    python -m pytest -q utils/test_prescription_dynamo.py
+"""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+moto = pytest.importorskip("moto")
+boto3 = pytest.importorskip("boto3")
+from flask import Flask  # noqa: E402
+
+import utils.prescription_dynamo as pd  # noqa: E402
+
+REGION = "ap-northeast-1"
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+        monkeypatch.setenv(name, "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", REGION)
+    with moto.mock_aws():
+        import dynamodb_make_table as make_table
+
+        dynamodb = boto3.resource("dynamodb", region_name=REGION)
+        make_table.ensure_prescriptions(dynamodb)
+        make_table.ensure_lab_prescriptions(dynamodb)
+        counter = dynamodb.create_table(
+            TableName="Meziro-Counters",
+            KeySchema=[{"AttributeName": "counter_name", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "counter_name", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        # utils.common_utils は import 時に画像処理などの依存を読み込むので、カウンターだけ差し替える
+        monkeypatch.setattr(pd, "_counter_table", lambda: counter)
+
+        app = Flask(__name__)
+        app.config["PRESCRIPTIONS_TABLE"] = dynamodb.Table("hoero-prescriptions")
+        app.config["LAB_PRESCRIPTIONS_TABLE"] = dynamodb.Table("hoero-lab-prescriptions")
+        with app.app_context():
+            yield app.config["PRESCRIPTIONS_TABLE"], app.config["LAB_PRESCRIPTIONS_TABLE"]
+
+
+def _walk(paginate, per_page, **kwargs):
+    """先頭から next_tok で最後まで進み、最後のページから prev_tok で先頭まで戻る。(前へ, 後ろへ, 最後のページ)"""
+    forward, pages = [], []
+    page = paginate(tok=None, per_page=per_page, **kwargs)
+    while True:
+        pages.append(page)
+        forward.extend(item["prescription_id"] for item in page["items"])
+        if not page["has_next"]:
+            break
+        page = paginate(tok=page["next_tok"], per_page=per_page, **kwargs)
+
+    backward = [item["prescription_id"] for item in page["items"]]
+    while page["has_prev"]:
+        page = paginate(tok=page["prev_tok"], per_page=per_page, **kwargs)
+        backward = [item["prescription_id"] for item in page["items"]] + backward
+    return forward, backward, pages
+
+
+def _legacy_admin_order(items):
+    """従来の管理者一覧（全件スキャンして created_at の新しい順。年月が読めないものは最後）"""
+    dated = [i for i in items if pd._month(i.get("created_at"))]
+    undated = [i for i in items if not pd._month(i.get("created_at"))]
+    key = lambda i: f"{i.get('created_at', '')}#{i['prescription_id']}"  # noqa: E731
+    return [i["prescription_id"] for group in (dated, undated) for i in sorted(group, key=key, reverse=True)]
+
+
+def test_admin_pages_match_legacy_order(tables):
+    table, lab_table = tables
+    rng = random.Random(22)
+    listed = []
+    for n in range(60):
+        # 同じ時刻（created_at が同値）の指示書を多めに作り、ページの境目をまたがせる
+        month = rng.choice(["2024-11", "2025-01", "2025-06", "2026-02"])
+        item = {"prescription_id": f"P{n:03d}", "created_at": f"{month}-0{rng.randint(1, 3)} 10:00:00"}
+        if n % 9 == 0:
+            item["source"] = "3ds"  # 一覧に出さない
+        lab = n % 4 == 0
+        pd.put_prescription(lab_table if lab else table, item)
+        if lab or "source" not in item:
+            listed.append(item)
+    for pid, created_at in (("U1", None), ("U2", "昨日"), ("U3", "unknown")):
+        item = {"prescription_id": pid}
+        if created_at:
+            item["created_at"] = created_at
+        pd.put_prescription(table, item)
+        listed.append(item)
+
+    expected = _legacy_admin_order(listed)
+    for per_page in (1, 4, 7, 100):
+        forward, backward, pages = _walk(pd.paginate_admin_prescriptions, per_page)
+        assert forward == expected
+        assert backward == expected
+        assert pages[0]["total"] == len(expected)
+
+    total, oldest = pd.admin_prescription_stats()
+    assert total == len(expected)
+    assert oldest == "202411"  # 年月が読めない指示書の ADMIN#000000 は一番古い年月にしない
+
+
+def test_admin_undated_bucket_walked_last(tables):
+    table, _ = tables
+    pd.put_prescription(table, {"prescription_id": "D1", "created_at": "2025-03-01 09:00:00"})
+    pd.put_prescription(table, {"prescription_id": "X1"})
+    assert pd.admin_index_attrs({"prescription_id": "X1"})["admin_bucket"] == "ADMIN#000000"
+
+    first = pd.paginate_admin_prescriptions(per_page=1)
+    assert [i["prescription_id"] for i in first["items"]] == ["D1"]
+    assert first["has_next"]
+    second = pd.paginate_admin_prescriptions(tok=first["next_tok"], per_page=1)
+    assert [i["prescription_id"] for i in second["items"]] == ["X1"]
+    assert not second["has_next"]
+    # ADMIN#000000 のカーソルから戻ると、年月のパーティションに戻る
+    back = pd.paginate_admin_prescriptions(tok=second["prev_tok"], per_page=1)
+    assert [i["prescription_id"] for i in back["items"]] == ["D1"]
+    assert not back["has_prev"]
+
+
+def test_admin_excluded_and_deleted(tables):
+    table, lab_table = tables
+    pd.put_prescription(table, {"prescription_id": "A", "created_at": "2025-05-01", "source": "lab"})
+    pd.put_prescription(table, {"prescription_id": "ReArch-1", "created_at": "2025-05-01"})
+    pd.put_prescription(lab_table, {"prescription_id": "ReArch-2", "created_at": "2025-05-01"})
+    pd.put_prescription(table, {"prescription_id": "B", "created_at": "2025-05-02"})
+    page = pd.paginate_admin_prescriptions(per_page=10)
+    assert [i["prescription_id"] for i in page["items"]] == ["B", "ReArch-2"]
+    assert page["total"] == 2
+
+    pd.delete_prescription(table, "B")
+    page = pd.paginate_admin_prescriptions(per_page=10)
+    assert [i["prescription_id"] for i in page["items"]] == ["ReArch-2"]
+    assert page["total"] == 1
+
+
+def test_owner_pages_merge_both_indexes(tables):
+    table, _ = tables
+    rng = random.Random(23)
+    mine = []
+    for n in range(120):
+        item = {"prescription_id": f"P{n:04d}",
+                "created_at": f"2025-01-0{rng.randint(1, 4)}T00:00:0{rng.randint(0, 2)}"}
+        r = rng.random()
+        if r < 0.35:
+            item["user_id"] = "u@example.com"
+        elif r < 0.65:
+            item["clinic_id"] = "C1"
+        elif r < 0.9:
+            # 両方の GSI に載る指示書は1回だけ出る
+            item["user_id"] = "u@example.com"
+            item["clinic_id"] = "C1"
+        else:
+            item["user_id"] = "other@example.com"
+        pd.put_prescription(table, item)
+        if item.get("user_id") == "u@example.com" or item.get("clinic_id") == "C1":
+            mine.append(item)
+    expected = [i["prescription_id"]
+                for i in sorted(mine, key=lambda i: (i["created_at"], i["prescription_id"]), reverse=True)]
+
+    for per_page in (1, 5, 17, 500):
+        forward, backward, pages = _walk(pd.paginate_owner_prescriptions, per_page, table=table,
+                                         user_id="u@example.com", clinic_id="C1")
+        assert forward == expected
+        assert backward == expected
+        assert pages[0]["total"] is None
+        assert not pages[0]["has_prev"]
+
+
+def test_owner_pages_single_index(tables):
+    table, _ = tables
+    for n in range(5):
+        pd.put_prescription(table, {"prescription_id": f"P{n}", "created_at": "2025-02-01T00:00:00",
+                                    "user_id": "u@example.com"})
+    pd.put_prescription(table, {"prescription_id": "Q", "created_at": "2025-02-02T00:00:00", "clinic_id": "C1"})
+
+    forward, backward, _ = _walk(pd.paginate_owner_prescriptions, 2, table=table, user_id="u@example.com")
+    assert forward == backward == ["P4", "P3", "P2", "P1", "P0"]
+    forward, _, _ = _walk(pd.paginate_owner_prescriptions, 2, table=table, clinic_id="C1")
+    assert forward == ["Q"]
+
+
+def test_invalid_token_starts_from_first_page(tables):
+    table, _ = tables
+    pd.put_prescription(table, {"prescription_id": "P", "created_at": "2025-02-01"})
+    page = pd.paginate_admin_prescriptions(tok="not-a-token", per_page=5)
+    assert [i["prescription_id"] for i in page["items"]] == ["P"]
+    assert not page["has_prev"]
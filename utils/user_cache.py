@@ -0,0 +1,145 @@
+"""
+hoero-users の表示用プロフィール（display_name / email）キャッシュ。
+
+- リクエスト内: flask.g に保持し、同じユーザーは1リクエストで1回しか引かない
+- プロセス内: TTL付きLRU（uwsgi ワーカーごとに1つ、そのワーカーの全リクエストで共有）
+- 未取得分は BatchGetItem でまとめて取得（100件ずつ）
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from boto3.dynamodb.types import TypeDeserializer
+from flask import current_app, g, has_app_context
+
+PROFILE_TTL_SECONDS = 300
+PROFILE_CACHE_MAX = 2048
+_BATCH_GET_MAX_KEYS = 100  # BatchGetItem の上限
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # user_id -> (expires_at, profile or None)
+_stats = {"request_hits": 0, "process_hits": 0, "misses": 0, "batch_get_calls": 0}
+_deserializer = TypeDeserializer()
+
+
+def _request_cache():
+    if not has_app_context():
+        return {}
+    if "_user_profiles" not in g:
+        g._user_profiles = {}
+    return g._user_profiles
+
+
+def _cache_get(user_id, now):
+    with _lock:
+        entry = _cache.get(user_id)
+        if entry is None:
+            return False, None
+        expires_at, profile = entry
+        if expires_at < now:
+            del _cache[user_id]
+            return False, None
+        _cache.move_to_end(user_id)
+        return True, profile
+
+
+def _cache_put(user_id, profile, now):
+    with _lock:
+        _cache[user_id] = (now + PROFILE_TTL_SECONDS, profile)
+        _cache.move_to_end(user_id)
+        while len(_cache) > PROFILE_CACHE_MAX:
+            _cache.popitem(last=False)
+
+
+def _batch_get(user_ids):
+    """BatchGetItem で user_id -> profile を取得（見つからないユーザーは含まない）"""
+    table = current_app.config["HOERO_USERS_TABLE"]
+    client = table.meta.client
+    found = {}
+
+    for i in range(0, len(user_ids), _BATCH_GET_MAX_KEYS):
+        request_items = {
+            table.name: {
+                "Keys": [{"user_id": {"S": uid}} for uid in user_ids[i:i + _BATCH_GET_MAX_KEYS]],
+                "ProjectionExpression": "#uid, #dn, #em",
+                "ExpressionAttributeNames": {"#uid": "user_id", "#dn": "display_name", "#em": "email"},
+            }
+        }
+        while request_items:
+            with _lock:
+                _stats["batch_get_calls"] += 1
+            resp = client.batch_get_item(RequestItems=request_items)
+            for raw in resp.get("Responses", {}).get(table.name, []):
+                item = {k: _deserializer.deserialize(v) for k, v in raw.items()}
+                found[item["user_id"]] = {
+                    "display_name": item.get("display_name"),
+                    "email": item.get("email", ""),
+                }
+            request_items = resp.get("UnprocessedKeys") or None
+    return found
+
+
+def prefetch_user_profiles(user_ids):
+    """
+    user_ids のプロフィールをまとめてキャッシュに載せ、{user_id: profile or None} を返す。
+    ページ内の著者を一括で解決したいときに最初に1回呼ぶ。
+    """
+    req_cache = _request_cache()
+    now = time.time()
+    result = {}
+    missing = []
+
+    for uid in dict.fromkeys(str(u) for u in user_ids if u):
+        if uid in req_cache:
+            with _lock:
+                _stats["request_hits"] += 1
+            result[uid] = req_cache[uid]
+            continue
+        hit, profile = _cache_get(uid, now)
+        if hit:
+            with _lock:
+                _stats["process_hits"] += 1
+            req_cache[uid] = result[uid] = profile
+            continue
+        missing.append(uid)
+
+    if missing:
+        with _lock:
+            _stats["misses"] += len(missing)
+        try:
+            found = _batch_get(missing)
+        except Exception as e:
+            current_app.logger.warning("user profile batch get failed: %s", e)
+            # 失敗時はキャッシュせず、このリクエストだけ Unknown 扱い
+            for uid in missing:
+                req_cache[uid] = result[uid] = None
+            return result
+        for uid in missing:
+            profile = found.get(uid)  # 存在しないユーザーも None でキャッシュ
+            _cache_put(uid, profile, now)
+            req_cache[uid] = result[uid] = profile
+
+    return result
+
+
+def get_user_profile(user_id):
+    """1件版。prefetch 済みならリクエストキャッシュから返る。"""
+    if not user_id:
+        return None
+    return prefetch_user_profiles([user_id]).get(str(user_id))
+
+
+def invalidate_user_profile(user_id):
+    """プロフィール更新時に呼ぶ"""
+    uid = str(user_id or "")
+    with _lock:
+        _cache.pop(uid, None)
+    if has_app_context():
+        _request_cache().pop(uid, None)
+
+
+def user_cache_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["size"] = len(_cache)
+    return stats
@@ -0,0 +1,97 @@
+"""
+動画変換ジョブ（utils/video_jobs.py）の状態テーブル。
+
+job_id ごとに status（queued → processing → ready / failed）・進捗（0〜100）・
+出力した各解像度の S3 キーとポスター画像のキーを持つ。
+ワーカープロセスからは table を渡して使う（Flask のアプリコンテキストがないため）。
+古いジョブは expires_at（TTL）で自動的に消える。
+"""
+import time
+from datetime import datetime, timezone
+
+from flask import current_app
+
+VIDEO_STATUS_QUEUED = "queued"
+VIDEO_STATUS_PROCESSING = "processing"
+VIDEO_STATUS_READY = "ready"
+VIDEO_STATUS_FAILED = "failed"
+
+# ジョブを残しておく日数（テーブルの TTL 属性 expires_at）
+VIDEO_JOB_TTL_DAYS = 30
+
+
+def _jobs_table():
+    return current_app.config["VIDEO_JOBS_TABLE"]
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def create_video_job(job_id, filename, user_id=None, table=None):
+    """アップロード直後のジョブを queued で作る"""
+    item = {
+        "job_id": job_id,
+        "status": VIDEO_STATUS_QUEUED,
+        "progress": 0,
+        "filename": filename or "",
+        "created_at": _now_iso(),
+        "updated_at": _now_iso(),
+        "expires_at": int(time.time()) + VIDEO_JOB_TTL_DAYS * 86400,
+    }
+    if user_id:
+        item["user_id"] = str(user_id)
+    (table or _jobs_table()).put_item(Item=item)
+    return item
+
+
+def get_video_job(job_id, table=None):
+    resp = (table or _jobs_table()).get_item(Key={"job_id": job_id})
+    return resp.get("Item")
+
+
+def set_video_job_progress(job_id, progress, table=None):
+    """変換中の進捗（%）。完了・失敗したジョブは書き換えない"""
+    (table or _jobs_table()).update_item(
+        Key={"job_id": job_id},
+        UpdateExpression="SET #st = :st, progress = :p, updated_at = :now",
+        ConditionExpression="attribute_exists(job_id) AND #st IN (:queued, :st)",
+        ExpressionAttributeNames={"#st": "status"},
+        ExpressionAttributeValues={
+            ":st": VIDEO_STATUS_PROCESSING, ":p": int(progress), ":now": _now_iso(),
+            ":queued": VIDEO_STATUS_QUEUED,
+        },
+    )
+
+
+def finish_video_job(job_id, renditions, poster_key, video_url, duration=None, table=None):
+    """
+    変換完了: renditions は {"360p": key, "720p": key}、video_url は既定の解像度の公開 URL
+    （ブログの featured_video にはこの URL を入れる）。
+    """
+    sets = ["#st = :st", "progress = :p", "renditions = :r", "video_url = :url", "updated_at = :now"]
+    expr_values = {
+        ":st": VIDEO_STATUS_READY, ":p": 100, ":r": renditions, ":url": video_url, ":now": _now_iso(),
+    }
+    if poster_key:
+        sets.append("poster = :poster")
+        expr_values[":poster"] = poster_key
+    if duration is not None:
+        sets.append("duration_ms = :dur")
+        expr_values[":dur"] = int(duration * 1000)
+    (table or _jobs_table()).update_item(
+        Key={"job_id": job_id},
+        UpdateExpression="SET " + ", ".join(sets) + " REMOVE #err",
+        ExpressionAttributeNames={"#st": "status", "#err": "error"},
+        ExpressionAttributeValues=expr_values,
+    )
+
+
+def fail_video_job(job_id, error, table=None):
+    """変換失敗: failed にしてエラー内容を残す"""
+    (table or _jobs_table()).update_item(
+        Key={"job_id": job_id},
+        UpdateExpression="SET #st = :st, #err = :err, updated_at = :now",
+        ExpressionAttributeNames={"#st": "status", "#err": "error"},
+        ExpressionAttributeValues={":st": VIDEO_STATUS_FAILED, ":err": str(error)[:500], ":now": _now_iso()},
+    )
@@ -0,0 +1,383 @@
+"""
+ブログ用動画の変換ジョブ（ローカルのプロセスプール）。
+
+リクエスト処理中に ffmpeg を実行するとエンコードが終わるまで uwsgi ワーカーがふさがるため、
+アップロードはスプールに保存してジョブ ID だけ返し、変換・S3アップロードは別プロセスで行う。
+
+    job_id = submit_video_transcode(upload_video, user_id=current_user.email)
+    # → GET /featured_video/jobs/<job_id> で status / progress / 各解像度の URL を確認する
+
+1回のデコードから、短辺 360px・720px の MP4（H.264 / AAC）とポスター画像（JPEG）を作る。
+元の動画より大きくはしない。ffmpeg の -progress 出力から進捗（%）をジョブテーブルに書き込む。
+
+出力は ffmpeg からパイプで受けて S3 マルチパートへそのまま流す（fragmented MP4）。
+エンコードとアップロードが並行し、出力はディスクを通らない。入力はスプールしたファイルを渡す
+（リクエストは Flask が受信し終えてからビューに来るうえ、変換はレスポンスを返した後に別プロセスで行うため。
+moov が末尾にある MP4 もファイルならシークして読める）。VIDEO_STREAM_UPLOAD=0 で従来どおり
+faststart の MP4 を作業ディレクトリに書いてからアップロードする。
+"""
+import io
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+
+import boto3
+from dotenv import load_dotenv
+
+from utils.process_pool import SpawnPool
+from utils.s3_multipart import S3MultipartWriter
+from utils.video_dynamo import create_video_job, fail_video_job, finish_video_job, set_video_job_progress
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# uwsgi ワーカー1つあたりの変換プロセス数
+VIDEO_JOB_WORKERS = int(os.getenv("VIDEO_JOB_WORKERS", "1"))
+# アップロードされた動画をワーカーに渡すまで置いておく場所
+VIDEO_JOB_SPOOL_DIR = os.getenv("VIDEO_JOB_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "video_jobs"))
+VIDEO_BUCKET_NAME = os.getenv("VIDEO_BUCKET_NAME", "shibuya8020")
+VIDEO_PREFIX = "videos/"
+
+# (名前, 短辺のピクセル数, CRF, 音声ビットレート)。最後のものを既定（featured_video の URL）にする
+VIDEO_RENDITIONS = (
+    ("360p", 360, 26, "96k"),
+    ("720p", 720, 23, "128k"),
+)
+VIDEO_DEFAULT_RENDITION = VIDEO_RENDITIONS[-1][0]
+# ポスター画像の短辺と、候補にするフレーム数（thumbnail フィルタが代表的な1枚を選ぶ）
+POSTER_SHORT_SIDE = 720
+POSTER_CANDIDATE_FRAMES = 60
+# 出力をパイプから S3 マルチパートへ直接流すか（0 なら作業ディレクトリに書いてからアップロードする）
+VIDEO_STREAM_UPLOAD = os.getenv("VIDEO_STREAM_UPLOAD", "1") == "1"
+# パイプ出力は fragmented MP4（moov を末尾に書き戻せないため）。ブラウザはそのまま再生できる
+FRAGMENTED_MOVFLAGS = "frag_keyframe+empty_moov+default_base_moof"
+VIDEO_PART_SIZE = 8 * 1024 * 1024
+PIPE_CHUNK_SIZE = 1024 * 1024
+# 進捗をテーブルに書く間隔（% と 秒のどちらかを超えたら書く）
+PROGRESS_STEP = 5
+PROGRESS_INTERVAL = 3.0
+
+_pool = SpawnPool(VIDEO_JOB_WORKERS)
+
+
+def new_video_job_id():
+    return uuid.uuid4().hex
+
+
+def video_url_for(key, bucket=VIDEO_BUCKET_NAME):
+    return f"https://{bucket}.s3.ap-northeast-1.amazonaws.com/{key}"
+
+
+def submit_video_transcode(upload_video, user_id=None):
+    """
+    アップロードされた動画（FileStorage）をスプールに保存し、ジョブを作って変換を投入する。
+    ジョブ ID を返す（変換の完了は待たない）。
+    """
+    from flask import current_app
+
+    job_id = new_video_job_id()
+    os.makedirs(VIDEO_JOB_SPOOL_DIR, exist_ok=True)
+    ext = os.path.splitext(upload_video.filename or "")[1].lower() or ".mp4"
+    input_path = os.path.join(VIDEO_JOB_SPOOL_DIR, f"{job_id}{ext}")
+    table = current_app.config["VIDEO_JOBS_TABLE"]
+    try:
+        upload_video.save(input_path)
+        create_video_job(job_id, upload_video.filename, user_id=user_id, table=table)
+    except Exception:
+        # ジョブが作れなければ誰もスプールを消さないので、ここで消す
+        _remove(input_path)
+        raise
+
+    base_name = os.path.splitext(os.path.basename(upload_video.filename or "video"))[0]
+    job = {
+        "job_id": job_id,
+        "input_path": input_path,
+        # 従来どおり「ミリ秒タイムスタンプ_元のファイル名」を S3 キーの元にする
+        "base_key": f"{VIDEO_PREFIX}{int(time.time() * 1000)}_{base_name}",
+        "bucket": VIDEO_BUCKET_NAME,
+    }
+    # 変換プロセスが落ちていた（OOM など）ときはプールを作り直して1回だけ再投入する
+    future = _pool.submit(run_video_job, job)
+
+    def _on_done(fut):
+        # ワーカー側で例外を握っているので、ここに来るのはプロセスごと落ちた場合
+        exc = fut.exception()
+        if exc is None:
+            return
+        logger.error("Video job crashed: job_id=%s err=%s", job_id, exc)
+        try:
+            fail_video_job(job_id, f"{type(exc).__name__}: {exc}", table=table)
+        except Exception:
+            logger.exception("Video job failure could not be recorded: job_id=%s", job_id)
+        _remove(input_path)
+
+    future.add_done_callback(_on_done)
+    logger.info("Video job submitted: job_id=%s file=%s", job_id, upload_video.filename)
+    return job_id
+
+
+# ==============================
+# 以下はワーカープロセス側
+# ==============================
+_worker_s3 = None
+_worker_table = None
+
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+
+
+def _worker_clients():
+    global _worker_s3, _worker_table
+    if _worker_s3 is None:
+        region = os.getenv("AWS_REGION", "ap-northeast-1")
+        _worker_s3 = boto3.client(
+            "s3",
+            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+            region_name=region,
+        )
+        dynamodb = boto3.resource("dynamodb", region_name=region)
+        _worker_table = dynamodb.Table(os.getenv("VIDEO_JOBS_TABLE_NAME", "hoero-video-jobs"))
+    return _worker_s3, _worker_table
+
+
+def _remove(path):
+    try:
+        if path and os.path.exists(path):
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def _scale_filter(short_side):
+    """短辺を short_side に縮小する（元より大きくしない・偶数にそろえる）scale フィルタ"""
+    return (f"scale=w='if(gt(iw,ih),-2,trunc(min({short_side},iw)/2)*2)'"
+            f":h='if(gt(iw,ih),trunc(min({short_side},ih)/2)*2,-2)'")
+
+
+def build_ffmpeg_command(ffmpeg_exe, input_path, outputs, poster_target, fragmented=False):
+    """
+    1回のデコードを split で分けて、各解像度の MP4 とポスター画像を同時に書き出すコマンド。
+    outputs は [(出力先, 短辺, CRF, 音声ビットレート), ...]。出力先はファイルパスか "pipe:<fd>"。
+    fragmented=True なら fragmented MP4（先頭に空の moov、キーフレームごとに moof）で書くので、
+    シークできないパイプにも出力できる。False なら従来どおり faststart のファイルにする。
+    進捗は -progress で標準出力に key=value 形式で出す。
+    """
+    branches = len(outputs) + 1
+    graph = [f"[0:v]split={branches}" + "".join(f"[s{i}]" for i in range(branches))]
+    for i, (_, short_side, _, _) in enumerate(outputs):
+        graph.append(f"[s{i}]{_scale_filter(short_side)}[v{i}]")
+    graph.append(f"[s{len(outputs)}]thumbnail={POSTER_CANDIDATE_FRAMES},{_scale_filter(POSTER_SHORT_SIDE)}[poster]")
+
+    cmd = [ffmpeg_exe, "-hide_banner", "-nostats", "-progress", "pipe:1", "-i", input_path,
+           "-filter_complex", ";".join(graph)]
+    movflags = ["-f", "mp4", "-movflags", FRAGMENTED_MOVFLAGS] if fragmented else ["-movflags", "+faststart"]
+    for i, (target, _, crf, audio_bitrate) in enumerate(outputs):
+        cmd += [
+            "-map", f"[v{i}]", "-map", "0:a?",
+            "-c:v", "libx264", "-crf", str(crf), "-preset", "medium", "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-b:a", audio_bitrate,
+            *movflags,
+            "-y", target,
+        ]
+    poster_format = ["-f", "image2pipe", "-c:v", "mjpeg"] if fragmented else []
+    cmd += ["-map", "[poster]", "-frames:v", "1", "-q:v", "3", *poster_format, "-y", poster_target]
+    return cmd
+
+
+def run_ffmpeg_with_progress(cmd, on_progress=None, pass_fds=()):
+    """
+    ffmpeg を実行し、-progress の out_time と stderr の Duration から進捗（0〜100）を on_progress に渡す。
+    pass_fds は出力先の "pipe:<fd>" として ffmpeg に引き継ぐパイプの書き込み側（起動後にこちらでは閉じる）。
+    失敗したら stderr の末尾を含めて RuntimeError。戻り値は動画の長さ（秒、不明なら None）。
+    """
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                stdin=subprocess.DEVNULL, text=True, errors="replace", pass_fds=pass_fds)
+    finally:
+        # 書き込み側を親に残すと、読み取り側のスレッドに EOF が届かない
+        for fd in pass_fds:
+            os.close(fd)
+    duration = None
+    stderr_tail = []
+
+    def _read_stderr():
+        # パイプが詰まらないように別スレッドで読み続け、長さと末尾だけ残す
+        nonlocal duration
+        for line in proc.stderr:
+            if duration is None:
+                m = _DURATION_RE.search(line)
+                if m:
+                    h, mnt, sec = m.groups()
+                    duration = int(h) * 3600 + int(mnt) * 60 + float(sec)
+            stderr_tail.append(line)
+            del stderr_tail[:-20]
+
+    reader = threading.Thread(target=_read_stderr, daemon=True)
+    reader.start()
+
+    for line in proc.stdout:
+        key, _, value = line.strip().partition("=")
+        if key == "out_time_us" and duration and on_progress:
+            try:
+                done = int(value) / 1e6
+            except ValueError:
+                continue
+            on_progress(max(0, min(99, int(done * 100 / duration))))
+
+    returncode = proc.wait()
+    reader.join(timeout=5)
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg failed (code {returncode}): {''.join(stderr_tail)[-400:]}")
+    return duration
+
+
+class _PipeReader(threading.Thread):
+    """ffmpeg の出力パイプを読み続け、writer（S3MultipartWriter / BytesIO）に書き込むスレッド"""
+
+    def __init__(self, read_fd, writer):
+        super().__init__(daemon=True)
+        self.read_fd = read_fd
+        self.writer = writer
+        self.error = None
+
+    def run(self):
+        # 書き込みに失敗したらパイプを閉じる → ffmpeg は SIGPIPE で終了して失敗扱いになる
+        try:
+            with os.fdopen(self.read_fd, "rb") as pipe:
+                for chunk in iter(lambda: pipe.read(PIPE_CHUNK_SIZE), b""):
+                    self.writer.write(chunk)
+        except Exception as e:
+            self.error = e
+
+
+def _encode_streaming(ffmpeg_exe, job, s3, on_progress, uploaded):
+    """
+    各解像度の fragmented MP4 をパイプから S3 マルチパートへ直接流す（エンコードとアップロードを並行させ、
+    出力はディスクに書かない）。ポスター画像はメモリで受けて最後にアップロードする。
+    """
+    bucket, base_key = job["bucket"], job["base_key"]
+    writers, readers, write_fds, outputs = {}, [], [], []
+    try:
+        for name, short_side, crf, audio_bitrate in VIDEO_RENDITIONS:
+            writers[name] = S3MultipartWriter(s3, bucket, f"{base_key}_{name}.mp4", content_type="video/mp4",
+                                              part_size=VIDEO_PART_SIZE)
+            read_fd, write_fd = os.pipe()
+            readers.append(_PipeReader(read_fd, writers[name]))
+            write_fds.append(write_fd)
+            outputs.append((f"pipe:{write_fd}", short_side, crf, audio_bitrate))
+        poster_buf = io.BytesIO()
+        read_fd, poster_fd = os.pipe()
+        readers.append(_PipeReader(read_fd, poster_buf))
+        write_fds.append(poster_fd)
+
+        for reader in readers:
+            reader.start()
+        cmd = build_ffmpeg_command(ffmpeg_exe, job["input_path"], outputs, f"pipe:{poster_fd}", fragmented=True)
+        fds, write_fds = write_fds, []  # 以降は run_ffmpeg_with_progress が閉じる
+        try:
+            duration = run_ffmpeg_with_progress(cmd, on_progress, pass_fds=fds)
+        finally:
+            for reader in readers:
+                reader.join()
+        errors = [r.error for r in readers if r.error]
+        if errors:
+            raise errors[0]
+
+        renditions = {}
+        for name, writer in writers.items():
+            writer.close()  # complete
+            uploaded.append(writer.key)
+            renditions[name] = writer.key
+        poster_key = None
+        if poster_buf.getbuffer().nbytes:
+            poster_key = f"{base_key}_poster.jpg"
+            s3.put_object(Bucket=bucket, Key=poster_key, Body=poster_buf.getvalue(), ContentType="image/jpeg")
+            uploaded.append(poster_key)
+        return duration, renditions, poster_key
+    finally:
+        for fd in write_fds:
+            os.close(fd)
+        for writer in writers.values():
+            writer.abort()  # complete 済みなら何もしない
+
+
+def _encode_spooled(ffmpeg_exe, job, s3, on_progress, uploaded):
+    """faststart の MP4 とポスター画像を作業ディレクトリに書き出してからアップロードする"""
+    bucket, base_key = job["bucket"], job["base_key"]
+    work_dir = tempfile.mkdtemp(prefix=f"video_{job['job_id']}_")
+    try:
+        outputs = [(os.path.join(work_dir, f"{name}.mp4"), short_side, crf, audio_bitrate)
+                   for name, short_side, crf, audio_bitrate in VIDEO_RENDITIONS]
+        poster_path = os.path.join(work_dir, "poster.jpg")
+        cmd = build_ffmpeg_command(ffmpeg_exe, job["input_path"], outputs, poster_path)
+        duration = run_ffmpeg_with_progress(cmd, on_progress)
+
+        renditions = {}
+        for (name, _, _, _), (path, _, _, _) in zip(VIDEO_RENDITIONS, outputs):
+            key = f"{base_key}_{name}.mp4"
+            s3.upload_file(path, bucket, key, ExtraArgs={"ContentType": "video/mp4"})
+            uploaded.append(key)
+            renditions[name] = key
+        poster_key = None
+        if os.path.exists(poster_path) and os.path.getsize(poster_path):
+            poster_key = f"{base_key}_poster.jpg"
+            s3.upload_file(poster_path, bucket, poster_key, ExtraArgs={"ContentType": "image/jpeg"})
+            uploaded.append(poster_key)
+        return duration, renditions, poster_key
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_video_job(job):
+    """動画 → 各解像度の MP4 とポスター画像、S3 アップロード、ジョブの更新（ワーカープロセスで実行）"""
+    import imageio_ffmpeg
+
+    s3, table = _worker_clients()
+    job_id, bucket = job["job_id"], job["bucket"]
+    uploaded = []
+
+    last = {"progress": -PROGRESS_STEP, "at": 0.0}
+
+    def _on_progress(progress):
+        now = time.monotonic()
+        if progress - last["progress"] < PROGRESS_STEP and now - last["at"] < PROGRESS_INTERVAL:
+            return
+        last["progress"], last["at"] = progress, now
+        try:
+            set_video_job_progress(job_id, progress, table=table)
+        except Exception as e:
+            logger.warning("Video job progress not recorded: job_id=%s err=%s", job_id, e)
+
+    try:
+        _on_progress(0)  # processing にする
+        encode = _encode_streaming if job.get("streaming", VIDEO_STREAM_UPLOAD) else _encode_spooled
+        start = time.perf_counter()
+        duration, renditions, poster_key = encode(imageio_ffmpeg.get_ffmpeg_exe(), job, s3, _on_progress, uploaded)
+        logger.info("Video job encoded: job_id=%s mode=%s duration=%s elapsed=%.1fs",
+                    job_id, encode.__name__, duration, time.perf_counter() - start)
+
+        finish_video_job(job_id, renditions, poster_key,
+                         video_url_for(renditions[VIDEO_DEFAULT_RENDITION], bucket),
+                         duration=duration, table=table)
+        logger.info("Video job done: job_id=%s renditions=%s", job_id, renditions)
+        return {"job_id": job_id, "status": "ready"}
+
+    except Exception as e:
+        logger.error("Video job failed: job_id=%s err=%s", job_id, e, exc_info=True)
+        for key in uploaded:
+            try:
+                s3.delete_object(Bucket=bucket, Key=key)
+            except Exception as del_err:
+                logger.warning("アップロード済み動画の削除エラー: key=%s err=%s", key, del_err)
+        fail_video_job(job_id, str(e), table=table)
+        return {"job_id": job_id, "status": "failed"}
+
+    finally:
+        _remove(job["input_path"])
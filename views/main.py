@@ -3,22 +3,20 @@ import json
 import os
 import base64
 import shutil
-import subprocess
-import tempfile
-import zipfile
 from datetime import datetime, time
 from urllib.parse import unquote
 import re
 import math
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # サードパーティライブラリ
-import boto3
-import imageio_ffmpeg as ffmpeg
 import requests
 from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 from moviepy import VideoFileClip
-from PIL import Image, ImageOps
+from PIL import Image
 from pytz import timezone as pytz_timezone
 
 # Flask関連
@@ -38,9 +36,11 @@ from flask import (
 )
 from flask_login import current_user, login_required
 from flask_mail import Mail, Message
+from itsdangerous import BadSignature, URLSafeTimedSerializer
 
 # ローカルモジュール
 from extensions import db, mail
+from models.common import auth_user_loader_stats, invalidate_user_cache
 from models.dynamodb_inquiry import InquiryDDB
 from models.main import (
     InquiryForm,
@@ -51,11 +51,37 @@ from utils.common_utils import (
     cleanup_temp_files,
     get_next_sequence_number,
     get_next_lab_sequence_number,
-    process_image,
     sanitize_filename,
 )
 from views.news.autotransplant_news import ai_collect_news
-from utils.stl_dynamo import list_stl_posts, create_stl_post, get_stl_post_by_id
+from utils.stl_dynamo import list_stl_posts, create_stl_post, get_stl_post_by_id, stl_lod_keys
+from utils.image_ingest import load_image
+from utils.prescription_dynamo import (
+    delete_prescription,
+    paginate_admin_prescriptions,
+    paginate_owner_prescriptions,
+    put_prescription,
+)
+from utils.image_jobs import (
+    IMAGE_JOB_RETRY_AFTER,
+    IMAGE_JOB_TIMEOUT,
+    ImageJobTimeout,
+    ImagePoolBusy,
+    color_analysis,
+    resize_upload_image,
+    run_image_task,
+    shade_matching_images,
+)
+from utils.s3_upload import make_s3_client, upload_files_concurrently
+from utils.direct_upload_dynamo import (
+    allow_direct_upload_init,
+    clear_pending_upload,
+    save_pending_upload,
+    stale_pending_uploads,
+)
+from utils.video_dynamo import VIDEO_STATUS_FAILED, VIDEO_STATUS_QUEUED, get_video_job
+from utils.video_jobs import submit_video_transcode, video_url_for
+from utils.user_cache import prefetch_user_profiles, user_cache_stats
 
 
 JST = pytz_timezone('Asia/Tokyo')
@@ -66,8 +92,14 @@ bp = Blueprint('main', __name__, template_folder='hoero_world/templates', static
 load_dotenv()
 
 # AWSクライアントの初期化
-s3 = boto3.client(
-    "s3",
+s3 = make_s3_client(
+    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+    region_name=os.getenv("AWS_REGION")
+)
+# 直接アップロードの署名付きURL用（SigV4 でないと Content-Length が署名に含まれない）
+direct_upload_s3 = make_s3_client(
+    signature_version="s3v4",
     aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
     aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
     region_name=os.getenv("AWS_REGION")
@@ -158,34 +190,32 @@ def index():
     # =========================
     top_stl_posts = []
     try:
-        # ★ ユーザーテーブルを取得
-        users_table = current_app.config.get("HOERO_USERS_TABLE")
-        
         stl_items = list_stl_posts(limit=2)
+
+        # ★ 著者情報をまとめて取得（キャッシュ経由、未取得分だけ BatchGetItem）
+        profiles = prefetch_user_profiles([it.get("user_id") for it in stl_items])
+
         for it in stl_items:
             pid = str(it.get("post_id", "")).strip()
             if not pid:
                 continue
 
-            # ★ 著者情報を取得
             user_id = str(it.get("user_id", ""))
-            author_name = "Unknown"
-            if users_table and user_id:
-                try:
-                    user_response = users_table.get_item(Key={"user_id": user_id})
-                    user_data = user_response.get("Item", {})
-                    if user_data:
-                        author_name = user_data.get("display_name", "Unknown")
-                except Exception as e:
-                    current_app.logger.warning(f"ユーザー情報取得エラー (user_id: {user_id}): {e}")
+            author_name = (profiles.get(user_id) or {}).get("display_name") or "Unknown"
 
             # --- YouTube ---
             youtube_url = (it.get("youtube_url", "") or it.get("youtube_embed_url", "") or "").strip()
             youtube_id = (it.get("youtube_id", "") or extract_youtube_id(youtube_url) or "").strip()
 
-            # --- STL(GLB) ---
+            # --- STL(GLB) --- トップは軽い LOD（thumb）から表示し、操作されたら preview に差し替える
             stl_key = (it.get("stl_file_path") or "").lstrip("/")
             stl_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{stl_key}" if stl_key else ""
+            lod = stl_lod_keys(it)
+            stl_thumb_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{lod['thumb']}" if lod["thumb"] else ""
+            stl_preview_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{lod['preview']}" if lod["preview"] else ""
+            # 変換時に描画したサムネイル画像があれば、3Dビューアーの代わりに表示する
+            stl_image_key = it.get("stl_thumbnail") or ""
+            stl_image_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{stl_image_key}" if stl_image_key else ""
 
             # --- Image ---
             image_key = (it.get("image_file_path") or "").lstrip("/")
@@ -202,6 +232,9 @@ def index():
                     # STL
                     stl_key=stl_key,
                     stl_url=stl_url,
+                    stl_thumb_url=stl_thumb_url,
+                    stl_preview_url=stl_preview_url,
+                    stl_image_url=stl_image_url,
                     stl_filename=it.get("stl_filename", ""),
 
                     # YouTube
@@ -369,48 +402,8 @@ def shade_matching_upload():
         return render_template('main/shade_matching.html', image_data=None, error='ファイルが選択されていません')
 
     try:
-        # RAWファイルか判定して読み込み
-        raw_extensions = {'.nef', '.nrw', '.cr2', '.cr3', '.crw', '.arw', '.srf',
-                          '.sr2', '.dng', '.raf', '.rw2', '.orf', '.pef', '.raw',
-                          '.rwl', '.mrw', '.x3f', '.erf'}
-        filename_lower = (file.filename or '').lower()
-        ext = os.path.splitext(filename_lower)[1]
-
-        if ext in raw_extensions:
-            import rawpy
-            file_bytes = file.read()
-            with rawpy.imread(io.BytesIO(file_bytes)) as raw:
-                rgb_array = raw.postprocess(use_camera_wb=True, output_bps=8)
-            img = Image.fromarray(rgb_array)
-        else:
-            img = Image.open(file)
-            # EXIF情報に基づいて自動回転
-            try:
-                from PIL import ImageOps
-                img = ImageOps.exif_transpose(img)
-            except Exception:
-                pass
-
-        # RGBに変換（PNG等に対応）
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-
-        # 横幅2500px超の場合のみリサイズ（縦は比率維持）
-        if img.width > 2500:
-            scale = 2500 / img.width
-            new_height = int(img.height * scale)
-            try:
-                resample = Image.Resampling.LANCZOS
-            except AttributeError:
-                resample = Image.LANCZOS  # type: ignore[attr-defined]
-            img = img.resize((2500, new_height), resample)
-
-        assert img is not None
-
-        # カラー画像をJPEG変換（バイト列として保持）
-        buffered_color = io.BytesIO()
-        img.save(buffered_color, format='JPEG', quality=85)
-        color_bytes = buffered_color.getvalue()
+        # RAW現像・縮小・JPEG変換は画像処理プロセスで行う（カラーと彩度0の2枚）
+        color_bytes, gray_bytes = run_image_task(shade_matching_images, file.read(), file.filename)
 
         # S3に保存（カラー）
         safe_filename = sanitize_filename(file.filename)
@@ -422,13 +415,6 @@ def shade_matching_upload():
             ExtraArgs={'ContentType': 'image/jpeg'}
         )
 
-        # デサチュレーション（彩度を0にする）
-        from PIL import ImageEnhance
-        img_gray = ImageEnhance.Color(img).enhance(0)
-        buffered_gray = io.BytesIO()
-        img_gray.save(buffered_gray, format='JPEG', quality=85)
-        gray_bytes = buffered_gray.getvalue()
-
         # Base64でテンプレートへ渡す
         img_str = base64.b64encode(color_bytes).decode()
         img_gray_str = base64.b64encode(gray_bytes).decode()
@@ -439,23 +425,15 @@ def shade_matching_upload():
                                s3_key=s3_key,
                                error=None)
 
+    except ImagePoolBusy:
+        return render_template('main/shade_matching.html', image_data=None, image_gray=None, s3_key=None,
+                               error='画像処理が混み合っています。しばらくしてからもう一度お試しください'), \
+            429, {'Retry-After': str(IMAGE_JOB_RETRY_AFTER)}
     except Exception as e:
         import traceback
         traceback.print_exc()
         return render_template('main/shade_matching.html', image_data=None, image_gray=None, s3_key=None, error=str(e))
 
-def save_resized_upload(file, save_path, max_width=1500):
-    """
-    アップロードされた画像を最大幅でリサイズして保存。
-    """
-    img = Image.open(file)
-    if img.width > max_width:
-        scale = max_width / img.width
-        new_height = int(img.height * scale)
-        img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-    img.save(save_path)
-    print(f"画像保存成功: {save_path}")  # ← これを追加しておくと確認しやすい
-
 @bp.route('/colors_image_upload', methods=['GET', 'POST'])
 def colors_image_upload():
     if 'file' not in request.files:
@@ -466,43 +444,30 @@ def colors_image_upload():
         return 'ファイルが選択されていません', 400
 
     try:
-        # ファイルの保存先（リサイズ保存）
         safe_filename = sanitize_filename(file.filename)
-        
-        filename = os.path.join(current_app.config['UPLOAD_FOLDER'], safe_filename)       
-
-        # filename = os.path.join(current_app.config['UPLOAD_FOLDER'], file.filename)
-        save_resized_upload(file, filename)  # 小さくしてローカル保存
-
-        # リサイズ後の画像をS3にアップロード
-        with open(filename, "rb") as f:
-            s3.upload_fileobj(
-                f,
-                os.getenv('BUCKET_NAME'),
-                # f'analysis_original/{file.filename}',
-                f'analysis_original/{safe_filename}',
-                ExtraArgs={'ContentType': 'image/png'}
-            )
 
-        # 処理実行
-        # result_img = process_image(filename)
-        result_img, color_data = process_image(filename)
+        # 画像処理プロセスでメモリ上で1回だけデコードし、横幅1500pxに縮小して主要色を抽出
+        # （色の抽出と元画像の縮小版は同じ画像から作る。ディスクには書かない）
+        upload_bytes, fmt, result_png, color_data = run_image_task(color_analysis, file.read())
 
-        # 結果画像をBase64でテンプレートへ
-        buffered = io.BytesIO()
-        result_img.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        # 縮小した画像をS3にアップロード
+        s3.upload_fileobj(
+            io.BytesIO(upload_bytes),
+            os.getenv('BUCKET_NAME'),
+            f'analysis_original/{safe_filename}',
+            ExtraArgs={'ContentType': Image.MIME.get(fmt, 'application/octet-stream')}
+        )
 
-        # ローカルファイル削除
-        if os.path.exists(filename):
-            os.remove(filename)
+        # 結果画像をBase64でテンプレートへ
+        img_str = base64.b64encode(result_png).decode()
 
         return render_template('main/result.html', image_data=img_str, color_data=color_data)
 
+    except ImagePoolBusy:
+        return '画像処理が混み合っています。しばらくしてからもう一度お試しください', \
+            429, {'Retry-After': str(IMAGE_JOB_RETRY_AFTER)}
     except Exception as e:
         print(f"Error occurred: {str(e)}")
-        if os.path.exists(filename):
-            os.remove(filename)
         return str(e), 500
 
 @bp.route('/ugu_box')
@@ -732,63 +697,43 @@ def prescription_list():
         return blocked
 
     prescriptions_table = current_app.config["PRESCRIPTIONS_TABLE"]
+    PER_PAGE = 60
 
     if current_user.is_administrator:
-        # 通常テーブル: 3ds・lab・ReArch-は除外
-        items = []
-        scan_kwargs = {"FilterExpression":
-            (Attr("source").not_exists() | (Attr("source").ne("3ds") & Attr("source").ne("lab")))
-            & ~Attr("prescription_id").begins_with("ReArch-")
-        }
-        while True:
-            resp = prescriptions_table.scan(**scan_kwargs)
-            items.extend(resp.get("Items", []))
-            last = resp.get("LastEvaluatedKey")
-            if not last:
-                break
-            scan_kwargs["ExclusiveStartKey"] = last
-        # ラボテーブル（ReArch Design）を追加
-        lab_table = current_app.config["LAB_PRESCRIPTIONS_TABLE"]
-        lab_kwargs = {}
-        while True:
-            resp = lab_table.scan(**lab_kwargs)
-            items.extend(resp.get("Items", []))
-            last = resp.get("LastEvaluatedKey")
-            if not last:
-                break
-            lab_kwargs["ExclusiveStartKey"] = last
-    else:
-        from boto3.dynamodb.conditions import Key
-        # labアカウントは専用テーブルを参照
-        query_table = (
-            current_app.config["LAB_PRESCRIPTIONS_TABLE"]
-            if getattr(current_user, 'account_type', 'clinic') == 'lab'
-            else prescriptions_table
-        )
-        resp = query_table.query(
-            IndexName="user_id-created_at-index",
-            KeyConditionExpression=Key("user_id").eq(current_user.email),
-            ScanIndexForward=False,
-        )
-        items = resp.get("Items", [])
-
-    # 新しい順にソート
-    items.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-
-    # ページネーション（50件ごと）
-    PER_PAGE = 60
-    page = request.args.get('page', 1, type=int)
-    total = len(items)
-    total_pages = max(1, (total + PER_PAGE - 1) // PER_PAGE)
-    page = max(1, min(page, total_pages))
-    start = (page - 1) * PER_PAGE
-    items = items[start:start + PER_PAGE]
+        # 通常テーブル（3ds・lab・ReArch-は除外）とラボテーブルを新しい順に、1ページ分だけ索引から読む
+        page_data = paginate_admin_prescriptions(tok=request.args.get('tok'), per_page=PER_PAGE)
+        total = page_data["total"]
+        page = max(1, request.args.get('page', 1, type=int))
+        return render_template('main/prescription_list.html',
+                               prescriptions=page_data["items"],
+                               page=page,
+                               total_pages=max(1, (total + PER_PAGE - 1) // PER_PAGE),
+                               total=total,
+                               has_prev=page_data["has_prev"],
+                               has_next=page_data["has_next"],
+                               prev_tok=page_data["prev_tok"],
+                               next_tok=page_data["next_tok"])
+
+    # labアカウントは専用テーブルを参照
+    query_table = (
+        current_app.config["LAB_PRESCRIPTIONS_TABLE"]
+        if getattr(current_user, 'account_type', 'clinic') == 'lab'
+        else prescriptions_table
+    )
+    # 自分の指示書を新しい順に、1ページ分だけ索引から読む
+    page_data = paginate_owner_prescriptions(query_table, user_id=current_user.email,
+                                             tok=request.args.get('tok'), per_page=PER_PAGE)
+    page = max(1, request.args.get('page', 1, type=int))
 
     return render_template('main/prescription_list.html',
-                           prescriptions=items,
+                           prescriptions=page_data["items"],
                            page=page,
-                           total_pages=total_pages,
-                           total=total)
+                           total_pages=None,
+                           total=None,
+                           has_prev=page_data["has_prev"],
+                           has_next=page_data["has_next"],
+                           prev_tok=page_data["prev_tok"],
+                           next_tok=page_data["next_tok"])
 
 
 @bp.route('/prescription/view/<prescription_id>', methods=['GET'])
@@ -934,28 +879,14 @@ def prescription_edit(prescription_id):
         # 画像アップロード（リサイズ・EXIF補正・JPEG圧縮）
         new_images = request.files.getlist("images[]")
         image_keys = list(p.get("image_keys") or [])
-        _fmt_map = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.gif': 'GIF', '.webp': 'WEBP'}
         _ct_map  = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'GIF': 'image/gif', 'WEBP': 'image/webp'}
         for img_file in new_images:
             if not img_file or not img_file.filename:
                 continue
             try:
-                raw = Image.open(io.BytesIO(img_file.read()))
-                pil_img = ImageOps.exif_transpose(raw) or raw
-                if pil_img.width > 2000:
-                    new_h = int(pil_img.height * 2000 / pil_img.width)
-                    pil_img = pil_img.resize((2000, new_h), Image.Resampling.LANCZOS)
                 safe_name = sanitize_filename(img_file.filename)
-                ext  = os.path.splitext(safe_name)[1].lower()
-                fmt  = _fmt_map.get(ext, 'JPEG')
-                if fmt == 'JPEG' and pil_img.mode in ('RGBA', 'P', 'LA'):
-                    pil_img = pil_img.convert('RGB')
-                buf = io.BytesIO()
-                if fmt == 'JPEG':
-                    pil_img.save(buf, format='JPEG', quality=90)
-                else:
-                    pil_img.save(buf, format=fmt)
-                buf.seek(0)
+                body, fmt, _ = _resize_upload_image(img_file, safe_name)
+                buf = io.BytesIO(body)
                 key = f"prescriptions/{prescription_id}/images/{ts}_{safe_name}"
                 s3.upload_fileobj(buf, BUCKET_NAME, key,
                                   ExtraArgs={"ContentType": _ct_map.get(fmt, 'image/jpeg')})
@@ -979,7 +910,7 @@ def prescription_edit(prescription_id):
                     current_app.logger.error("ファイルアップロードエラー: %s", e)
         p["s3_keys"] = s3_keys
 
-        prescriptions_table.put_item(Item=p)
+        put_prescription(prescriptions_table, p)
         flash("指示書を更新しました")
         return redirect(url_for("main.prescription_view", prescription_id=prescription_id))
 
@@ -1023,7 +954,7 @@ def prescription_delete(prescription_id):
             s3.delete_object(Bucket=BUCKET_NAME, Key=key)
         except Exception:
             pass
-    prescriptions_table.delete_item(Key={"prescription_id": prescription_id})
+    delete_prescription(prescriptions_table, prescription_id)
     flash("指示書を削除しました")
     return redirect(url_for("main.prescription_list"))
 
@@ -1164,55 +1095,23 @@ def clinic_view(user_id):
     clinic = resp.get("Item")
     if not clinic:
         abort(404)
-    from boto3.dynamodb.conditions import Key as DKey
-    merged = {}
-    clinic_id_val = clinic.get("clinic_id")
-
     # クエリ対象テーブルを決定（labアカウントはlab専用テーブル、その他はメインテーブル）
     is_lab_clinic = clinic.get("account_type") == "lab"
-    tables_to_query = []
-    if is_lab_clinic:
-        tables_to_query.append(current_app.config["LAB_PRESCRIPTIONS_TABLE"])
-    else:
-        tables_to_query.append(current_app.config["PRESCRIPTIONS_TABLE"])
-
-    for tbl in tables_to_query:
-        # clinic_id GSI クエリ
-        if clinic_id_val:
-            try:
-                p_resp = tbl.query(
-                    IndexName="clinic_id-created_at-index",
-                    KeyConditionExpression=DKey("clinic_id").eq(clinic_id_val),
-                    ScanIndexForward=False,
-                )
-                for item in p_resp.get("Items", []):
-                    merged[item["prescription_id"]] = item
-            except Exception:
-                pass
-        # user_id GSI クエリ
-        try:
-            p_resp2 = tbl.query(
-                IndexName="user_id-created_at-index",
-                KeyConditionExpression=DKey("user_id").eq(user_id),
-                ScanIndexForward=False,
-            )
-            for item in p_resp2.get("Items", []):
-                merged[item["prescription_id"]] = item
-        except Exception:
-            pass
-
-    all_prescriptions = sorted(merged.values(), key=lambda x: x.get("created_at", ""), reverse=True)
+    tbl = current_app.config["LAB_PRESCRIPTIONS_TABLE" if is_lab_clinic else "PRESCRIPTIONS_TABLE"]
 
+    # clinic_id と user_id の両方の索引を新しい順に読み、重複を除いて1ページ分だけ取る
     PER_PAGE = 30
-    page = request.args.get('page', 1, type=int)
-    total = len(all_prescriptions)
-    total_pages = max(1, (total + PER_PAGE - 1) // PER_PAGE)
-    page = max(1, min(page, total_pages))
-    prescriptions = all_prescriptions[(page - 1) * PER_PAGE : page * PER_PAGE]
+    page_data = paginate_owner_prescriptions(tbl, user_id=user_id, clinic_id=clinic.get("clinic_id"),
+                                             tok=request.args.get('tok'), per_page=PER_PAGE)
+    page = max(1, request.args.get('page', 1, type=int))
 
     return render_template('main/clinic_view.html', clinic=clinic,
-                           prescriptions=prescriptions,
-                           page=page, total_pages=total_pages, total=total)
+                           prescriptions=page_data["items"],
+                           page=page,
+                           has_prev=page_data["has_prev"],
+                           has_next=page_data["has_next"],
+                           prev_tok=page_data["prev_tok"],
+                           next_tok=page_data["next_tok"])
 
 
 @bp.route('/clinic/list', methods=['GET'])
@@ -1315,6 +1214,7 @@ def clinic_new():
         if email:
             new_item['email'] = email
         users_table.put_item(Item=new_item)
+        invalidate_user_cache(user_id)
         flash(f'{sender_name}（{clinic_id}）を登録しました。')
         return redirect(url_for('main.clinic_list'))
 
@@ -1357,6 +1257,7 @@ def dentist_add():
             UpdateExpression="SET dentists = :d",
             ExpressionAttributeValues={":d": dentists},
         )
+        invalidate_user_cache(current_user.user_id)
         current_user.dentists = dentists
     return _json.dumps({"dentists": dentists}), 200, {"Content-Type": "application/json"}
 
@@ -1377,85 +1278,346 @@ def meziro_upload_index():
         user_email=user_email,
     )
 
-@bp.route('/meziro_upload', methods=['POST'])
-def meziro_upload():
+def _parse_json_list(raw, field, log):
+    try:
+        value = json.loads(raw)
+        if not isinstance(value, list):
+            raise ValueError(f"{field} is not list")
+        return value
+    except Exception as e:
+        log.warning("%s のJSONパース失敗: raw=%s err=%s", field, (raw or "")[:200], e)
+        return []
+
+
+def _read_order_form(form):
+    """meziro_upload 系フォームの受信値をまとめる"""
     log = current_app.logger
-    log.info("=== /meziro_upload START === ip=%s ua=%s", request.remote_addr, request.headers.get("User-Agent"))
+    return SimpleNamespace(
+        business_name     = form.get('businessName', ''),
+        user_name         = form.get('userName', ''),
+        user_email        = form.get('userEmail', ''),
+        user_phone        = form.get('userPhone', ''),
+        patient_name      = form.get('patientName', '') or form.get('PatientName', ''),  # どちらか来る想定なら保険
+        patient_name_kana = form.get('patientNameKana', '') or form.get('PatientNameKana', ''),
+        chart_number      = form.get('chartNumber', ''),
+        appointment_date  = form.get('appointmentDate', ''),
+        appointment_hour  = form.get('appointmentHour', ''),
+        project_type      = form.get('projectType', ''),
+        quantity          = form.get('quantity', '1'),
+        implant_holes     = form.get('implantHoles', ''),
+        disc_thickness    = form.get('discThickness', ''),
+        block_material    = form.get('blockMaterial', ''),
+        block_quantity    = form.get('blockQuantity', '1'),
+        block_material_2  = form.get('blockMaterial2', ''),
+        block_quantity_2  = form.get('blockQuantity2', '1'),
+        crown_type        = form.get('crown_type', ''),
+        teeth             = _parse_json_list(form.get('teeth', '[]'), 'teeth', log),
+        teeth_abutment    = _parse_json_list(form.get('teeth_abutment', '[]'), 'teeth_abutment', log),
+        teeth_missing     = _parse_json_list(form.get('teeth_missing', '[]'), 'teeth_missing', log),
+        teeth_fabrication = _parse_json_list(form.get('teeth_fabrication', '[]'), 'teeth_fabrication', log),
+        shade             = form.get('shade', ''),
+        message           = form.get('userMessage', '') or "",
+    )
 
-    received_at = datetime.now(pytz_timezone("Asia/Tokyo"))
-    received_at_str = received_at.strftime("%Y-%m-%d %H:%M:%S")
 
-    # 受信フォーム値
-    business_name    = request.form.get('businessName', '')
-    user_name        = request.form.get('userName', '')
-    user_email       = request.form.get('userEmail', '')
-    user_phone       = request.form.get('userPhone', '')
-    patient_name     = request.form.get('patientName', '') or request.form.get('PatientName', '')  # どちらか来る想定なら保険
-    patient_name_kana = request.form.get('patientNameKana', '') or request.form.get('PatientNameKana', '')
-    chart_number     = request.form.get('chartNumber', '')
-    appointment_date = request.form.get('appointmentDate', '')
-    appointment_hour = request.form.get('appointmentHour', '')
-    project_type     = request.form.get('projectType', '')
-    quantity         = request.form.get('quantity', '1')
-    implant_holes    = request.form.get('implantHoles', '')
-    disc_thickness   = request.form.get('discThickness', '')
-    block_material   = request.form.get('blockMaterial', '')
-    block_quantity   = request.form.get('blockQuantity', '1')
-    block_material_2 = request.form.get('blockMaterial2', '')
-    block_quantity_2 = request.form.get('blockQuantity2', '1')
-    crown_type       = request.form.get('crown_type', '')
-    teeth_raw          = request.form.get('teeth', '[]')
-    teeth_abutment_raw = request.form.get('teeth_abutment', '[]')
-    teeth_missing_raw  = request.form.get('teeth_missing', '[]')
-    shade            = request.form.get('shade', '')
-    message          = request.form.get('userMessage', '')
-
-    # teeth のJSONパース
-    try:
-        teeth = json.loads(teeth_raw)
-        if not isinstance(teeth, list):
-            raise ValueError("teeth is not list")
-    except Exception as e:
-        log.warning("teeth のJSONパース失敗: raw=%s err=%s", teeth_raw[:200], e)
-        teeth = []
-    try:
-        teeth_abutment = json.loads(teeth_abutment_raw)
-        if not isinstance(teeth_abutment, list): teeth_abutment = []
-    except Exception:
-        teeth_abutment = []
-    try:
-        teeth_missing = json.loads(teeth_missing_raw)
-        if not isinstance(teeth_missing, list): teeth_missing = []
-    except Exception:
-        teeth_missing = []
-    teeth_fabrication_raw = request.form.get('teeth_fabrication', '[]')
-    try:
-        teeth_fabrication = json.loads(teeth_fabrication_raw)
-        if not isinstance(teeth_fabrication, list): teeth_fabrication = []
-    except Exception:
-        teeth_fabrication = []
+def _validate_order(order):
+    """必須チェック。エラーなら (メッセージ, 400) を返す"""
+    log = current_app.logger
 
     # フォーム要約ログ（個人情報はマスキング）
-    masked_email = (user_email[:2] + "***@***") if user_email else ""
-    masked_name  = (user_name[:1] + "***") if user_name else ""
+    masked_email = (order.user_email[:2] + "***@***") if order.user_email else ""
+    masked_name  = (order.user_name[:1] + "***") if order.user_name else ""
     log.info(
         "Form summary: business=%s, user=%s, email=%s, project=%s, crown=%s, shade=%s, teeth_count=%d",
-        business_name, masked_name, masked_email, project_type, crown_type, shade, len(teeth)
+        order.business_name, masked_name, masked_email, order.project_type, order.crown_type, order.shade, len(order.teeth)
     )
 
     # 必須チェック（warning で記録）
-    if not message:
-        message = ""
-    _is_lab = current_user.is_authenticated and getattr(current_user, 'account_type', 'clinic') == 'lab'
-    if not user_name and not _is_lab:
+    if not order.user_name and not _is_lab_user():
         log.warning("必須エラー: user_name が空")
-        return jsonify({'error': '送信者名が入力されていません'}), 400
-    if not user_email:
+        return '送信者名が入力されていません'
+    if not order.user_email:
         log.warning("必須エラー: user_email が空")
-        return jsonify({'error': 'メールアドレスが入力されていません'}), 400
-    if not project_type:
+        return 'メールアドレスが入力されていません'
+    if not order.project_type:
         log.warning("必須エラー: project_type が空")
-        return jsonify({'error': '製作物が選択されていません'}), 400
+        return '製作物が選択されていません'
+    return None
+
+
+def _is_lab_user():
+    return current_user.is_authenticated and getattr(current_user, 'account_type', 'clinic') == 'lab'
+
+
+def _allocate_order_id(is_lab_order):
+    """受付番号の採番（歯科技工所は専用カウンター）。(id_str, warning_message) を返す"""
+    if is_lab_order:
+        return get_next_lab_sequence_number('lab_rearch', 'ReArch'), None
+    session_id, warning_message = get_next_sequence_number()
+    return f"{session_id:05d}", warning_message
+
+
+def _order_info_text(order, id_str, received_at_str):
+    """ZIP に同梱する受付内容テキスト"""
+    return (
+        f"【受付番号】No.{id_str}\n"
+        f"【受信日時】{received_at_str}\n\n"
+        f"【事業者名】{order.business_name}\n"
+        f"【送信者名】{order.user_name}\n"
+        f"【メールアドレス】{order.user_email}\n"
+        f"【カルテ番号】{order.chart_number}\n"
+        f"【患者名】{order.patient_name}　{order.patient_name_kana}\n"
+        f"【セット希望日時】{order.appointment_date} {order.appointment_hour}時\n"
+        f"【製作物】{order.project_type}\n"
+        f"【クラウン種別】{order.crown_type}\n"
+        f"【対象部位】{', '.join(order.teeth)}\n"
+        f"【シェード】{order.shade}\n"
+        f"【メッセージ】\n{order.message.strip()}\n\n"
+        "  渋谷歯科技工所\n"
+        "  〒343-0845\n"
+        "  埼玉県越谷市南越谷4-9-6 新越谷プラザビル203\n"
+        "  TEL: 048-961-8151\n"
+        "  email:shibuya8020@gmail.com"
+    )
+
+
+def _resize_upload_image(img_file, filename, max_width=2000):
+    """
+    添付画像を画像処理プロセスで縮小し、(バイト列, 形式, 横幅) を返す。
+    指示書・注文の画像は落とせないので、受付枠が空くまで待ち、それでも空かない・時間内に終わらない・
+    画像処理プロセスが落ちた場合はこのプロセスで処理する。
+    """
+    data = img_file.read()
+    try:
+        return run_image_task(resize_upload_image, data, filename, max_width, wait=IMAGE_JOB_TIMEOUT)
+    except (ImagePoolBusy, ImageJobTimeout, BrokenProcessPool) as e:
+        current_app.logger.warning("画像処理プロセスを使えないためこのプロセスで縮小: %s (%s)", filename, type(e).__name__)
+        return resize_upload_image(data, filename, max_width)
+
+
+def _upload_order_images(images, id_str, bucket_name):
+    """画像ファイルの処理（リサイズ → S3保存）。S3キーのリストを返す"""
+    log = current_app.logger
+    image_keys = []
+    img_prefix = f"meziro/{id_str}/images/"
+    ct_map  = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'GIF': 'image/gif', 'WEBP': 'image/webp'}
+    for idx, img_file in enumerate(images, start=1):
+        if not img_file or not img_file.filename:
+            continue
+        try:
+            # 縮小デコード → EXIF回転補正 → 横幅2000pxに縮小（画像処理プロセスで行う）
+            orig_name = sanitize_filename(img_file.filename)
+            body, fmt, final_w = _resize_upload_image(img_file, orig_name)
+            buf = io.BytesIO(body)
+            s3_img_key = f"{img_prefix}{idx:03d}_{orig_name}"
+            s3.upload_fileobj(buf, bucket_name, s3_img_key,
+                              ExtraArgs={'ContentType': ct_map.get(fmt, 'image/jpeg')})
+            image_keys.append(s3_img_key)
+            log.info("画像S3アップロードOK: key=%s w=%d", s3_img_key, final_w)
+        except Exception as img_err:
+            log.error("画像処理エラー: filename=%s err=%s", img_file.filename, img_err, exc_info=True)
+    return image_keys
+
+
+def _finish_order(order, id_str, received_at_str, uploaded_urls, image_keys, is_lab_order, warning_message,
+                  claim=False):
+    """
+    通知メール送信と指示書の DynamoDB 保存（アップロード完了後の共通処理）。
+    claim=True なら指示書を「同じ受付番号がまだ無いときだけ」先に保存し、既にあれば何もせず False を返す
+    （直接アップロードの finalize を二重送信・リトライされても、指示書とメールを二重に作らない）。
+    """
+    if claim:
+        if not _save_order_prescription(order, id_str, received_at_str, uploaded_urls, image_keys, is_lab_order,
+                                        condition="attribute_not_exists(prescription_id)"):
+            current_app.logger.info("受付No.%s は処理済みのため、指示書保存・メール送信をスキップ", id_str)
+            return False
+        _send_order_mails(order, id_str, received_at_str, uploaded_urls, is_lab_order, warning_message)
+        return True
+
+    _send_order_mails(order, id_str, received_at_str, uploaded_urls, is_lab_order, warning_message)
+    _save_order_prescription(order, id_str, received_at_str, uploaded_urls, image_keys, is_lab_order)
+    return True
+
+
+def _send_order_mails(order, id_str, received_at_str, uploaded_urls, is_lab_order, warning_message):
+    """管理者への通知メールと送信者への受付確認メール（ラボ注文は送らない）"""
+    log = current_app.logger
+
+    # メール本文
+    url_text = "\n".join(uploaded_urls)
+    full_message = f"""ユーザーから以下のメッセージが届きました：
+
+【受付番号】No.{id_str}
+【受信日時】{received_at_str}
+【事業者名】{order.business_name}
+【送信者名】{order.user_name}
+【メールアドレス】{order.user_email}
+【カルテ番号】{order.chart_number}
+【患者名】{order.patient_name}　{order.patient_name_kana}
+【セット希望日時】{order.appointment_date} {order.appointment_hour}時
+【製作物】{order.project_type}
+【クラウン種別】{order.crown_type}
+【対象部位】{", ".join(order.teeth)}
+【シェード】{order.shade}
+【メッセージ】
+{order.message}
+
+【アップロードされたファイルリンク】
+{url_text}
+"""
+    if warning_message:
+        full_message += f"\n\n⚠️ システム警告：{warning_message}\n"
+        log.warning("採番時警告: %s", warning_message)
+
+    if not is_lab_order:
+        # 管理者へ
+        try:
+            msg = Message(
+                subject=f"【仕事が来たよ】No.{id_str}",
+                recipients=[os.getenv("MAIL_NOTIFICATION_RECIPIENT")],
+                reply_to="shibuya8020@gmail.com",
+                body=full_message
+            )
+            mail.send(msg)
+            log.info("メール送信成功（管理者）")
+        except Exception as e:
+            log.error("メール送信失敗（管理者）: %s", e, exc_info=True)
+
+        # 送信者へ
+        try:
+            confirmation_msg = Message(
+                subject=f"【受付完了】No.{id_str} 技工指示の受付を承りました",
+                recipients=[order.user_email],
+                reply_to="shibuya8020@gmail.com",
+                body=f"""{order.user_name} 様
+
+この度は技工指示を送信いただき、誠にありがとうございます。
+以下の内容で受付を完了いたしました。
+
+【受付番号】No.{id_str}
+【受信日時】{received_at_str}
+【事業者名】{order.business_name}
+【送信者名】{order.user_name}
+【メールアドレス】{order.user_email}
+【カルテ番号】{order.chart_number}
+【患者名】{order.patient_name}　{order.patient_name_kana}
+【セット希望日時】{order.appointment_date} {order.appointment_hour}時
+【製作物】{order.project_type}
+【クラウン種別】{order.crown_type}
+【対象部位】{", ".join(order.teeth)}
+【シェード】{order.shade}
+【メッセージ】
+{order.message}
+
+ファイルを確認の上、内容に応じて対応させていただきます。
+万が一、内容に不備がある場合は別途ご連絡させていただきます。
+
+--------------------------------
+渋谷歯科技工所
+〒343-0845 埼玉県越谷市南越谷4-9-6 新越谷プラザビル203
+TEL: 048-961-8151
+email: shibuya8020@gmail.com
+"""
+            )
+            mail.send(confirmation_msg)
+            log.info("送信者への確認メール送信成功")
+        except Exception as e:
+            log.error("送信者への確認メール送信失敗: %s", e, exc_info=True)
+    else:
+        log.info("ラボ注文のためメール通知スキップ: %s", id_str)
+
+
+def _save_order_prescription(order, id_str, received_at_str, uploaded_urls, image_keys, is_lab_order, condition=None):
+    """
+    指示書を DynamoDB に保存する。condition を満たさなかった（既に保存済み）ときだけ False を返す。
+    それ以外の保存失敗はログに残して True を返す（受付自体は止めない）。
+    """
+    log = current_app.logger
+
+    try:
+        business_name = order.business_name
+
+        # clinic_id・business_name を user_id（メール）から取得
+        clinic_id_for_prescription = None
+        if current_user.is_authenticated:
+            clinic_id_for_prescription = getattr(current_user, 'clinic_id', None)
+            if not business_name:
+                business_name = getattr(current_user, 'sender_name', '') or ''
+        if not clinic_id_for_prescription or not business_name:
+            try:
+                users_table = current_app.config["HOERO_USERS_TABLE"]
+                u = users_table.get_item(Key={'user_id': order.user_email}).get('Item', {})
+                if not clinic_id_for_prescription:
+                    clinic_id_for_prescription = u.get('clinic_id')
+                if not business_name:
+                    business_name = u.get('sender_name', '')
+            except Exception:
+                pass
+
+        prescription_item = {
+            "prescription_id": id_str,
+            "user_id":         order.user_email,
+            "user_phone":      order.user_phone,
+            "business_name":   business_name,
+            "user_name":       order.user_name,
+            "patient_name":    order.patient_name,
+            "patient_name_kana": order.patient_name_kana,
+            "chart_number":    order.chart_number,
+            "appointment_date": order.appointment_date,
+            "appointment_hour": str(order.appointment_hour),
+            "project_type":    order.project_type,
+            "quantity":        order.quantity,
+            **({"implant_holes": order.implant_holes} if order.implant_holes else {}),
+            **({"disc_thickness": order.disc_thickness} if order.disc_thickness else {}),
+            **({"block_material": order.block_material, "block_quantity": order.block_quantity} if order.block_material else {}),
+            **({"block_material_2": order.block_material_2, "block_quantity_2": order.block_quantity_2} if order.block_material_2 else {}),
+            "crown_type":      order.crown_type,
+            "teeth":           order.teeth,
+            "teeth_abutment":     order.teeth_abutment,
+            "teeth_missing":      order.teeth_missing,
+            "teeth_fabrication":  order.teeth_fabrication,
+            "shade":           order.shade,
+            "message":         order.message,
+            "s3_keys":         [k.split('/meziro/download/')[-1] if '/meziro/download/' in k else k for k in uploaded_urls],
+            "image_keys":      image_keys,
+            "status":          "受付中",
+            "created_at":      received_at_str,
+            "updated_at":      received_at_str,
+        }
+        if clinic_id_for_prescription:
+            prescription_item["clinic_id"] = clinic_id_for_prescription
+        if is_lab_order:
+            prescription_item["source"] = "lab"
+
+        save_table = (
+            current_app.config["LAB_PRESCRIPTIONS_TABLE"]
+            if is_lab_order
+            else current_app.config["PRESCRIPTIONS_TABLE"]
+        )
+        put_prescription(save_table, prescription_item, lab_table=is_lab_order, condition=condition)
+        log.info("指示書をDynamoDBに保存: prescription_id=%s", id_str)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+            return False
+        log.error("指示書のDynamoDB保存失敗: %s", e, exc_info=True)
+    except Exception as e:
+        log.error("指示書のDynamoDB保存失敗: %s", e, exc_info=True)
+    return True
+
+
+@bp.route('/meziro_upload', methods=['POST'])
+def meziro_upload():
+    log = current_app.logger
+    log.info("=== /meziro_upload START === ip=%s ua=%s", request.remote_addr, request.headers.get("User-Agent"))
+
+    received_at = datetime.now(pytz_timezone("Asia/Tokyo"))
+    received_at_str = received_at.strftime("%Y-%m-%d %H:%M:%S")
+
+    # 受信フォーム値
+    order = _read_order_form(request.form)
+    error = _validate_order(order)
+    if error:
+        return jsonify({'error': error}), 400
 
     files = request.files.getlist('files[]')
     has_files = bool(files and files[0].filename != '')
@@ -1467,22 +1629,15 @@ def meziro_upload():
 
     uploaded_urls = []
     numbered_ids  = []
+    failed_files  = []
 
     # フォルダ構造の有無
     has_folder = request.form.get('has_folder_structure', 'false').lower() == 'true'
     log.info("フォルダ構造フラグ: %s", has_folder)
 
     # 受付番号の採番（歯科技工所は専用カウンター）
-    is_lab_order = (
-        current_user.is_authenticated
-        and getattr(current_user, 'account_type', 'clinic') == 'lab'
-    )
-    if is_lab_order:
-        id_str = get_next_lab_sequence_number('lab_rearch', 'ReArch')
-        warning_message = None
-    else:
-        session_id, warning_message = get_next_sequence_number()
-        id_str = f"{session_id:05d}"
+    is_lab_order = _is_lab_user()
+    id_str, warning_message = _allocate_order_id(is_lab_order)
     log.info("発行受付番号: No.%s", id_str)
 
     # S3 バケット/リージョン
@@ -1500,317 +1655,390 @@ def meziro_upload():
             # ラボ注文: ZIPスキップ・直接アップロード
             folder_prefix = f"lab/{id_str}/"
             log.info("ラボ直接アップロード: prefix=%s, 件数=%d", folder_prefix, len(files))
+            jobs = []
             for index, f_obj in enumerate(files, start=1):
                 if not f_obj or not f_obj.filename:
                     continue
                 safe_filename = sanitize_filename(f_obj.filename)
+                # 受付番号（アトミックなカウンターで採番）+ 連番で一意に決まるので、存在確認は不要
                 s3_key = f"{folder_prefix}{id_str}_{index:03d}_{safe_filename}"
-                s3_key = get_unique_filename(bucket_name, s3_key)
-                s3.upload_fileobj(
-                    f_obj, bucket_name, s3_key,
-                    ExtraArgs={'ContentType': 'application/octet-stream'}
-                )
-                download_url = url_for('main.meziro_download', key=s3_key, _external=True)
+                jobs.append(SimpleNamespace(
+                    fileobj=f_obj,
+                    key=s3_key,
+                    extra_args={'ContentType': 'application/octet-stream'},
+                    index=index,
+                    filename=f_obj.filename,
+                ))
+
+            # ファイルごとのアップロードを並列化（結果は jobs と同じ順序）
+            for job, result in zip(jobs, upload_files_concurrently(s3, bucket_name, jobs)):
+                if not result.ok:
+                    failed_files.append(job.filename)
+                    continue
+                download_url = url_for('main.meziro_download', key=result.key, _external=True)
                 uploaded_urls.append(download_url)
-                numbered_ids.append(f"{id_str}_{index:03d}")
-                log.info("ラボS3アップロードOK: key=%s", s3_key)
+                numbered_ids.append(f"{id_str}_{job.index:03d}")
+            log.info("ラボS3アップロード完了: 成功=%d 失敗=%d", len(uploaded_urls), len(failed_files))
 
         else:
-            # ファイル加工（ZIP or 展開）
-            result, temp_dir = zip_handler_instance.process_files(files, has_folder)
-            log.info("process_files 完了: type=%s temp_dir=%s", type(result).__name__, temp_dir)
-
-            if isinstance(result, list):
-                # フォルダ構造のまま個別アップロード
-                folder_prefix = f"lab/{id_str}/" if is_lab_order else f"meziro/{id_str}/"
-                log.info("個別アップロード開始: prefix=%s, 件数=%d", folder_prefix, len(result))
-
-                for index, file_path in enumerate(result, start=1):
-                    original_filename = os.path.basename(file_path)
-                    safe_filename     = sanitize_filename(original_filename)
-                    s3_key            = f"{folder_prefix}{id_str}_{index:03d}_{safe_filename}"
-                    s3_key            = get_unique_filename(bucket_name, s3_key)
-
-                    file_size = 0
-                    try:
-                        file_size = os.path.getsize(file_path)
-                    except Exception:
-                        pass
-
-                    with open(file_path, 'rb') as f:
-                        s3.upload_fileobj(
-                            f, bucket_name, s3_key,
-                            ExtraArgs={'ContentType': 'application/octet-stream'}
-                        )
-
-                    download_url = url_for('main.meziro_download', key=s3_key, _external=True)
-                    uploaded_urls.append(download_url)
-                    numbered_ids.append(f"{id_str}_{index:03d}")
-
-                    log.info("S3アップロードOK: key=%s size=%d", s3_key, file_size)
+            numbered_filename = f"{id_str}_files.zip"
+            s3_key = f"lab/{numbered_filename}" if is_lab_order else f"meziro/{numbered_filename}"
+
+            # ZIP を作りながら S3 マルチパートへ直接流す（temp_zips を使わない）
+            zip_size = zip_handler_instance.process_files_to_s3(
+                files, s3, bucket_name, s3_key,
+                has_folder_structure=has_folder,
+                extra_entries={f"{id_str}_info.txt": _order_info_text(order, id_str, received_at_str)},
+            )
 
-            else:
-                # ZIP アップロード
-                zip_file_path = result
-                try:
-                    zip_size = os.path.getsize(zip_file_path)
-                except Exception:
-                    zip_size = -1
-                log.info("ZIPアップロード準備: path=%s size=%d", zip_file_path, zip_size)
-
-                # 受付内容のテキストを zip に同梱
-                form_data_text = (
-                    f"【受付番号】No.{id_str}\n"
-                    f"【受信日時】{received_at_str}\n\n"
-                    f"【事業者名】{business_name}\n"
-                    f"【送信者名】{user_name}\n"
-                    f"【メールアドレス】{user_email}\n"
-                    f"【カルテ番号】{chart_number}\n"
-                    f"【患者名】{patient_name}　{patient_name_kana}\n"
-                    f"【セット希望日時】{appointment_date} {appointment_hour}時\n"
-                    f"【製作物】{project_type}\n"
-                    f"【クラウン種別】{crown_type}\n"
-                    f"【対象部位】{', '.join(teeth)}\n"
-                    f"【シェード】{shade}\n"
-                    f"【メッセージ】\n{message.strip()}\n\n"
-                    "  渋谷歯科技工所\n"
-                    "  〒343-0845\n"
-                    "  埼玉県越谷市南越谷4-9-6 新越谷プラザビル203\n"
-                    "  TEL: 048-961-8151\n"
-                    "  email:shibuya8020@gmail.com"
-                )
+            download_url = url_for('main.meziro_download', key=s3_key, _external=True)
+            uploaded_urls.append(download_url)
+            numbered_ids.append(id_str)
+            log.info("ZIPのS3ストリーミングアップロードOK: key=%s size=%d", s3_key, zip_size)
 
-                with tempfile.NamedTemporaryFile(delete=False, mode='w', suffix='.txt', encoding='utf-8') as form_file:
-                    form_file.write(form_data_text)
-                    form_file_path = form_file.name
+        image_keys = _upload_order_images(images, id_str, bucket_name) if has_images else []
 
-                with zipfile.ZipFile(zip_file_path, 'a') as zipf:
-                    arcname = f"{id_str}_info.txt"
-                    zipf.write(form_file_path, arcname=arcname)
-                    log.info("ZIPへ info 追記: %s", arcname)
+        _finish_order(order, id_str, received_at_str, uploaded_urls, image_keys, is_lab_order, warning_message)
 
-                if os.path.exists(form_file_path):
-                    os.remove(form_file_path)
+    except Exception as e:
+        # ルート全体の最後の砦
+        log.error("アップロード処理中に未捕捉エラー: %s", e, exc_info=True)
 
-                numbered_filename = f"{id_str}_files.zip"
-                s3_key = f"lab/{numbered_filename}" if is_lab_order else f"meziro/{numbered_filename}"
-                s3_key = get_unique_filename(bucket_name, s3_key)
+    # レスポンス
+    if numbered_ids:
+        resp_message = f"アップロード完了受け付けました\n受付No.{id_str}"
+    else:
+        resp_message = "アップロード成功（ファイルはありません）"
+    if failed_files:
+        resp_message += f"\n※ {len(failed_files)} 件のファイルをアップロードできませんでした: " + ", ".join(failed_files)
+
+    log.info("=== /meziro_upload END No.%s files=%d failed=%d ===", id_str, len(uploaded_urls), len(failed_files))
+    return jsonify({'message': resp_message, 'files': uploaded_urls, 'failed': failed_files})
+
+
+# =========================================================
+# ブラウザ → S3 直接アップロード（大容量スキャン用）
+#   1) /meziro_upload/direct/init     : 受付番号を採番し、署名付きURLを発行
+#   2) ブラウザが S3 へ直接 PUT（大きいファイルはマルチパート）
+#   3) /meziro_upload/direct/finalize : マルチパートを complete し、指示書保存・メール送信（1回だけ）
+#   失敗・中断時は /meziro_upload/direct/abort でマルチパートを中止し、送信済みのファイルを消す
+# ワーカーはファイル本体を一切受け取らないので、処理時間がファイルサイズに依存しない。
+# 署名付きURLには申告されたサイズ（Content-Length）を含めるので、申告より大きいファイルは S3 が受け付けない。
+# init は送信元ごと・全体で1時間あたりの回数を制限する（utils/direct_upload_dynamo.py）。
+# ブラウザが abort を呼ばずに閉じた受付は、定期クリーンアップ（sweep_direct_uploads）で片付ける。
+# バケットには scripts/put_direct_upload_lifecycle.py で AbortIncompleteMultipartUpload も設定しておく。
+# =========================================================
+DIRECT_UPLOAD_PART_SIZE = 16 * 1024 * 1024   # これ以下は単発PUT、超えたらマルチパート
+DIRECT_UPLOAD_MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024
+DIRECT_UPLOAD_MAX_TOTAL_SIZE = 20 * 1024 * 1024 * 1024
+DIRECT_UPLOAD_MAX_FILES = 2000
+DIRECT_UPLOAD_INITS_PER_CLIENT = 20   # 送信元ごと・1時間あたり
+DIRECT_UPLOAD_INITS_TOTAL = 300       # 全体・1時間あたり
+DIRECT_UPLOAD_URL_EXPIRES = 6 * 60 * 60
+DIRECT_UPLOAD_TOKEN_MAX_AGE = 24 * 60 * 60
+
+# ZIP 生成などアップロード後の後処理用（I/O 待ち主体なのでスレッドで十分）
+_order_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="order-post")
+
+
+def _direct_upload_serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='meziro-direct-upload')
+
+
+@bp.route('/meziro_upload/direct/init', methods=['POST'])
+def meziro_upload_direct_init():
+    log = current_app.logger
+    payload = request.get_json(silent=True) or {}
+    file_specs = payload.get('files') or []
+
+    if not file_specs:
+        return jsonify({'error': 'ファイルが選択されていません'}), 400
+    if len(file_specs) > DIRECT_UPLOAD_MAX_FILES:
+        return jsonify({'error': f'ファイル数は {DIRECT_UPLOAD_MAX_FILES} 件までです'}), 400
+    total_size = 0
+    for spec in file_specs:
+        try:
+            size = int(spec.get('size') or 0)
+        except (TypeError, ValueError):
+            size = 0
+        if size <= 0 or size > DIRECT_UPLOAD_MAX_FILE_SIZE:
+            return jsonify({'error': f"ファイルサイズが不正です: {spec.get('name')}"}), 400
+        total_size += size
+    if total_size > DIRECT_UPLOAD_MAX_TOTAL_SIZE:
+        return jsonify({'error': f'1回の送信は合計 {DIRECT_UPLOAD_MAX_TOTAL_SIZE // 1024 ** 3}GB までです'}), 400
+
+    # 受付番号を使う前に回数を数える
+    client = request.access_route[0] if request.access_route else (request.remote_addr or 'unknown')
+    if not allow_direct_upload_init(client, DIRECT_UPLOAD_INITS_PER_CLIENT, DIRECT_UPLOAD_INITS_TOTAL):
+        log.warning("直接アップロードの回数制限: client=%s", client)
+        return jsonify({'error': '送信が集中しています。しばらくしてからもう一度お試しください。'}), 429
+
+    is_lab_order = _is_lab_user()
+    id_str, warning_message = _allocate_order_id(is_lab_order)
+    folder_prefix = f"lab/{id_str}/" if is_lab_order else f"meziro/{id_str}/"
+    log.info("直接アップロード開始: No.%s prefix=%s 件数=%d", id_str, folder_prefix, len(file_specs))
+
+    plans = []
+    token_files = []
+    for index, spec in enumerate(file_specs, start=1):
+        name = spec.get('name') or f'file_{index:05d}'
+        size = int(spec['size'])
+        s3_key = f"{folder_prefix}{id_str}_{index:03d}_{sanitize_filename(name)}"
+
+        if size <= DIRECT_UPLOAD_PART_SIZE:
+            url = direct_upload_s3.generate_presigned_url(
+                'put_object',
+                Params={'Bucket': BUCKET_NAME, 'Key': s3_key, 'ContentType': 'application/octet-stream',
+                        'ContentLength': size},
+                ExpiresIn=DIRECT_UPLOAD_URL_EXPIRES,
+            )
+            plans.append({'key': s3_key, 'mode': 'put', 'url': url})
+            token_files.append({'key': s3_key, 'name': name, 'path': spec.get('path') or name})
+            continue
 
-                with open(zip_file_path, 'rb') as f:
-                    s3.upload_fileobj(
-                        f, bucket_name, s3_key,
-                        ExtraArgs={'ContentType': 'application/zip'}
-                    )
+        upload_id = s3.create_multipart_upload(
+            Bucket=BUCKET_NAME, Key=s3_key, ContentType='application/octet-stream'
+        )['UploadId']
+        part_count = math.ceil(size / DIRECT_UPLOAD_PART_SIZE)
+        part_urls = [
+            direct_upload_s3.generate_presigned_url(
+                'upload_part',
+                Params={'Bucket': BUCKET_NAME, 'Key': s3_key, 'UploadId': upload_id, 'PartNumber': n,
+                        'ContentLength': min(DIRECT_UPLOAD_PART_SIZE, size - (n - 1) * DIRECT_UPLOAD_PART_SIZE)},
+                ExpiresIn=DIRECT_UPLOAD_URL_EXPIRES,
+            )
+            for n in range(1, part_count + 1)
+        ]
+        plans.append({
+            'key': s3_key,
+            'mode': 'multipart',
+            'part_size': DIRECT_UPLOAD_PART_SIZE,
+            'part_urls': part_urls,
+        })
+        token_files.append({
+            'key': s3_key, 'name': name, 'path': spec.get('path') or name,
+            'upload_id': upload_id, 'parts': part_count,
+        })
 
-                download_url = url_for('main.meziro_download', key=s3_key, _external=True)
-                uploaded_urls.append(download_url)
-                numbered_ids.append(id_str)
-                log.info("ZIPのS3アップロードOK: key=%s size=%d", s3_key, zip_size)
+    save_pending_upload(id_str, is_lab_order, token_files)
+    upload_token = _direct_upload_serializer().dumps({
+        'id': id_str,
+        'lab': is_lab_order,
+        'warning': warning_message,
+        'files': token_files,
+    })
+    return jsonify({'id': id_str, 'upload_token': upload_token, 'files': plans})
 
-        # 一時ZIPがあれば削除
-        if 'zip_file_path' in locals() and os.path.exists(zip_file_path):
-            try:
-                os.remove(zip_file_path)
-                log.info("一時ZIP削除: %s", zip_file_path)
-            except Exception as e:
-                log.warning("一時ZIP削除失敗: %s err=%s", zip_file_path, e)
-
-        # 画像ファイルの処理（リサイズ → S3保存）
-        image_keys = []
-        if has_images:
-            img_prefix = f"meziro/{id_str}/images/"
-            fmt_map = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.gif': 'GIF', '.webp': 'WEBP'}
-            ct_map  = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'GIF': 'image/gif', 'WEBP': 'image/webp'}
-            for idx, img_file in enumerate(images, start=1):
-                if not img_file or not img_file.filename:
-                    continue
-                try:
-                    raw = Image.open(io.BytesIO(img_file.read()))
-                    pil_img: Image.Image = ImageOps.exif_transpose(raw) or raw  # EXIF回転補正
-                    if pil_img.width > 2000:
-                        new_h = int(pil_img.height * 2000 / pil_img.width)
-                        pil_img = pil_img.resize((2000, new_h), Image.Resampling.LANCZOS)
-                    orig_name = sanitize_filename(img_file.filename)
-                    ext  = os.path.splitext(orig_name)[1].lower()
-                    fmt  = fmt_map.get(ext, 'JPEG')
-                    if fmt == 'JPEG' and pil_img.mode in ('RGBA', 'P', 'LA'):
-                        pil_img = pil_img.convert('RGB')
-                    buf = io.BytesIO()
-                    if fmt == 'JPEG':
-                        pil_img.save(buf, format='JPEG', quality=90)
-                    else:
-                        pil_img.save(buf, format=fmt)
-                    buf.seek(0)
-                    final_w = pil_img.width
-                    s3_img_key = get_unique_filename(bucket_name, f"{img_prefix}{idx:03d}_{orig_name}")
-                    s3.upload_fileobj(buf, bucket_name, s3_img_key,
-                                      ExtraArgs={'ContentType': ct_map.get(fmt, 'image/jpeg')})
-                    image_keys.append(s3_img_key)
-                    log.info("画像S3アップロードOK: key=%s w=%d", s3_img_key, final_w)
-                except Exception as img_err:
-                    log.error("画像処理エラー: filename=%s err=%s", img_file.filename, img_err, exc_info=True)
-
-        # メール本文
-        url_text = "\n".join(uploaded_urls)
-        full_message = f"""ユーザーから以下のメッセージが届きました：
 
-【受付番号】No.{id_str}
-【受信日時】{received_at_str}
-【事業者名】{business_name}
-【送信者名】{user_name}
-【メールアドレス】{user_email}
-【カルテ番号】{chart_number}
-【患者名】{patient_name}　{patient_name_kana}
-【セット希望日時】{appointment_date} {appointment_hour}時
-【製作物】{project_type}
-【クラウン種別】{crown_type}
-【対象部位】{", ".join(teeth)}
-【シェード】{shade}
-【メッセージ】
-{message}
+def _direct_order_exists(id_str, is_lab_order):
+    """直接アップロードの受付番号で指示書が保存済み（finalize 済み）か"""
+    table = current_app.config["LAB_PRESCRIPTIONS_TABLE" if is_lab_order else "PRESCRIPTIONS_TABLE"]
+    resp = table.get_item(Key={"prescription_id": id_str}, ProjectionExpression="prescription_id")
+    return "Item" in resp
 
-【アップロードされたファイルリンク】
-{url_text}
-"""
-        if warning_message:
-            full_message += f"\n\n⚠️ システム警告：{warning_message}\n"
-            log.warning("採番時警告: %s", warning_message)
 
-        if not is_lab_order:
-            # 管理者へ
-            try:
-                msg = Message(
-                    subject=f"【仕事が来たよ】No.{id_str}",
-                    recipients=[os.getenv("MAIL_NOTIFICATION_RECIPIENT")],
-                    reply_to="shibuya8020@gmail.com",
-                    body=full_message
-                )
-                mail.send(msg)
-                log.info("メール送信成功（管理者）")
-            except Exception as e:
-                log.error("メール送信失敗（管理者）: %s", e, exc_info=True)
+def _direct_upload_result(id_str, token_files):
+    return jsonify({
+        'message': f"アップロード完了受け付けました\n受付No.{id_str}",
+        'files': [url_for('main.meziro_download', key=f['key'], _external=True) for f in token_files],
+    })
 
-            # 送信者へ
-            try:
-                confirmation_msg = Message(
-                    subject=f"【受付完了】No.{id_str} 技工指示の受付を承りました",
-                    recipients=[user_email],
-                    reply_to="shibuya8020@gmail.com",
-                    body=f"""{user_name} 様
 
-この度は技工指示を送信いただき、誠にありがとうございます。
-以下の内容で受付を完了いたしました。
+def _complete_direct_multipart(file_info):
+    """ブラウザがアップロードしたパートを確認して complete する（同時に送られた finalize が complete 済みなら何もしない）"""
+    parts = []
+    kwargs = {'Bucket': BUCKET_NAME, 'Key': file_info['key'], 'UploadId': file_info['upload_id']}
+    while True:
+        try:
+            resp = s3.list_parts(**kwargs)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'NoSuchUpload' and _s3_object_exists(file_info['key']):
+                return
+            raise
+        parts.extend({'PartNumber': p['PartNumber'], 'ETag': p['ETag']} for p in resp.get('Parts', []))
+        if not resp.get('IsTruncated'):
+            break
+        kwargs['PartNumberMarker'] = resp['NextPartNumberMarker']
 
-【受付番号】No.{id_str}
-【受信日時】{received_at_str}
-【事業者名】{business_name}
-【送信者名】{user_name}
-【メールアドレス】{user_email}
-【カルテ番号】{chart_number}
-【患者名】{patient_name}　{patient_name_kana}
-【セット希望日時】{appointment_date} {appointment_hour}時
-【製作物】{project_type}
-【クラウン種別】{crown_type}
-【対象部位】{", ".join(teeth)}
-【シェード】{shade}
-【メッセージ】
-{message}
+    if len(parts) != file_info['parts']:
+        raise ValueError(f"パート数が一致しません: key={file_info['key']} {len(parts)}/{file_info['parts']}")
 
-ファイルを確認の上、内容に応じて対応させていただきます。
-万が一、内容に不備がある場合は別途ご連絡させていただきます。
+    s3.complete_multipart_upload(
+        Bucket=BUCKET_NAME, Key=file_info['key'], UploadId=file_info['upload_id'],
+        MultipartUpload={'Parts': parts},
+    )
 
---------------------------------
-渋谷歯科技工所
-〒343-0845 埼玉県越谷市南越谷4-9-6 新越谷プラザビル203
-TEL: 048-961-8151
-email: shibuya8020@gmail.com
-"""
-                )
-                mail.send(confirmation_msg)
-                log.info("送信者への確認メール送信成功")
-            except Exception as e:
-                log.error("送信者への確認メール送信失敗: %s", e, exc_info=True)
-        else:
-            log.info("ラボ注文のためメール通知スキップ: %s", id_str)
 
-        # 指示書をDynamoDBに保存
+def _s3_object_exists(key):
+    try:
+        s3.head_object(Bucket=BUCKET_NAME, Key=key)
+        return True
+    except ClientError:
+        return False
+
+
+def _build_order_zip_async(app, id_str, token_files, has_folder, info_text, is_lab_order):
+    """直接アップロード済みのファイルから ZIP を作り、指示書の s3_keys に追記する（バックグラウンド）"""
+    with app.app_context():
+        log = app.logger
+        zip_key = f"meziro/{id_str}_files.zip"
         try:
-            prescriptions_table = current_app.config["PRESCRIPTIONS_TABLE"]
+            sources = []
+            for f in token_files:
+                body = s3.get_object(Bucket=BUCKET_NAME, Key=f['key'])['Body']
+                sources.append(SimpleNamespace(filename=f['name'], stream=body, relativePath=f['path']))
+
+            zip_size = zip_handler_instance.process_files_to_s3(
+                sources, s3, BUCKET_NAME, zip_key,
+                has_folder_structure=has_folder,
+                extra_entries={f"{id_str}_info.txt": info_text},
+            )
+            log.info("直接アップロード後のZIP作成OK: key=%s size=%d", zip_key, zip_size)
 
-            # clinic_id・business_name を user_id（メール）から取得
-            clinic_id_for_prescription = None
-            if current_user.is_authenticated:
-                clinic_id_for_prescription = getattr(current_user, 'clinic_id', None)
-                if not business_name:
-                    business_name = getattr(current_user, 'sender_name', '') or ''
-            if not clinic_id_for_prescription or not business_name:
-                try:
-                    users_table = current_app.config["HOERO_USERS_TABLE"]
-                    u = users_table.get_item(Key={'user_id': user_email}).get('Item', {})
-                    if not clinic_id_for_prescription:
-                        clinic_id_for_prescription = u.get('clinic_id')
-                    if not business_name:
-                        business_name = u.get('sender_name', '')
-                except Exception:
-                    pass
-
-            prescription_item = {
-                "prescription_id": id_str,
-                "user_id":         user_email,
-                "user_phone":      user_phone,
-                "business_name":   business_name,
-                "user_name":       user_name,
-                "patient_name":    patient_name,
-                "patient_name_kana": patient_name_kana,
-                "chart_number":    chart_number,
-                "appointment_date": appointment_date,
-                "appointment_hour": str(appointment_hour),
-                "project_type":    project_type,
-                "quantity":        quantity,
-                **({"implant_holes": implant_holes} if implant_holes else {}),
-                **({"disc_thickness": disc_thickness} if disc_thickness else {}),
-                **({"block_material": block_material, "block_quantity": block_quantity} if block_material else {}),
-                **({"block_material_2": block_material_2, "block_quantity_2": block_quantity_2} if block_material_2 else {}),
-                "crown_type":      crown_type,
-                "teeth":           teeth,
-                "teeth_abutment":     teeth_abutment,
-                "teeth_missing":      teeth_missing,
-                "teeth_fabrication":  teeth_fabrication,
-                "shade":           shade,
-                "message":         message,
-                "s3_keys":         [k.split('/meziro/download/')[-1] if '/meziro/download/' in k else k for k in uploaded_urls],
-                "image_keys":      image_keys,
-                "status":          "受付中",
-                "created_at":      received_at_str,
-                "updated_at":      received_at_str,
-            }
-            if clinic_id_for_prescription:
-                prescription_item["clinic_id"] = clinic_id_for_prescription
-            if is_lab_order:
-                prescription_item["source"] = "lab"
-
-            save_table = (
-                current_app.config["LAB_PRESCRIPTIONS_TABLE"]
-                if is_lab_order
-                else current_app.config["PRESCRIPTIONS_TABLE"]
+            table = app.config["LAB_PRESCRIPTIONS_TABLE" if is_lab_order else "PRESCRIPTIONS_TABLE"]
+            table.update_item(
+                Key={"prescription_id": id_str},
+                UpdateExpression="SET s3_keys = list_append(if_not_exists(s3_keys, :empty), :k)",
+                ExpressionAttributeValues={":k": [zip_key], ":empty": []},
             )
-            save_table.put_item(Item=prescription_item)
-            log.info("指示書をDynamoDBに保存: prescription_id=%s", id_str)
         except Exception as e:
-            log.error("指示書のDynamoDB保存失敗: %s", e, exc_info=True)
+            log.error("直接アップロード後のZIP作成失敗: No.%s err=%s", id_str, e, exc_info=True)
+
+
+@bp.route('/meziro_upload/direct/finalize', methods=['POST'])
+def meziro_upload_direct_finalize():
+    log = current_app.logger
+
+    try:
+        token = _direct_upload_serializer().loads(
+            request.form.get('upload_token', ''), max_age=DIRECT_UPLOAD_TOKEN_MAX_AGE
+        )
+    except BadSignature:
+        return jsonify({'error': 'アップロード情報が無効です。もう一度お試しください。'}), 400
+
+    id_str = token['id']
+    is_lab_order = token['lab']
+    token_files = token['files']
+    log.info("=== /meziro_upload/direct/finalize START No.%s files=%d ===", id_str, len(token_files))
+
+    # 二重送信・ブラウザのリトライ: 受付済みなら同じ結果を返す（指示書・ZIP・メールは作り直さない）
+    if _direct_order_exists(id_str, is_lab_order):
+        log.info("直接アップロード No.%s は finalize 済み", id_str)
+        return _direct_upload_result(id_str, token_files)
 
+    received_at = datetime.now(pytz_timezone("Asia/Tokyo"))
+    received_at_str = received_at.strftime("%Y-%m-%d %H:%M:%S")
+
+    order = _read_order_form(request.form)
+    error = _validate_order(order)
+    if error:
+        return jsonify({'error': error}), 400
+
+    try:
+        for f in token_files:
+            if f.get('upload_id'):
+                _complete_direct_multipart(f)
+            elif not _s3_object_exists(f['key']):
+                raise ValueError(f"アップロードされていないファイルがあります: key={f['key']}")
     except Exception as e:
-        # ルート全体の最後の砦
-        log.error("アップロード処理中に未捕捉エラー: %s", e, exc_info=True)
+        log.error("マルチパート complete 失敗: No.%s err=%s", id_str, e, exc_info=True)
+        return jsonify({'error': 'ファイルのアップロードが完了していません。もう一度お試しください。'}), 400
 
-    # レスポンス
-    if numbered_ids:
-        resp_message = f"アップロード完了受け付けました\n受付No.{id_str}"
-    else:
-        resp_message = "アップロード成功（ファイルはありません）"
+    uploaded_urls = [url_for('main.meziro_download', key=f['key'], _external=True) for f in token_files]
+
+    images = request.files.getlist('images[]')
+    has_images = bool(images and images[0].filename != '')
+    image_keys = _upload_order_images(images, id_str, BUCKET_NAME) if has_images else []
+
+    # 指示書は受付番号がまだ無いときだけ保存する。同時に届いた finalize に先を越されたらそちらの結果を返す
+    if not _finish_order(order, id_str, received_at_str, uploaded_urls, image_keys, is_lab_order,
+                         token.get('warning'), claim=True):
+        return _direct_upload_result(id_str, token_files)
+    _clear_pending_upload(id_str)
+
+    # ZIP はレスポンスを待たせずに後で作る（ラボ注文は従来どおりZIPなし）
+    if not is_lab_order and request.form.get('make_zip', 'true').lower() == 'true':
+        has_folder = request.form.get('has_folder_structure', 'false').lower() == 'true'
+        _order_executor.submit(
+            _build_order_zip_async,
+            current_app._get_current_object(), id_str, token_files, has_folder,
+            _order_info_text(order, id_str, received_at_str), is_lab_order,
+        )
+
+    log.info("=== /meziro_upload/direct/finalize END No.%s ===", id_str)
+    return _direct_upload_result(id_str, token_files)
+
+
+@bp.route('/meziro_upload/direct/abort', methods=['POST'])
+def meziro_upload_direct_abort():
+    """
+    直接アップロードを中止する（アップロード失敗時・ページを離れたときにブラウザから呼ぶ）。
+    開始したマルチパートを abort し、送信済みのファイルを消す。finalize 済みの受付には何もしない。
+    """
+    log = current_app.logger
+    try:
+        token = _direct_upload_serializer().loads(
+            request.form.get('upload_token', ''), max_age=DIRECT_UPLOAD_TOKEN_MAX_AGE
+        )
+    except BadSignature:
+        return jsonify({'error': 'アップロード情報が無効です。'}), 400
 
-    log.info("=== /meziro_upload END No.%s files=%d ===", id_str, len(uploaded_urls))
-    return jsonify({'message': resp_message, 'files': uploaded_urls})
+    id_str = token['id']
+    if _direct_order_exists(id_str, token['lab']):
+        return jsonify({'aborted': False})
+
+    _abort_direct_files(id_str, token['files'])
+    _clear_pending_upload(id_str)
+    log.info("直接アップロードを中止: No.%s files=%d", id_str, len(token['files']))
+    return jsonify({'aborted': True})
+
+
+def _abort_direct_files(id_str, files):
+    """マルチパートを abort し、単発PUTで送信済みのファイルを消す"""
+    for f in files:
+        try:
+            if f.get('upload_id'):
+                s3.abort_multipart_upload(Bucket=BUCKET_NAME, Key=f['key'], UploadId=f['upload_id'])
+            else:
+                s3.delete_object(Bucket=BUCKET_NAME, Key=f['key'])
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'NoSuchUpload':
+                current_app.logger.warning("直接アップロードの中止に失敗: No.%s key=%s err=%s", id_str, f['key'], e)
+
+
+def _clear_pending_upload(id_str):
+    try:
+        clear_pending_upload(id_str)
+    except ClientError as e:
+        # 記録が残っても、定期クリーンアップが受付済みかを確かめてから消すだけなので害はない
+        current_app.logger.warning("直接アップロードの記録を消せません: No.%s err=%s", id_str, e)
+
+
+def sweep_direct_uploads():
+    """
+    init から DIRECT_UPLOAD_TOKEN_MAX_AGE を過ぎても finalize / abort されていない受付のファイルを片付ける
+    （定期クリーンアップから app context 内で呼ぶ）。受付済みの指示書があれば記録を消すだけ。
+    """
+    log = current_app.logger
+    swept = 0
+    for pending in stale_pending_uploads(DIRECT_UPLOAD_TOKEN_MAX_AGE):
+        id_str = pending['order_id']
+        if not _direct_order_exists(id_str, pending.get('lab', False)):
+            _abort_direct_files(id_str, pending.get('files') or [])
+            swept += 1
+            log.info("放置された直接アップロードを片付け: No.%s files=%d", id_str, len(pending.get('files') or []))
+        clear_pending_upload(id_str)
+    return swept
+
+
+def _flash_mail_import(name, found, imported, skipped, resync):
+    if found == 0 and resync:
+        flash(f"{name}: 遡り期間に対象のメールはありませんでした（Gmail接続を確認してください）")
+    elif found == 0:
+        flash(f"{name}: 新しいメールはありませんでした（Gmail接続または新着なし）")
+    else:
+        label = "遡って" if resync else ""
+        flash(f"{name}: {label}{found} 件取得、{imported} 件登録、{skipped} 件スキップしました")
 
 
 @bp.route('/admin/dscore/import', methods=['POST'])
@@ -1819,11 +2047,9 @@ def dscore_import():
     if not current_user.is_administrator:
         return "権限がありません", 403
     from utils.dscore_import import import_dscore_emails
-    found, imported, skipped = import_dscore_emails(current_app._get_current_object())
-    if found == 0:
-        flash("D-score: メールが見つかりませんでした（Gmail接続またはメールなし）")
-    else:
-        flash(f"D-score: {found} 件取得、{imported} 件登録、{skipped} 件スキップしました")
+    resync = request.form.get("resync") == "1"
+    found, imported, skipped = import_dscore_emails(current_app._get_current_object(), resync=resync)
+    _flash_mail_import("D-score", found, imported, skipped, resync)
     return redirect(url_for("main.prescription_list"))
 
 
@@ -1833,11 +2059,9 @@ def itero_import():
     if not current_user.is_administrator:
         return "権限がありません", 403
     from utils.itero_import import import_itero_emails
-    found, imported, skipped = import_itero_emails(current_app._get_current_object())
-    if found == 0:
-        flash("iTero: メールが見つかりませんでした（Gmail接続またはメールなし）")
-    else:
-        flash(f"iTero: {found} 件取得、{imported} 件登録、{skipped} 件スキップしました")
+    resync = request.form.get("resync") == "1"
+    found, imported, skipped = import_itero_emails(current_app._get_current_object(), resync=resync)
+    _flash_mail_import("iTero", found, imported, skipped, resync)
     return redirect(url_for("main.prescription_list"))
 
 
@@ -1847,11 +2071,9 @@ def shining3d_import():
     if not current_user.is_administrator:
         return "権限がありません", 403
     from utils.shining3d_import import import_shining3d_emails
-    found, imported, skipped = import_shining3d_emails(current_app._get_current_object())
-    if found == 0:
-        flash("Shining3D: メールが見つかりませんでした（Gmail接続またはメールなし）")
-    else:
-        flash(f"Shining3D: {found} 件取得、{imported} 件登録、{skipped} 件スキップしました")
+    resync = request.form.get("resync") == "1"
+    found, imported, skipped = import_shining3d_emails(current_app._get_current_object(), resync=resync)
+    _flash_mail_import("Shining3D", found, imported, skipped, resync)
     return redirect(url_for("main.prescription_list"))
 
 
@@ -1861,11 +2083,9 @@ def threedshape_import():
     if not current_user.is_administrator:
         return "権限がありません", 403
     from utils.threedshape_import import import_threedshape_emails
-    found, imported, skipped = import_threedshape_emails(current_app._get_current_object())
-    if found == 0:
-        flash("3ds: メールが見つかりませんでした（Gmail接続またはメールなし）")
-    else:
-        flash(f"3ds: {found} 件取得、{imported} 件登録、{skipped} 件スキップしました")
+    resync = request.form.get("resync") == "1"
+    found, imported, skipped = import_threedshape_emails(current_app._get_current_object(), resync=resync)
+    _flash_mail_import("3ds", found, imported, skipped, resync)
     redirect_to = request.form.get("redirect_to")
     if redirect_to:
         return redirect(redirect_to)
@@ -2217,25 +2437,6 @@ def info():
 import traceback  # ← 追加（ファイルの先頭でもOK）
 
 
-def get_unique_filename(bucket, key):
-    """
-    重複しないファイル名を生成する関数
-    """
-    base, ext = os.path.splitext(key)
-    counter = 1
-    new_key = key
-    
-    # 同じ名前のファイルが存在する場合は番号を付加
-    while True:
-        try:
-            s3.head_object(Bucket=bucket, Key=new_key)
-            new_key = f"{base}_{counter}{ext}"
-            counter += 1
-        except:
-            break
-    
-    return new_key
-
 @bp.route('/s3_browser')
 @bp.route('/s3_browser/<int:page>')
 def s3_browser(page=1):
@@ -2350,115 +2551,69 @@ def manual_cleanup():
     deleted_count = cleanup_temp_files(current_app.root_path)
     flash(f'{deleted_count} 件の一時ファイルをクリーンアップしました')
     return redirect(url_for('main.index'))  # 管理画面へリダイレクト
+
+
+@bp.route('/admin/cache_stats')
+@login_required
+def cache_stats():
+    """キャッシュのヒット/ミス数（このワーカープロセス分）"""
+    if not current_user.is_administrator:
+        abort(403)
+    return jsonify({
+        "pid": os.getpid(),
+        "user_profiles": user_cache_stats(),
+        "login_user_loader": auth_user_loader_stats(),
+    })
     
 def add_featured_image(upload_image):
     image_filename = upload_image.filename
     filepath = os.path.join(current_app.root_path, r'static/featured_image', image_filename)
     image_size = (1000, 1000)
-    image = Image.open(upload_image)
-    image.thumbnail(image_size)
+    image, _ = load_image(upload_image, max_size=image_size)
     image.save(filepath)
     return image_filename
 
 def add_featured_video(upload_video):
     """
-    動画をリサイズしてS3にアップロード
+    動画の変換ジョブを投入してジョブ ID を返す（変換・S3アップロードはバックグラウンドで行う）。
+    360p / 720p の MP4 とポスター画像を作り、完了するとジョブの video_url に 720p の URL が入る。
     """
-    input_path = None
-    output_path = None
-    
-    try:
-        # 一時ファイルとして保存
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_input:
-            upload_video.save(temp_input.name)
-            input_path = temp_input.name
-        
-        # 出力用の一時ファイル
-        output_path = tempfile.mktemp(suffix='.mp4')
-        
-        # imageio-ffmpegのバイナリパスを取得
-        ffmpeg_exe = ffmpeg.get_ffmpeg_exe()
-        
-        # ffmpegでリサイズ
-        ffmpeg_cmd = [
-            ffmpeg_exe,
-            '-i', input_path,
-            '-vf', 'scale=\'if(gt(iw,ih),800,-2)\':\'if(gt(iw,ih),-2,800)\'',
-            '-c:v', 'libx264',
-            '-crf', '23',
-            '-preset', 'medium',
-            '-c:a', 'aac',
-            '-b:a', '128k',
-            '-movflags', '+faststart',
-            '-y',
-            output_path
-        ]
-        
-        print(f"ffmpeg実行中...")
-        result = subprocess.run(
-            ffmpeg_cmd, 
-            capture_output=True, 
-            text=True,
-            check=True
-        )
-        print(f"ffmpegリサイズ完了")
-        
-        # S3にアップロード
-        s3 = boto3.client('s3')
-        timestamp = int(datetime.now().timestamp() * 1000)
-        original_filename = upload_video.filename
-        base_name = os.path.splitext(original_filename)[0]
-        video_filename = f"{timestamp}_{base_name}.mp4"
-        
-        bucket_name = 'shibuya8020'
-        s3_key = f'videos/{video_filename}'
-        
-        with open(output_path, 'rb') as f:
-            s3.upload_fileobj(
-                f,
-                bucket_name,
-                s3_key,
-                ExtraArgs={'ContentType': 'video/mp4'}
-            )
-        
-        video_url = f"https://{bucket_name}.s3.ap-northeast-1.amazonaws.com/{s3_key}"
-        
-        print(f"動画アップロード成功: {video_url}")
-        return video_url
-        
-    except subprocess.CalledProcessError as e:
-        print(f"ffmpegエラー: {e.stderr}")
-        raise Exception(f"動画のリサイズに失敗しました")
-    except Exception as e:
-        print(f"動画処理エラー: {e}")
-        raise e
-    finally:
-        if input_path and os.path.exists(input_path):
-            try:
-                os.unlink(input_path)
-            except:
-                pass
-        if output_path and os.path.exists(output_path):
-            try:
-                os.unlink(output_path)
-            except:
-                pass
+    user_id = current_user.email if current_user.is_authenticated else None
+    return submit_video_transcode(upload_video, user_id=user_id)
 
-def resize_video_with_ffmpeg(input_path, output_path, max_size=800):
-    """
-    ffmpegで動画をリサイズ
-    """
-    cmd = [
-        'ffmpeg',
-        '-i', input_path,
-        '-vf', f'scale=\'min({max_size},iw)\':\'min({max_size},ih)\':force_original_aspect_ratio=decrease',
-        '-c:v', 'libx264',
-        '-crf', '23',
-        '-c:a', 'aac',
-        '-b:a', '128k',
-        output_path
-    ]
-    subprocess.run(cmd, check=True)
+
+@bp.route('/featured_video/upload', methods=['POST'])
+@login_required
+def featured_video_upload():
+    """動画をアップロードして変換ジョブ ID をすぐに返す（進捗は featured_video_job で確認する）"""
+    upload_video = request.files.get('video')
+    if not upload_video or not upload_video.filename:
+        return jsonify({"error": "動画ファイルが選択されていません"}), 400
+    job_id = add_featured_video(upload_video)
+    return jsonify({
+        "job_id": job_id,
+        "status": VIDEO_STATUS_QUEUED,
+        "status_url": url_for('main.featured_video_job', job_id=job_id),
+    }), 202
+
+
+@bp.route('/featured_video/jobs/<job_id>')
+@login_required
+def featured_video_job(job_id):
+    """動画変換ジョブの状態・進捗と、完了していれば各解像度とポスター画像の URL"""
+    job = get_video_job(job_id)
+    if not job:
+        abort(404)
+    renditions = job.get("renditions") or {}
+    return jsonify({
+        "job_id": job_id,
+        "status": job.get("status"),
+        "progress": int(job.get("progress") or 0),
+        "error": job.get("error") if job.get("status") == VIDEO_STATUS_FAILED else None,
+        "video_url": job.get("video_url"),
+        "renditions": {name: video_url_for(key) for name, key in renditions.items()},
+        "poster_url": video_url_for(job["poster"]) if job.get("poster") else None,
+    })
 
 @bp.route("/admin/ai_collect_dental", methods=["POST"])
 def ai_collect_dental():
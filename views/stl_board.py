@@ -1,20 +1,16 @@
 import os
 import datetime
-import tempfile
-from flask import Blueprint, render_template, flash, redirect, url_for, request, send_from_directory, current_app, abort
+from flask import Blueprint, render_template, flash, redirect, url_for, request, send_from_directory, current_app, abort, jsonify
 from flask_login import current_user, login_required
 from werkzeug.utils import secure_filename
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
-from wtforms import StringField, TextAreaField, SubmitField
+from wtforms import StringField, TextAreaField, SubmitField, SelectField
 from wtforms.validators import DataRequired, Length
-import trimesh
-from trimesh.visual.material import PBRMaterial
 from dotenv import load_dotenv
 import boto3
 from types import SimpleNamespace
 import re
-from PIL import Image, ImageOps
 import io
 
 from utils.stl_dynamo import (
@@ -25,16 +21,25 @@ from utils.stl_dynamo import (
     paginate_stl_posts,
     create_stl_comment,
     get_comments_by_post,
-    get_all_comments,
     delete_comments_by_post,
     create_stl_like,
     get_like_by_post_and_user,
     delete_stl_like,
     get_likes_by_post,
-    get_all_likes,
+    load_comments_and_likes,
     delete_likes_by_post,
     update_stl_post,
+    start_stl_mesh_job,
+    stl_lod_keys,
+    release_post_glb_keys,
+    fail_stl_mesh_job,
+    STL_STATUS_PROCESSING,
+    STL_STATUS_READY,
 )
+from utils.stl_jobs import new_stl_job_id, submit_stl_conversion
+from utils.image_ingest import load_image
+from utils.stl_mesh import DEFAULT_GLB_MODE, GLB_MODE_QUANTIZED, GLB_MODE_QUANTIZED_FLAT, GLB_MODE_STANDARD
+from utils.user_cache import get_user_profile, prefetch_user_profiles
 
 load_dotenv()
 
@@ -63,15 +68,8 @@ def upload_resized_image_to_s3(file_storage, *, max_width=1000, quality=85, pref
     if ext not in [".jpg", ".jpeg", ".png", ".webp"]:
         raise ValueError("画像は jpg/jpeg/png/webp のみアップロードできます")
 
-    # Pillowで読み込み（EXIF回転も補正）
-    img = Image.open(file_storage.stream)
-    img = ImageOps.exif_transpose(img)
-
-    # リサイズ（横幅だけ基準、縦横比維持）
-    w, h = img.size
-    if w > max_width:
-        new_h = int(h * (max_width / float(w)))
-        img = img.resize((max_width, new_h), Image.LANCZOS)
+    # 読み込み（JPEGは縮小デコード、EXIF回転も補正）→ 横幅だけ基準で縮小、縦横比維持
+    img, _ = load_image(file_storage, max_width=max_width)
 
     # 透過PNG→JPEGの事故防止（PNG/WebPの透過は保持、JPEGはRGB化）
     out = io.BytesIO()
@@ -118,6 +116,11 @@ class STLPostForm(FlaskForm):
         FileAllowed(['jpg', 'jpeg', 'png', 'webp'], '画像ファイルのみ許可されています')
     ])
     youtube_url = StringField('YouTube URL', render_kw={'placeholder': 'https://www.youtube.com/watch?v=...'})
+    glb_mode = SelectField('3Dモデルの形式', choices=[
+        (GLB_MODE_QUANTIZED, '軽量（推奨）'),
+        (GLB_MODE_QUANTIZED_FLAT, '最軽量（法線なし・面が角ばって見えます）'),
+        (GLB_MODE_STANDARD, '標準（圧縮なし）'),
+    ], default=DEFAULT_GLB_MODE)
     submit = SubmitField('更新する')
 
 
@@ -147,73 +150,30 @@ def to_youtube_embed(url: str) -> str:
     return ""
 
 
-def reduce_stl_size(input_file_path, output_file_path, target_faces=70000):
-    """Trimeshを使った軽量化"""
-        
-    mesh = trimesh.load_mesh(input_file_path)
-    current_faces = len(mesh.faces)
-    
-    if current_faces > target_faces:
-        print(f"[軽量化開始] 入力三角形面数: {current_faces} → 目標: {target_faces}")
-        
-        # Trimeshの簡略化機能を使用
-        ratio = target_faces / current_faces
-        mesh = mesh.simplify_quadric_decimation(target_faces)
-        
-        new_faces = len(mesh.faces)
-        print(f"[軽量化完了] 変換後の三角形面数: {new_faces}")
-    else:
-        print(f"[軽量化不要] 三角形面数: {current_faces} ({target_faces} 以下)")
-    
-    mesh.export(output_file_path)
-    
-    return {
-        'original_faces': current_faces,
-        'new_faces': len(mesh.faces)
-    }
-
-
-def convert_stl_to_gltf(input_stl_path, output_gltf_path):
-    try:
-        loaded = trimesh.load(input_stl_path, force='mesh')
-        if isinstance(loaded, trimesh.Scene):
-            geoms = [g for g in loaded.geometry.values() if isinstance(g, trimesh.Trimesh)]
-            if not geoms:
-                raise ValueError("Scene内にTrimeshジオメトリがありません")
-            mesh = trimesh.util.concatenate(geoms)
-        else:
-            mesh = loaded
-
-        if not isinstance(mesh, trimesh.Trimesh) or mesh.faces is None or len(mesh.faces) == 0:
-            raise ValueError("faces を持たないメッシュのため material を設定できません")
-
-        # ★ここが光沢調整（PBR）
-        mat = PBRMaterial(
-            baseColorFactor=[50/255, 50/255, 50/255, 1.0],  # グレー（0〜1）
-            metallicFactor=0.0,    # 金属っぽさ（0=非金属）
-            roughnessFactor=0.25   # ★ツヤ：低いほどテカる（0.05〜0.3がツヤ強め）
-        )
+def _stl_lod_urls(item):
+    """LOD ごとの GLB の URL（thumb / preview / full）。ビューアーは小さい方から読み込む"""
+    return SimpleNamespace(**{
+        level: (f"https://{BUCKET_NAME}.s3.amazonaws.com/{key}" if key else None)
+        for level, key in stl_lod_keys(item).items()
+    })
 
-        # face_colors を使わず material で色+光沢を指定        
-        mesh.visual.material = mat
 
-        scene = trimesh.Scene(mesh)
-        glb_data = scene.export(file_type='glb')
+def _stl_thumbnail_url(item):
+    """一覧表示用のサムネイル画像の URL（サムネイル導入前の投稿は None → ビューアーで表示）"""
+    key = item.get("stl_thumbnail")
+    return f"https://{BUCKET_NAME}.s3.amazonaws.com/{key}" if key else None
 
-        with open(output_gltf_path, 'wb') as f:
-            f.write(glb_data)
-        return True
 
-    except Exception as e:
-        print(f"変換エラー: {e} ({type(e).__name__})")
-        return False
+def _stl_status(item):
+    """STL変換の状態（古い投稿は stl_status を持たないので、GLBがあれば ready 扱い）"""
+    return item.get("stl_status") or (STL_STATUS_READY if item.get("stl_file_path") else "")
 
 
 @bp.route('/', methods=['GET', 'POST'])
 def index():
     form = STLPostForm()
     selected_post_id = request.args.get('post_id')
-    page = request.args.get('page', 1, type=int)
+    tok = request.args.get('tok')
 
     if form.validate_on_submit():
         if not current_user.is_authenticated:
@@ -225,60 +185,18 @@ def index():
         # =========================================
         stl_file = form.stl_file.data
         glb_filename = None
-        glb_file_path = None
 
         if stl_file and stl_file.filename != '':
-            if stl_file.filename.lower().endswith('.stl'):
-                original_filename = secure_filename(stl_file.filename)
-                timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-                base_filename = f"{timestamp}_{os.path.splitext(original_filename)[0]}"
-                glb_s3_key = f"STL-board/{base_filename}.glb"
-
-                try:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".stl") as temp:
-                        stl_file.save(temp.name)
-                        temp_path = temp.name
-
-                    file_size_mb = os.path.getsize(temp_path) / (1024 * 1024)
-                    if file_size_mb > 5.0:
-                        reduced_temp_path = temp_path.replace(".stl", "_reduced.stl")
-                        reduce_stl_size(temp_path, reduced_temp_path)
-                        upload_stl_path = reduced_temp_path
-                        flash('ファイルが大きいため自動的に軽量化しました（元5MB以下）', 'warning')
-                    else:
-                        upload_stl_path = temp_path
-
-                    glb_temp_path = upload_stl_path.replace(".stl", ".glb")
-                    if not convert_stl_to_gltf(upload_stl_path, glb_temp_path):
-                        flash('glTF変換に失敗しました', 'danger')
-                        return redirect(url_for('stl_board.index'))
-
-                    with open(glb_temp_path, "rb") as glb_data:
-                        s3.upload_fileobj(
-                            glb_data,
-                            BUCKET_NAME,
-                            glb_s3_key,
-                            ExtraArgs={'ContentType': 'model/gltf-binary'}
-                        )
-
-                    # 後片付け
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
-                    if upload_stl_path != temp_path and os.path.exists(upload_stl_path):
-                        os.remove(upload_stl_path)
-                    if os.path.exists(glb_temp_path):
-                        os.remove(glb_temp_path)
-
-                    glb_filename = f"{base_filename}.glb"
-                    glb_file_path = glb_s3_key
-
-                except Exception as e:
-                    flash(f"S3アップロード中にエラーが発生しました: {str(e)}", 'danger')
-                    return redirect(url_for('stl_board.index'))
-            else:
+            if not stl_file.filename.lower().endswith('.stl'):
                 flash('STLファイルのみアップロードできます', 'danger')
                 return redirect(url_for('stl_board.index'))
 
+            # 変換は投稿作成後にジョブキューで行う（S3 のキーは STL の内容ハッシュで決まる）
+            original_filename = secure_filename(stl_file.filename)
+            timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+            base_filename = f"{timestamp}_{os.path.splitext(original_filename)[0]}"
+            glb_filename = f"{base_filename}.glb"
+
         # =========================================
         # 2) 画像ファイルの処理（横幅1000pxに縮小してS3へ）
         # =========================================
@@ -305,48 +223,54 @@ def index():
         # =========================================
         # 4) 投稿を作成
         # =========================================
+        job_id = new_stl_job_id() if glb_filename else None
         post_id = create_stl_post(
             title=form.title.data,
             content=form.content.data,
             user_id=current_user.email,
-            stl_filename=glb_filename,
-            stl_file_path=glb_file_path,
             youtube_url=youtube_url,
             youtube_id=youtube_id,
             youtube_embed_url=youtube_embed_url,
             image_file_path=image_file_path,  # ★追加
+            stl_status=STL_STATUS_PROCESSING if job_id else None,
+            stl_job_id=job_id,
         )
-        flash('投稿が作成されました', 'success')
+
+        # =========================================
+        # 5) STL → GLB 変換をジョブキューへ（完了するとワーカーが投稿を更新）
+        # =========================================
+        if job_id:
+            try:
+                submit_stl_conversion(post_id, job_id, stl_file, glb_filename,
+                                      glb_mode=form.glb_mode.data)
+                flash('投稿が作成されました。3Dモデルは変換が終わり次第表示されます', 'success')
+            except Exception as e:
+                current_app.logger.error("STL変換ジョブの投入に失敗: post_id=%s err=%s", post_id, e, exc_info=True)
+                fail_stl_mesh_job(post_id, job_id, e)
+                flash(f"STLファイルの変換を開始できませんでした: {str(e)}", 'danger')
+        else:
+            flash('投稿が作成されました', 'success')
         return redirect(url_for('stl_board.index'))
 
     # ==========================================================
     # 以下：表示処理（GET）
     # ==========================================================
 
-    # ユーザーテーブル
-    users_table = current_app.config.get("HOERO_USERS_TABLE")
-
-    # 共通ヘルパー関数
+    # 共通ヘルパー関数（著者はページ単位で prefetch 済みのキャッシュから引く）
     def resolve_author(user_id: str):
         user_id = str(user_id or "")
-        author = SimpleNamespace(
+        profile = get_user_profile(user_id)
+        if profile:
+            return SimpleNamespace(
+                id=user_id,
+                display_name=profile.get("display_name") or "Unknown User",
+                email=profile.get("email", "")
+            )
+        return SimpleNamespace(
             id=user_id,
             display_name="Unknown User",
             email=user_id if "@" in user_id else ""
         )
-        if users_table and user_id:
-            try:
-                user_response = users_table.get_item(Key={"user_id": user_id})
-                user_data = user_response.get("Item", {})
-                if user_data:
-                    author = SimpleNamespace(
-                        id=user_id,
-                        display_name=user_data.get("display_name", "Unknown User"),
-                        email=user_data.get("email", "")
-                    )
-            except Exception as e:
-                print(f"ユーザー情報取得エラー (user_id: {user_id}): {e}")
-        return author
 
     def to_datetime(dt_value):
         """DynamoDBの文字列/Noneなどを datetime に寄せる"""
@@ -360,28 +284,37 @@ def index():
         except Exception:
             return datetime.datetime.utcnow()
 
-    # コメント・いいねを全件取得
-    all_comments = get_all_comments()
-    all_likes = get_all_likes()
+    # 投稿を取得
+    posts_data = paginate_stl_posts(tok=tok, per_page=5)
 
-    # コメントをテンプレ互換に整形
-    all_comments_obj = []
-    for c in (all_comments or []):
-        c_dict = dict(c)
-        raw_user_id = c_dict.pop("user_id", "")
-        raw_created_at = c_dict.pop("created_at", None)
-        c_user_id = str(raw_user_id or "")
-
-        comment_obj = SimpleNamespace(
-            **c_dict,
-            user_id=c_user_id,
-            author=resolve_author(c_user_id),
-            created_at=to_datetime(raw_created_at)
-        )
-        all_comments_obj.append(comment_obj)
+    # 表示する投稿（＋選択中の投稿）ぶんだけコメント・いいねを取得
+    page_post_ids = [it.get("post_id") for it in posts_data["items"]]
+    if selected_post_id:
+        page_post_ids.append(selected_post_id)
+    comments_by_post, likes_by_post = load_comments_and_likes(page_post_ids)
 
-    # 投稿を取得
-    posts_data = paginate_stl_posts(page=page, per_page=5)
+    # 投稿者・コメント投稿者を BatchGetItem 1回でまとめて解決
+    author_ids = [it.get("user_id") for it in posts_data["items"]]
+    author_ids += [c.get("user_id") for items in comments_by_post.values() for c in items]
+    prefetch_user_profiles(author_ids)
+
+    # コメントをテンプレ互換に整形
+    comments_obj_by_post = {}
+    for pid, post_comments in comments_by_post.items():
+        objs = []
+        for c in post_comments:
+            c_dict = dict(c)
+            raw_user_id = c_dict.pop("user_id", "")
+            raw_created_at = c_dict.pop("created_at", None)
+            c_user_id = str(raw_user_id or "")
+
+            objs.append(SimpleNamespace(
+                **c_dict,
+                user_id=c_user_id,
+                author=resolve_author(c_user_id),
+                created_at=to_datetime(raw_created_at)
+            ))
+        comments_obj_by_post[pid] = objs
 
     posts_items = []
     for it in posts_data["items"]:
@@ -399,17 +332,17 @@ def index():
         image_path = it.get("image_file_path", "") or ""
         image_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{image_path}" if image_path else None
 
-        post_comments = [c for c in all_comments_obj if getattr(c, "post_id", None) == post_id]
-        post_likes = [l for l in all_likes if l.get("post_id") == post_id]
+        post_comments = comments_obj_by_post.get(str(post_id), [])
+        post_likes = likes_by_post.get(str(post_id), [])
 
         likes_wrapper = type('LikesWrapper', (), {
-            'count': lambda self: len(post_likes),
-            'all': lambda self: post_likes
+            'count': lambda self, _likes=post_likes: len(_likes),
+            'all': lambda self, _likes=post_likes: _likes
         })()
 
         comments_wrapper = type('CommentsWrapper', (), {
-            'count': lambda self: len(post_comments),
-            'all': lambda self: post_comments
+            'count': lambda self, _comments=post_comments: len(_comments),
+            'all': lambda self, _comments=post_comments: _comments
         })()
 
         post_obj = SimpleNamespace(
@@ -419,6 +352,9 @@ def index():
             user_id=user_id,
             stl_filename=it.get("stl_filename", ""),
             stl_file_path=it.get("stl_file_path", ""),
+            stl_status=_stl_status(it),
+            stl_lod=_stl_lod_urls(it),
+            stl_thumbnail_url=_stl_thumbnail_url(it),
             image_file_path=image_path,     # ★追加（必要なら）
             image_url=image_url,            # ★追加（テンプレ表示用）
             created_at=created_at,
@@ -434,12 +370,10 @@ def index():
 
     posts = SimpleNamespace(
         items=posts_items,
-        page=posts_data["page"],
-        pages=posts_data["pages"],
         has_prev=posts_data["has_prev"],
         has_next=posts_data["has_next"],
-        prev_num=posts_data["prev_num"],
-        next_num=posts_data["next_num"],
+        prev_tok=posts_data["prev_tok"],
+        next_tok=posts_data["next_tok"],
     )
 
     # selected_post
@@ -459,17 +393,17 @@ def index():
             image_path = post_item.get("image_file_path", "") or ""
             image_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{image_path}" if image_path else None
 
-            post_comments = [c for c in all_comments_obj if getattr(c, "post_id", None) == selected_post_id]
-            post_likes = [l for l in all_likes if l.get("post_id") == selected_post_id]
+            post_comments = comments_obj_by_post.get(str(selected_post_id), [])
+            post_likes = likes_by_post.get(str(selected_post_id), [])
 
             likes_wrapper = type('LikesWrapper', (), {
-                'count': lambda self: len(post_likes),
-                'all': lambda self: post_likes
+                'count': lambda self, _likes=post_likes: len(_likes),
+                'all': lambda self, _likes=post_likes: _likes
             })()
 
             comments_wrapper = type('CommentsWrapper', (), {
-                'count': lambda self: len(post_comments),
-                'all': lambda self: post_comments
+                'count': lambda self, _comments=post_comments: len(_comments),
+                'all': lambda self, _comments=post_comments: _comments
             })()
 
             selected_post = SimpleNamespace(
@@ -478,6 +412,8 @@ def index():
                 content=post_item.get("content", ""),
                 user_id=user_id,
                 stl_file_path=post_item.get("stl_file_path", ""),
+                stl_status=_stl_status(post_item),
+                stl_lod=_stl_lod_urls(post_item),
                 image_file_path=image_path,   # ★追加
                 image_url=image_url,          # ★追加
                 created_at=created_at,
@@ -490,8 +426,8 @@ def index():
                 s3_presigned_url=f"https://{BUCKET_NAME}.s3.amazonaws.com/{post_item.get('stl_file_path', '')}" if post_item.get("stl_file_path") else None
             )
 
-    comments = all_comments_obj
-    likes = all_likes
+    comments = [c for objs in comments_obj_by_post.values() for c in objs]
+    likes = [l for items in likes_by_post.values() for l in items]
 
     return render_template(
         'pages/stl_board.html',
@@ -553,9 +489,9 @@ def delete_post(post_id):
     if str(current_user.id) != str(post.get("user_id", "")) and not current_user.administrator: abort(403)
 
     try:
-        # S3から削除
-        if post.get("stl_file_path"):
-            s3.delete_object(Bucket=BUCKET_NAME, Key=post["stl_file_path"])
+        # S3から削除（LOD の GLB も含む。同じSTLの他の投稿が使っているGLBは残す）
+        for glb_key in release_post_glb_keys(post):
+            s3.delete_object(Bucket=BUCKET_NAME, Key=glb_key)
 
         # 関連するコメントといいねも削除
         delete_comments_by_post(post_id)
@@ -588,18 +524,9 @@ def view_post(post_id):
     youtube_embed_url = post_item.get("youtube_embed_url", "") or to_youtube_embed(youtube_url)
 
     # ユーザー情報を取得
-    users_table = current_app.config.get("HOERO_USERS_TABLE")
     user_id = str(post_item.get("user_id", ""))
-    author_name = "Unknown User"
-    
-    if users_table and user_id:
-        try:
-            user_response = users_table.get_item(Key={"user_id": user_id})
-            user_data = user_response.get("Item", {})
-            if user_data:
-                author_name = user_data.get("display_name", "Unknown User")
-        except Exception as e:
-            print(f"ユーザー情報取得エラー: {e}")
+    profile = get_user_profile(user_id)
+    author_name = (profile or {}).get("display_name") or "Unknown User"
 
     # 作成日時を datetime に変換
     created_at = post_item.get("created_at", "")
@@ -619,6 +546,8 @@ def view_post(post_id):
         author_name=author_name,
         created_at=created_at_dt,
         stl_file_path=post_item.get("stl_file_path", ""),
+        stl_status=_stl_status(post_item),
+        stl_lod=_stl_lod_urls(post_item),
         youtube_url=youtube_url,
         youtube_id=youtube_id,
         youtube_embed_url=youtube_embed_url,
@@ -693,6 +622,22 @@ def view_post(post_id):
                          recent_posts=recent_posts)
 
 
+@bp.route('/post/<post_id>/stl_status')
+def stl_status(post_id):
+    """STL変換ジョブの状態（変換中の投稿をポーリングして、完了したら再読み込みする）"""
+    post_item = get_stl_post_by_id(post_id)
+    if not post_item:
+        abort(404)
+    status = _stl_status(post_item)
+    glb_path = post_item.get("stl_file_path") if status == STL_STATUS_READY else None
+    return jsonify({
+        "post_id": post_id,
+        "status": status,
+        "error": post_item.get("stl_error") if status == "failed" else None,
+        "glb_url": f"https://{BUCKET_NAME}.s3.amazonaws.com/{glb_path}" if glb_path else None,
+    })
+
+
 @bp.route('/edit/<post_id>', methods=['GET', 'POST'])
 @login_required
 def edit_post(post_id):
@@ -711,62 +656,18 @@ def edit_post(post_id):
             # STL更新（必要なら）
             # ----------------------------
             stl_file = form.stl_file.data
-            glb_filename = post_item.get("stl_filename")
-            glb_file_path = post_item.get("stl_file_path")
+            new_glb_filename = None
 
             if stl_file and stl_file.filename:
                 if not stl_file.filename.lower().endswith(".stl"):
                     flash("STLファイルのみアップロードできます", "danger")
                     return redirect(url_for("stl_board.edit_post", post_id=post_id))
 
-                # 古いGLBを削除
-                if post_item.get("stl_file_path"):
-                    try:
-                        s3.delete_object(Bucket=BUCKET_NAME, Key=post_item["stl_file_path"])
-                    except Exception as e:
-                        print(f"古いファイル削除エラー: {e}")
-
+                # 変換はジョブキューで行い、古いGLBは新しいGLBができてからワーカーが削除する
                 original_filename = secure_filename(stl_file.filename)
                 timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
                 base_filename = f"{timestamp}_{os.path.splitext(original_filename)[0]}"
-                glb_s3_key = f"STL-board/{base_filename}.glb"
-
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".stl") as temp:
-                    stl_file.save(temp.name)
-                    temp_path = temp.name
-
-                file_size_mb = os.path.getsize(temp_path) / (1024 * 1024)
-                if file_size_mb > 5.0:
-                    reduced_temp_path = temp_path.replace(".stl", "_reduced.stl")
-                    reduce_stl_size(temp_path, reduced_temp_path)
-                    upload_stl_path = reduced_temp_path
-                    flash("ファイルが大きいため自動的に軽量化しました", "warning")
-                else:
-                    upload_stl_path = temp_path
-
-                glb_temp_path = upload_stl_path.replace(".stl", ".glb")
-                if not convert_stl_to_gltf(upload_stl_path, glb_temp_path):
-                    flash("glTF変換に失敗しました", "danger")
-                    return redirect(url_for("stl_board.edit_post", post_id=post_id))
-
-                with open(glb_temp_path, "rb") as glb_data:
-                    s3.upload_fileobj(
-                        glb_data, BUCKET_NAME, glb_s3_key,
-                        ExtraArgs={"ContentType": "model/gltf-binary"}
-                    )
-
-                # 一時ファイル掃除
-                try:
-                    os.remove(temp_path)
-                except:
-                    pass
-                if upload_stl_path != temp_path and os.path.exists(upload_stl_path):
-                    os.remove(upload_stl_path)
-                if os.path.exists(glb_temp_path):
-                    os.remove(glb_temp_path)
-
-                glb_filename = f"{base_filename}.glb"
-                glb_file_path = glb_s3_key
+                new_glb_filename = f"{base_filename}.glb"
 
             # ----------------------------
             # 画像更新（必要なら：横幅1000pxに縮小してS3へ）
@@ -795,19 +696,28 @@ def edit_post(post_id):
             # ----------------------------
             # DB更新
             # ----------------------------
+            # STLのパスはここでは書かない（変換完了時にワーカーが書き込む）
             update_stl_post(
                 post_id=post_id,
                 title=form.title.data,
                 content=form.content.data,
-                stl_filename=glb_filename,
-                stl_file_path=glb_file_path,
                 youtube_url=youtube_url,
                 youtube_id=youtube_id,
                 youtube_embed_url=youtube_embed_url,
                 image_file_path=image_file_path,
             )
 
-            flash("投稿を更新しました", "success")
+            if new_glb_filename:
+                job_id = new_stl_job_id()
+                start_stl_mesh_job(post_id, job_id)
+                submit_stl_conversion(
+                    post_id, job_id, stl_file, new_glb_filename,
+                    old_item=post_item,
+                    glb_mode=form.glb_mode.data,
+                )
+                flash("投稿を更新しました。新しい3Dモデルは変換が終わり次第表示されます", "success")
+            else:
+                flash("投稿を更新しました", "success")
             return redirect(url_for("stl_board.view_post", post_id=post_id))
 
         except Exception as e:
@@ -838,6 +748,10 @@ def edit_post(post_id):
 
         # STL
         stl_file_path=post_item.get("stl_file_path", ""),
+        stl_status=_stl_status(post_item),
+        stl_lod=_stl_lod_urls(post_item),
+        stl_glb_mode=post_item.get("stl_glb_mode", ""),
+        stl_lod_stats=post_item.get("stl_lod_stats") or {},
         s3_presigned_url=f"https://{BUCKET_NAME}.s3.amazonaws.com/{post_item.get('stl_file_path', '')}"
             if post_item.get("stl_file_path") else None,
 
@@ -11,7 +11,7 @@ from flask import Blueprint
 from extensions import db
 
 from types import SimpleNamespace
-from models.common import AuthUser
+from models.common import AuthUser, invalidate_user_cache
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timezone
 
@@ -144,6 +144,7 @@ def preregister():
             "updated_at":    now,
         }
         users_table.put_item(Item=item)
+        invalidate_user_cache(email)
 
         # 管理者への通知メール
         try:
@@ -233,6 +234,7 @@ def register():
         }
 
         table.put_item(Item=item)
+        invalidate_user_cache(item["user_id"])
 
         flash('ユーザー登録が完了しました。ログインしてください。', 'success')
         return redirect(url_for('users.login'))
@@ -289,6 +291,7 @@ def account_me():
 
         # DynamoDB に保存
         users_table.put_item(Item=item)
+        invalidate_user_cache(email)
 
         flash("ユーザーアカウントが更新されました")
         return redirect(url_for("users.account_me"))
@@ -350,6 +353,7 @@ def dentist_add():
         dentists.append(name)
         item["dentists"] = dentists
         users_table.put_item(Item=item)
+        invalidate_user_cache(target_user_id)
         flash(f"「{name}」を追加しました。")
     else:
         flash(f"「{name}」はすでに登録されています。")
@@ -383,6 +387,7 @@ def dentist_remove():
         dentists.remove(name)
         item["dentists"] = dentists
         users_table.put_item(Item=item)
+        invalidate_user_cache(target_user_id)
         flash(f"「{name}」を削除しました。")
 
     if current_user.is_administrator and target_user_id != current_user.user_id:
@@ -421,6 +426,7 @@ def account(user_id):
             item["password_hash"] = generate_password_hash(form.password.data)
 
         users_table.put_item(Item=item)
+        invalidate_user_cache(user_id)
         flash('ユーザーアカウントが更新されました')
         return redirect(url_for('main.clinic_list'))
 